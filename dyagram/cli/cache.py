@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+
+class DeviceCache:
+
+    """
+    On-disk cache of per-device facts that rarely change between runs (e.g. the netmiko device type), keyed by
+    inventory IP. One cache file per site: <site>/device_cache.json
+
+    Each value is stored with the time it was written so callers can apply a TTL:
+
+    {"10.10.20.177": {"device_type": {"value": "cisco_nxos", "updated": 1678901032.6}}}
+    """
+
+    def __init__(self, site, filename="device_cache.json"):
+        self.path = Path(f"{site}/{filename}")
+        self._lock = threading.Lock()
+        self._devices = self.load()
+        self.dirty = False
+
+    def load(self):
+        if not self.path.is_file():
+            return {}
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (ValueError, OSError):
+            # a corrupt cache only costs us a re-detect
+            return {}
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            with open(self.path, 'w') as file:
+                json.dump(self._devices, file)
+            self.dirty = False
+
+    def get(self, device, key, ttl=None):
+
+        """
+        :param device: inventory ip
+        :param key: name of the cached fact
+        :param ttl: seconds the value is considered fresh, None for no expiry
+        :return: cached value or None if missing or expired
+        """
+
+        with self._lock:
+            entry = self._devices.get(device, {}).get(key)
+        if not entry:
+            return None
+        if ttl is not None and time.time() - entry['updated'] > ttl:
+            return None
+        return entry['value']
+
+    def set(self, device, key, value):
+        with self._lock:
+            self._devices.setdefault(device, {})[key] = {"value": value, "updated": time.time()}
+            self.dirty = True
+
+    def invalidate(self, device, key=None):
+        with self._lock:
+            if device not in self._devices:
+                return
+            if key is None:
+                self._devices.pop(device)
+            else:
+                self._devices[device].pop(key, None)
+            self.dirty = True
@@ -0,0 +1,75 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+
+class JsonCodec:
+
+    """
+    stdlib json, always available
+    """
+
+    name = "json"
+    format = "json"
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+
+    """
+    orjson writes the same json as JsonCodec several times faster, so files written by either are read by both
+    """
+
+    name = "orjson"
+    format = "json"
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+# fastest first
+CODECS = {codec.name: codec for codec in ([OrjsonCodec] if orjson else []) + [JsonCodec]}
+
+
+def get_codec(name=None):
+
+    """
+    :param name: codec name, None for the fastest one installed
+    :return: codec class with dumps(obj) -> bytes and loads(bytes)
+    """
+
+    if name is None:
+        return next(iter(CODECS.values()))
+    if name not in CODECS:
+        raise ValueError(f"Codec {name} is not available. Installed: {', '.join(CODECS)}")
+    return CODECS[name]
+
+
+def codec_for_format(data_format):
+
+    """
+    Picks the fastest installed codec that reads a given on-disk format.
+
+    :param data_format: format recorded with the data, e.g. "json"
+    :return: codec class
+    """
+
+    for codec in CODECS.values():
+        if codec.format == data_format:
+            return codec
+    raise ValueError(f"No codec installed for {data_format} data")
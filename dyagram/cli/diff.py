@@ -0,0 +1,190 @@
+from colorama import Fore
+
+from dyagram.cli.hashing import device_hashes, SECTIONS
+from dyagram.cli.routes import VOLATILE_ROUTE_FIELDS
+
+
+def route_nexthop(route):
+    # different return for next hop for XR
+    return route.get('next_hop', route.get('nexthop_ip', ''))
+
+
+def route_key(route):
+    return route.get('vrf', ''), route.get('network', ''), route.get('mask', ''), route_nexthop(route)
+
+
+def neighbor_key(neighbor):
+    return neighbor.get('local_port', ''), neighbor.get('chassis_id', '')
+
+
+def format_route(route):
+    return f"Route {route['network']}/{route['mask']} {route_nexthop(route)}"
+
+
+def format_neighbor(neighbor):
+    return f"LLDP Neighbor {neighbor['hostname']} (Chassis ID: {neighbor['chassis_id']})"
+
+
+def new_device_diff():
+    return {"added": [], "removed": [], "changed": []}
+
+
+def diff_keyed(previous, current, key):
+
+    """
+    :param previous: list of dicts
+    :param current: list of dicts
+    :param key: function returning the identity of an item
+    :return: (added, removed, changed) where changed is a list of (old, new) pairs with the same key
+    """
+
+    previous_by_key = {key(i): i for i in previous}
+    current_by_key = {key(i): i for i in current}
+    added = [current_by_key[k] for k in current_by_key.keys() - previous_by_key.keys()]
+    removed = [previous_by_key[k] for k in previous_by_key.keys() - current_by_key.keys()]
+    changed = [(previous_by_key[k], current_by_key[k]) for k in previous_by_key.keys() & current_by_key.keys()
+               if previous_by_key[k] != current_by_key[k]]
+    return added, removed, changed
+
+
+def changed_fields(old, new, ignore=()):
+    return [field for field in sorted(old.keys() | new.keys())
+            if field not in ignore and old.get(field) != new.get(field)]
+
+
+def diff_routes(previous, current, device_diff):
+    added, removed, changed = diff_keyed(previous, current, route_key)
+    device_diff['added'].extend(format_route(i) for i in sorted(added, key=route_key))
+    device_diff['removed'].extend(format_route(i) for i in sorted(removed, key=route_key))
+    for old, new in sorted(changed, key=lambda pair: route_key(pair[1])):
+        for field in changed_fields(old, new, ignore=VOLATILE_ROUTE_FIELDS):
+            device_diff['changed'].append(f"{format_route(new)}: {field}: "
+                                          f"NEW VALUE: {new.get(field)}, OLD VALUE: {old.get(field)}")
+
+
+def diff_layer2(previous, current, device_diff):
+    added, removed, changed = diff_keyed(previous.get('neighbors', []), current.get('neighbors', []), neighbor_key)
+    device_diff['added'].extend(format_neighbor(i) for i in sorted(added, key=neighbor_key))
+    device_diff['removed'].extend(format_neighbor(i) for i in sorted(removed, key=neighbor_key))
+    for old, new in sorted(changed, key=lambda pair: neighbor_key(pair[1])):
+        for field in changed_fields(old, new):
+            device_diff['changed'].append(f"LLDP Neighbor {new['hostname']}: {field}: "
+                                          f"NEW VALUE: {new.get(field)}, OLD VALUE: {old.get(field)}")
+
+    previous_chassis_ids = set(previous.get('chassis_ids') or [])
+    current_chassis_ids = set(current.get('chassis_ids') or [])
+    device_diff['added'].extend(f"Chassis ID {i}" for i in sorted(current_chassis_ids - previous_chassis_ids))
+    device_diff['removed'].extend(f"Chassis ID {i}" for i in sorted(previous_chassis_ids - current_chassis_ids))
+
+
+def diff_dynamic_routing_neighbors(previous, current, device_diff):
+    for protocol in sorted(previous.keys() | current.keys()):
+        previous_neighbors = set(previous.get(protocol) or [])
+        current_neighbors = set(current.get(protocol) or [])
+        device_diff['added'].extend(f"{protocol.upper()} Neighbor {i}"
+                                    for i in sorted(current_neighbors - previous_neighbors))
+        device_diff['removed'].extend(f"{protocol.upper()} Neighbor {i}"
+                                      for i in sorted(previous_neighbors - current_neighbors))
+
+
+def diff_device(previous, current, sections=SECTIONS):
+
+    """
+    :param previous: device record from the saved state, None if the device is new
+    :param current: device record from this run, None if the device is gone
+    :param sections: sections to compare, the others are known to be unchanged
+    :return: {"added": [...], "removed": [...], "changed": [...]}
+    """
+
+    device_diff = new_device_diff()
+    if previous is None:
+        device_diff['added'].append(f"Device {current['hostname']}")
+        return device_diff
+    if current is None:
+        device_diff['removed'].append(f"Device {previous['hostname']}")
+        return device_diff
+
+    if previous['hostname'] != current['hostname']:
+        device_diff['changed'].append(f"Hostname: NEW VALUE: {current['hostname']}, "
+                                      f"OLD VALUE: {previous['hostname']}")
+    if 'layer2' in sections:
+        diff_layer2(previous.get('layer2') or {}, current.get('layer2') or {}, device_diff)
+    if 'routes' in sections:
+        diff_routes(previous.get('routes') or [], current.get('routes') or [], device_diff)
+    if 'dynamic_routing_neighbors' in sections:
+        diff_dynamic_routing_neighbors(previous.get('dynamic_routing_neighbors') or {},
+                                       current.get('dynamic_routing_neighbors') or {}, device_diff)
+    return device_diff
+
+
+def changed_sections(previous, current):
+
+    """
+    Uses the per-section content hashes to find which sections of a device need diffing.
+
+    :return: list of section names whose hashes differ
+    """
+
+    previous_hashes = device_hashes(previous)
+    current_hashes = device_hashes(current)
+    return [section for section in SECTIONS if previous_hashes.get(section) != current_hashes.get(section)]
+
+
+def get_state_diff(previous_state, current_state):
+
+    """
+    Keyed structural diff between two topologies in state.json shape. Devices are matched by inventory ip, routes by
+    (vrf, network, mask, nexthop) and lldp neighbors by (local_port, chassis_id), so each section is compared with set
+    operations instead of by list position and a device moving within the device list isn't reported as a change.
+    Devices and sections whose content hashes match are skipped.
+
+    :param previous_state: state on record
+    :param current_state: state from this run
+    :return: {inventory_ip: {"added": [...], "removed": [...], "changed": [...]}} for devices with changes,
+             None if nothing changed
+    """
+
+    previous_devices = {d['inventory_ip']: d for d in previous_state['devices']}
+    current_devices = {d['inventory_ip']: d for d in current_state['devices']}
+
+    device_diffs = {}
+    for ip in list(previous_devices) + [ip for ip in current_devices if ip not in previous_devices]:
+        previous, current = previous_devices.get(ip), current_devices.get(ip)
+        sections = SECTIONS
+        if previous and current:
+            sections = changed_sections(previous, current)
+            if not sections and previous['hostname'] == current['hostname']:
+                continue  # unchanged, skip without looking at the contents
+        device_diff = diff_device(previous, current, sections=sections)
+        if device_diff['added'] or device_diff['removed'] or device_diff['changed']:
+            device_diffs[ip] = device_diff
+
+    return device_diffs or None
+
+
+def print_device_diff(device_diff):
+    for i in device_diff.get('added', []):
+        print(Fore.LIGHTGREEN_EX + f"  + {i}" + Fore.RESET)
+    for i in device_diff.get('removed', []):
+        print(Fore.RED + f"  - {i}" + Fore.RESET)
+    for i in device_diff.get('changed', []):
+        print(Fore.YELLOW + f"  ~ {i}" + Fore.RESET)
+
+
+def print_diffs(diffs, hostnames=None, compact=False):
+
+    """
+    Prints get_state_diff output to the cli, added in green, removed in red and changed in yellow.
+
+    :param hostnames: {inventory_ip: hostname} shown next to the inventory ips
+    :param compact: no DIFFS title and no blank lines between devices (watch mode prints one device per event)
+    """
+
+    if not compact:
+        print("DIFFS\n")
+    for ip in diffs:
+        label = f"{ip} ({hostnames[ip]})" if hostnames and ip in hostnames else ip
+        print(label if compact else f"{label}\n")
+        print_device_diff(diffs[ip])
+        if not compact:
+            print("\n\n")
@@ -1,8 +1,11 @@
+import ipaddress
 import json
 import queue
 import re
 import os
+import socket
 import sys
+import threading
 import time
 import traceback
 from pathlib import Path
@@ -13,18 +16,32 @@ from netmiko.exceptions import SSHException
 from netmiko.ssh_autodetect import SSHDetect
 import requests
 import yaml
-from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
 from urllib3.exceptions import InsecureRequestWarning
 import logging
 from tqdm import tqdm
 import warnings
 from colorama import Fore
-from deepdiff import DeepDiff
 
 from dyagram.cli.sites import sites
-from dyagram.cli.export import DiagramExport
+from dyagram.cli.export import DiagramExport, EXPORT_FORMATS
+from dyagram.cli.graph import CLUSTER_METHODS
 from dyagram.cli.initialize import dyagramInitialize
+from dyagram.cli.session import SessionBroker
+from dyagram.cli.cache import DeviceCache
+from dyagram.cli.engine import ThreadedEngine
+from dyagram.cli.topology import Topology
+from dyagram.cli import diff as state_diff
+from dyagram.cli.hashing import add_hashes, state_fingerprint
+from dyagram.cli.routes import collect_routes, collect_routes_restconf
+from dyagram.cli.restconf import RestconfClient
+from dyagram.cli.transport import TransportCache
+from dyagram.cli.retry import Deadline, DeviceUnreachable, RetryPolicy
+from dyagram.cli.history import StateHistory
+from dyagram.cli.state import STATE_FORMATS, StateReader, migrate_state, state_exists, write_state
+from dyagram.cli.codec import CODECS
+from dyagram.cli.parsers import LLDP_NEIGHBORS_DETAIL, PARSERS
+from dyagram.cli.incremental import RECORD_FIELDS, change_signal, load_last_run, save_last_run
 
 warnings.simplefilter("ignore")
 
@@ -38,7 +55,13 @@ logging.basicConfig(format='%(asctime)s : %(message)s', handlers=handlers)
 
 class Dyagram:
 
-    def __init__(self, inventory_file=None, verbose=False):
+    DEVICE_TYPE_TTL = 60 * 60 * 24 * 7  # seconds a cached device type is trusted before autodetecting again
+    REFRESH_INTERVAL = 60 * 60 * 24  # incremental mode: seconds before a device is fully re-polled regardless
+
+    def __init__(self, inventory_file=None, verbose=False, crawl=False, crawl_depth=None, crawl_scope=None,
+                 site=None, stream_routes=False, restconf_pool_size=4, restconf_timeout=(5, 30), retry_policy=None,
+                 device_budget=120, deadline=None, incremental=False, refresh_interval=None, state_format="ndjson",
+                 codec=None):
 
         self.pbar = None
         self.pbar_update_int = None
@@ -49,13 +72,42 @@ class Dyagram:
 
         self.inventory_object = self.get_inv_yaml_obj()
         self._devices_to_query = Queue()
-        self._devices_queried = []
-        self.topology = {"devices": []}  # topology via cdp and lldp extracted data
+        self._devices_queried = set()
+        self.topology = Topology()  # topology via cdp and lldp extracted data
+        self.current_state = None  # topology in state.json shape, built once discovery finishes
+        self.saved_state = None  # devices of the state on record that changed, loaded by compare_states
+        self.changed_devices = set()  # inventory ips whose hostname or section hashes differ from the state on record
         self.username = None
         self.password = None
         self.changes_in_state = None
-        self.site = self.get_current_site()
+        self.state_diffs = {}  # get_state_diff output for the changed devices, set by compare_states
+        self.site = site or self.get_current_site()
+        self.diff_file = None  # when set, diffs are also written here as json
+        self.stream_routes = stream_routes  # parse route tables per vrf while reading instead of all at once
+        self.restconf_pool_size = restconf_pool_size  # connections kept open per device
+        self.restconf_timeout = restconf_timeout  # (connect, read) seconds
+        self.retry_policy = retry_policy or RetryPolicy()  # backoff for ssh logins, autodetect and hostname
+        self.device_budget = device_budget  # seconds a device may spend retrying before it's given up on
+        self.run_deadline = Deadline(deadline)  # no retries (or new devices) once this passes
+        self.state_format = state_format  # format a new state on record is saved in, see dyagram.cli.state
+        self.codec = codec  # serializer for the state on record, None for the fastest installed
         self.state_exists = self.does_state_exist()
+        self.device_cache = DeviceCache(self.site)
+        self.history = StateHistory(self.site)  # every run's state, see dyagram history
+        self.transports = TransportCache(self.device_cache)  # which transport answered each collector last run
+        self.incremental = incremental  # only fully re-poll devices whose change signal moved or are due
+        self.refresh_interval = self.REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        # inventory ip -> record and {"change_signal", "last_polled"} from the last run
+        self.last_run, self.last_polls = load_last_run(self.site) if incremental else ({}, {})
+        self.polls = {}  # same for this run, saved with the records in .last_run.json
+        self.inventory_device_types = {}  # device types pinned in inventory.yml, these skip autodetect
+        self.inventory_intervals = {}  # watch mode poll intervals set per device in inventory.yml
+        self.keep_sessions = False  # watch mode: leave sessions logged in between polls
+        self.crawl = crawl  # enqueue lldp neighbors as they are discovered
+        self.crawl_depth = crawl_depth  # max hops from a seed device, None for unlimited
+        self.crawl_scope = [ipaddress.ip_network(n, strict=False) for n in crawl_scope or []]
+        self._device_depth = {}  # every device ever enqueued this run -> hops from its seed
+        self._crawl_lock = threading.Lock()
         self.lldp_neighbor_template = {
             "hostname": "",
             "local_port": "",
@@ -74,6 +126,8 @@ class Dyagram:
                                       "banner_timeout": 200}
 
         self.devices_unable_to_connect = []
+        self.sessions = SessionBroker(self._connect_ssh, connect_restconf=self._connect_restconf, log=self.log,
+                                      budget=self.device_budget, deadline=self.run_deadline)
 
     def setup_logging(self):
         log = logging.getLogger("")
@@ -120,33 +174,170 @@ class Dyagram:
         :return:
         """
 
+        if self._try_restconf(device, 'lldp', self._discover_lldp_neighbors_by_restconf, model="openconfig-lldp"):
+            self.pbar.update(self.pbar_update_int)
+            return
+
         try:
-            self.log.info(f"DEVICE: {device} - RESTCONF : Discovering LLDP Neighbors - START")
-            resp = self._discover_lldp_neighbors_by_restconf(device)
-            if not resp:
-                raise Exception("Unable to get LLDP Neighbors via RESTCONF")
+            self.log.info(f"DEVICE: {device} - SSH : Discovering LLDP Neighbors - START")
+            self._discover_lldp_neighbors_by_ssh(device)
             self.pbar.update(self.pbar_update_int)
-            self.log.info(f"DEVICE: {device} - RESTCONF : Discovering LLDP Neighbors - SUCCESSFUL")
-        except SSHException:
-            print("CAUGHT SSH EXCEPT 02")
+            self.log.info(f"DEVICE: {device} - SSH : Discovering LLDP Neighbors - SUCCESSFUL")
         except:
-            try:
-            # try ssh
-                self.log.info(f"DEVICE: {device} - RESTCONF : Discovering LLDP Neighbors - FAILURE")
-                self.log.info(f"DEVICE: {device} - SSH : Discovering LLDP Neighbors - START")
-                self._discover_lldp_neighbors_by_ssh(device)
-                self.pbar.update(self.pbar_update_int)
-                self.log.info(f"DEVICE: {device} - SSH : Discovering LLDP Neighbors - SUCCESSFUL")
-            except:
-                tb = self.get_traceback()
-                self.log.info(f"DEVICE: {device} EXCEPTION01 THROWN IN __discover_lldp_neighbors : {tb}")
+            tb = self.get_traceback()
+            self.log.info(f"DEVICE: {device} EXCEPTION01 THROWN IN __discover_lldp_neighbors : {tb}")
+
+    def _try_restconf(self, device, collector, collect, model=None):
+
+        """
+        Runs a collector's RESTCONF half unless the transport cache already knows it won't work for this device, and
+        records the outcome so the next collector (and the next run) can go straight to SSH.
+
+        :param device:
+        :param collector: name the outcome is cached under ("lldp", "routes", "eigrp")
+        :param collect: callable taking the device, returns None when no YANG model answered
+        :param model: YANG model recorded on success, None if collect records its own
+        :return: whatever collect returned or None if SSH should be used
+        """
+
+        if not self.transports.use_restconf(device, collector):
+            self.log.info(f"DEVICE: {device} - RESTCONF : {collector} - SKIPPED, NOT SUPPORTED LAST RUN")
+            return None
+
+        try:
+            self.log.info(f"DEVICE: {device} - RESTCONF : {collector} - START")
+            result = collect(device)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self.log.info(f"DEVICE: {device} - RESTCONF : {collector} - FAILURE, NOT REACHABLE")
+            self.transports.restconf_unreachable(device)
+            return None
+        except:
+            tb = self.get_traceback()
+            self.log.info(f"DEVICE: {device} - RESTCONF : {collector} - FAILURE - {tb}")
+            result = None
 
-    def discover(self):
+        if result is None:
+            self.log.info(f"DEVICE: {device} - RESTCONF : {collector} - FAILURE")
+            self.transports.restconf_unsupported(device, collector)
+            return None
+
+        if model:
+            self.transports.restconf_answered(device, collector, model)
+        self.log.info(f"DEVICE: {device} - RESTCONF : {collector} - SUCCESSFUL")
+        return result
+
+    def discover_device(self, device):
+
+        """
+        Runs every collector for a device on one shared session (see SessionBroker) and logs out once they are done.
+
+        :param device:
+        :return:
+        """
+
+        try:
+            if self.run_deadline.expired():
+                self.log.info(f"DEVICE: {device} - RUN DEADLINE PASSED, NOT DISCOVERED")
+                self.devices_unable_to_connect.append(device)
+                return
+
+            signal = None
+            if self.incremental:
+                signal = self._change_signal(device)
+                if self._reuse_last_run(device, signal):
+                    return
+
+            self.__discover_lldp_neighbors(device)
+            self.discover_routes(device)
+            self.discover_dynamic_routing_neighbors(device)
+
+            if self.incremental and signal and device not in self.devices_unable_to_connect:
+                self.polls[device] = {"change_signal": signal, "last_polled": time.time()}
+        finally:
+            if not self.keep_sessions:
+                self.sessions.release(device)
+                self.log.info(f"DEVICE: {device} - SSH : SESSION RELEASED")
+
+    def _change_signal(self, device):
+
+        """
+        Incremental mode: the change signal is read over SSH, so it's only fetched for devices the transport cache
+        knows SSH is used for anyway. Logging in to a RESTCONF only device would mark it unreachable, without a signal
+        the device is simply polled.
+
+        :return: change signal or None
+        """
+
+        if not self.transports.uses_ssh(device):
+            self.log.info(f"DEVICE: {device} - INCREMENTAL : NO SSH COLLECTORS, POLLING WITHOUT CHANGE SIGNAL")
+            return None
+        try:
+            dev = self.sessions.get(device).ssh()
+            if not dev:
+                return None
+            return change_signal(dev)
+        except:
+            tb = self.get_traceback()
+            self.log.info(f"DEVICE: {device} - SSH : ERROR GETTING CHANGE SIGNAL - {tb}")
+            return None
+
+    def _reuse_last_run(self, device, signal):
+
+        """
+        Incremental mode: copies the device's record from the last run into the topology instead of collecting it
+        again, as long as its change signal hasn't moved and it isn't due for a full poll.
+
+        :param device:
+        :param signal: change signal fetched this run
+        :return: True if the last run's record was reused
+        """
+
+        record = self.last_run.get(device)
+        poll = self.last_polls.get(device)
+        if not signal or not record or not poll:
+            return False
+        if poll['change_signal'] != signal:
+            self.log.info(f"DEVICE: {device} - INCREMENTAL : CHANGE SIGNAL MOVED, POLLING")
+            return False
+        if time.time() - poll['last_polled'] > self.refresh_interval:
+            self.log.info(f"DEVICE: {device} - INCREMENTAL : DUE FOR REFRESH, POLLING")
+            return False
+
+        self.log.info(f"DEVICE: {device} - INCREMENTAL : UNCHANGED, REUSING LAST RUN")
+        self.topology.update(device, **{field: record[field] for field in RECORD_FIELDS if field in record})
+        self.polls[device] = poll
+        if self.crawl:
+            self._enqueue_neighbors(device, record['layer2'].get('neighbors', []),
+                                    self.device_cache.get(device, 'mgmt_addresses') or {})
+        self.pbar.update(self.pbar_update_int * 4)
+        return True
+
+    def next_device(self):
+
+        """
+        Pulls the next device off the queue and adds its empty record to the topology. Called by the discovery engines.
+
+        :return: device or None when the queue is empty
+        """
+
+        try:
+            device = self._devices_to_query.get_nowait()
+        except queue.Empty:
+            self.log.info(f"QUEUE EMPTY")
+            return None
+
+        self.log.info(f"Pulled device {device} from Queue")
+        self.topology.add_device(device)
+        self._devices_queried.add(device)
+        return device
+
+    def discover(self, engine=None):
 
         """
 
         Generates topology via cdp/lldp neighbors into a json object assigned to topology attribute
 
+        :param engine: ThreadedEngine to poll the devices with, defaults to one with 30 workers
         :return:
         """
         try:
@@ -156,75 +347,20 @@ class Dyagram:
                                                                                                          bar_format="{l_bar}{bar}|",
                                                                                                          disable=True)
 
-            executor = ThreadPoolExecutor(max_workers=30)
-
-            queue_empty = False
-            while not queue_empty:
-                try:
-                    device = self._devices_to_query.get_nowait()
-                    self.log.info(f"Pulled device {device} from Queue")
-                    self.topology['devices'].append({'hostname': "", 'inventory_ip': device, 'layer2': {}, 'routes': [], 'dynamic_routing_neighbors': {}})
-
-                    executor.submit(self.__discover_lldp_neighbors, device)
-                    self.log.info(f"DEVICE: {device} - Submitted for discover_lldp_neighbors")
-                    executor.submit(self.discover_routes, device)
-                    self.log.info(f"DEVICE: {device} - Submitted for discover_routes")
-                    executor.submit(self.discover_dynamic_routing_neighbors, device)
-                    self.log.info(f"DEVICE: {device} - Submitted for discover_dynamic_routing_neighbors")
-
-                    self._devices_queried.append(device)
-
-                except queue.Empty:
-                    self.log.info(f"QUEUE EMPTY")
-                    queue_empty = True
-                except:
-                    tb = self.get_traceback()
-                    self.log.info(f"EXCEPTION THROWN IN PULLING FROM QUEUE: {tb}")
-
-            executor.shutdown(wait=True)
+            if engine is None:
+                engine = ThreadedEngine(log=self.log)
+            self.log.info(f"DISCOVERING WITH {engine.max_workers} WORKERS")
+            engine.run(self)
+            self.finish_collection()
 
             if self.devices_unable_to_connect:
                 self.pbar.close()
-                for device in self.devices_unable_to_connect:
-                    print(f"Unable to connect to device: {device}. Please, resolve and then re-run Dyagram.")
+                self.print_devices_unable_to_connect()
                 sys.exit()
 
-            #sort topology by hostname to compare to previous
-
-            #self.topology['devices'] = sorted(self.topology['devices'], key=lambda d: d['hostname'])
-            self.sort_topology() # sort topology to easily compare
-
-            if not self.state_exists:
-                self.export_state()
-            else:
-                self.compare_states()
-
+            self.update_state()
             self.pbar.close()
-            if self.changes_in_state:
-                print("\nChanges in state!\n")
-                file = open(rf"{self.site}/state.json", 'r')
-                state = json.load(file)
-                try:
-                    diffs = self.get_state_diff(state, self.topology, log=self.log) # state is the state file on record and topology is current state
-                except Exception:
-                    tb = self.get_traceback()
-                    self.log.info(f"EXCEPTION THROWN GETTING DIFFS: {tb}")
-
-                # print to screen the diffs
-                print("DIFFS\n")
-                for ip in diffs:
-                    print(f"{ip}\n")
-                    for i in diffs[ip]['added']:
-                        print(Fore.LIGHTGREEN_EX + f"  + {i}" + Fore.RESET)
-                    for i in diffs[ip]['removed']:
-                        print(Fore.RED + f"  - {i}"+ Fore.RESET)
-                    for i in diffs[ip]['changed']:
-                        print(Fore.YELLOW + f"  ~ {i}"+ Fore.RESET)
-                    print("\n\n")
-            elif not self.changes_in_state and self.state_exists:
-                print("\nNo changes in state")
-            else:
-                print("\n")  # gives another space after progress bar in CLI
+            self.print_changes()
         except SSHException:
             print("CAUGHT SSH EXCEPT 01")
         except:
@@ -236,32 +372,90 @@ class Dyagram:
                 self.log.info(f"DEVICE: UNKNOWN - MAIN EXCEPTION : {tb}")
 
 
-    def does_state_exist(self):
-        path = Path(f"{self.site}/state.json")
-        return path.is_file()
+    def finish_collection(self):
+        self.sessions.close_all()
+        self.device_cache.save()
 
-    def export_state(self):
+    def print_devices_unable_to_connect(self):
+        for device in self.devices_unable_to_connect:
+            print(f"Unable to connect to device: {device}. Please, resolve and then re-run Dyagram.")
 
-        file = open(rf"{self.site}/state.json", 'w')
-        json.dump(self.topology, file)
-        file.close()
+    def update_state(self):
 
+        """
+        Sorts the collected topology and either saves it as the site's first state or compares it to the saved state.
 
-    def compare_states(self):
+        :return:
+        """
 
-        file = open(rf"{self.site}/state.json", 'r')
-        state = json.load(file)
-        current_state = self.topology
+        #sort topology by hostname to compare to previous
+        self.current_state = self.topology.to_dict()
+        self.sort_topology() # sort topology to easily compare
+        add_hashes(self.current_state)  # per-device section hashes, saved with the state
+        if self.incremental:
+            save_last_run(self.site, self.current_state, self.polls, codec=self.codec)
+        self.history.record(self.current_state)
 
-        if state == current_state:
-            self.changes_in_state = False
+        if not self.state_exists:
+            self.export_state()
+        else:
+            self.compare_states()
+
+    def print_changes(self):
+        if self.changes_in_state:
+            print("\nChanges in state!\n")
+            diffs = self.state_diffs
+            if self.diff_file:
+                with open(self.diff_file, 'w') as file:
+                    json.dump(diffs, file)
+
+            # print to screen the diffs
+            state_diff.print_diffs(diffs)
+        elif not self.changes_in_state and self.state_exists:
+            if self.diff_file:
+                with open(self.diff_file, 'w') as file:
+                    json.dump({}, file)
+            print("\nNo changes in state")
         else:
+            print("\n")  # gives another space after progress bar in CLI
+
+    def does_state_exist(self):
+        return state_exists(self.site)
+
+    def export_state(self):
+        write_state(self.site, self.current_state, state_format=self.state_format, codec=self.codec)
+
+    def compare_states(self):
+
+        # compare hostnames and section hashes per device instead of the full topology, with state.ndjson that only
+        # reads the index and the records of devices that changed
+        with StateReader(self.site) as reader:
+            saved = reader.fingerprint()
+            current = state_fingerprint(self.current_state)
+            self.changed_devices = {ip for ip in saved.keys() | current.keys() if saved.get(ip) != current.get(ip)}
+            self.saved_state = {"devices": list(reader.devices(self.changed_devices))}
+
+        # only devices whose fingerprint changed were read from the state on record, diff the same devices
+        current_state = {"devices": [d for d in self.current_state['devices']
+                                     if d['inventory_ip'] in self.changed_devices]}
+        self.state_diffs = {}
+        if not self.changed_devices:
+            self.changes_in_state = False
+            return
+        try:
+            self.state_diffs = self.get_state_diff(self.saved_state, current_state, log=self.log) or {}
+        except Exception:
+            tb = self.get_traceback()
+            self.log.info(f"EXCEPTION THROWN GETTING DIFFS: {tb}")
             self.changes_in_state = True
-        file.close()
+            return
+
+        # a section hash can differ with nothing to report (e.g. a field the diff ignores), that's no change
+        self.changes_in_state = bool(self.state_diffs)
 
     def sort_topology(self):
-        self.topology['devices'] = sorted(self.topology['devices'], key=lambda e: e['hostname'])
-        for d in self.topology['devices']:
+        self.current_state['devices'] = sorted(self.current_state['devices'], key=lambda e: e['hostname'])
+        for d in self.current_state['devices']:
             for protocol in d['dynamic_routing_neighbors']:
                 d['dynamic_routing_neighbors'][protocol] = sorted(d['dynamic_routing_neighbors'][protocol])
 
@@ -274,262 +468,115 @@ class Dyagram:
 
     def discover_routes(self, device):
 
+        if self._try_restconf(device, 'routes', self.discover_routes_restconf) is not None:
+            self.pbar.update(self.pbar_update_int)
+            return True
+
         try:
-            self.log.info(f"DEVICE: {device} - RESTCONF : Discovering routes - START")
-            routes = self.discover_routes_restconf(device)
-            if not routes:
-                raise Exception("Enable to connect via Restconf")
+            self.log.info(f"DEVICE: {device} - SSH : Discovering routes - START")
+            self.discover_routes_ssh(device)
             self.pbar.update(self.pbar_update_int)
-            self.log.info(f"DEVICE: {device} - RESTCONF : Discovering routes - SUCCESSFUL")
-        except SSHException:
-            print("CAUGHT SSH EXCEPT 04")
+            self.log.info(f"DEVICE: {device} - SSH : Discovering routes - SUCCESSFUL")
         except:
-            try:
-                self.log.info(f"DEVICE: {device} - RESTCONF : Discovering routes - FAILURE")
-                self.log.info(f"DEVICE: {device} - SSH : Discovering routes - START")
-                self.discover_routes_ssh(device)
-                self.pbar.update(self.pbar_update_int)
-                self.log.info(f"DEVICE: {device} - SSH : Discovering routes - SUCCESSFUL")
-            except:
-                tb = self.get_traceback()
-                self.log.info(f"DEVICE: {device} EXCEPTION01 THROWN IN discover_routes : {tb}")
+            tb = self.get_traceback()
+            self.log.info(f"DEVICE: {device} EXCEPTION01 THROWN IN discover_routes : {tb}")
 
         return True
 
     def discover_routes_restconf(self, device):
-        return None
+
+        """
+        Pulls the route table over RESTCONF (OpenConfig AFT, then ietf-routing) in one fetch
+
+        :param device:
+        :return: list of routes in the same shape as discover_routes_ssh or None if no YANG model answered
+        """
+
+        session = self.sessions.get(device).restconf()
+        model, routes = collect_routes_restconf(session, model=self.transports.restconf_model(device, 'routes'))
+        if routes is None:
+            return None
+        self.transports.restconf_answered(device, 'routes', model)
+        self.log.info(f"DEVICE: {device} - RESTCONF : COLLECTED {len(routes)} ROUTES")
+        self.topology.update(device, routes=routes)
+        return routes
 
     def discover_routes_ssh(self, device):
 
         # CONN_SET = False
         try:
-            self.log.info(f"DEVICE: {device} - SSH : GETTING DEVICE TYPE : discover_routes_ssh")
-            os = self.get_device_type(device)
-            self.log.info(f"DEVICE: {device} - SSH : GOT DEVICE TYPE : discover_routes_ssh")
-
-            netmiko_args = {"device_type": os,
-                            "host": device,
-                            "username": self.username,
-                            "password": self.password,
-                            "secret": self.password,
-                            "banner_timeout": 200
-                            }
-
-            self.log.info(f"DEVICE: {device} - SSH : CREATING NETMIKO OBJ : discover_routes_ssh")
-            tries = 0
-            while tries < 5: #FIXME: THIS SHOULD TRY 10 TIMES THEN RETURN UNABLE TO RUN DYAGRAM
-                try:
-                    dev = ConnectHandler(**netmiko_args)
-                    dev.enable()
-                    tries = 5  # break
-                except:
-                    self.log.info(
-                        f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ, TRY AGAIN: discover_routes_ssh")
-                    tb = self.get_traceback()
-                    self.log.info(
-                        f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ - TB: {tb}")
-                    time.sleep(1)
-                    tries += 1
-                    if tries == 5:
-                        self.devices_unable_to_connect.append(device)
-                        self.log.info(f"DEVICE: {device} Unable to connect. Please, resolve and re-run Dyagram Discover.") #  CREATE FUNCTION THAT STOPS PROGRAM AND PRINTS SCREEN
-
-
-            self.log.info(f"DEVICE: {device} - SSH : CREATED NETMIKO OBJ : discover_routes_ssh")
-
-
-            routes_w_vrf = dev.send_command("show ip route vrf all", use_textfsm=True)
-            routes_wo_vrf = dev.send_command("show ip route", use_textfsm=True)
-            self.log.info(f"{device} - routes_W_vrf: {routes_w_vrf}")
-            self.log.info(f"{device} - routes_W)_vrf: {routes_wo_vrf}")
-            for route in routes_w_vrf:
-                if 'uptime' in route.keys():
-                    route.pop('uptime')
-            for route in routes_wo_vrf:
-                if 'uptime' in route.keys():
-                    route.pop('uptime')
-            combined_routes = routes_wo_vrf + routes_w_vrf
-            routes = [i for n, i in enumerate(combined_routes) if i not in combined_routes[n + 1:]]
-
-            dev.disconnect()
-            for i in self.topology['devices']:
-                if i['inventory_ip'] == device:
-                    i['routes'] = routes
-                    break
+            dev = self.sessions.get(device).ssh()
+            if not dev:
+                raise Exception("Unable to connect via SSH")
+
+            routes = collect_routes(dev, stream=self.stream_routes)
+            self.log.info(f"{device} - COLLECTED {len(routes)} ROUTES")
+
+            self.topology.update(device, routes=routes)
         except:
             tb = self.get_traceback()
             self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN discover_routes_ssh: {tb}")
 
     @staticmethod
     def get_state_diff(previous_state, current_state, log=None):
-        try:
+        if log:
             log.info(f"STARTING GET_STATE_DIFF")
-            device_diffs = {}
+        device_diffs = state_diff.get_state_diff(previous_state, current_state)
+        if log:
+            log.info(f"END OF GET_STATE_DIFF")
+        return device_diffs
 
-            elem_changed = {
-                "routes": []}  # this keeps up with "changes" when converting to removed/add for routes,
-                               # this is due to deeper dictionary items
-            diff_resp = DeepDiff(previous_state, current_state, ignore_order=True)
+    def get_device_type(self, device):
 
-            if not diff_resp:
-                return None
+        """
+        Returns the netmiko device type for a device. Checks inventory.yml first, then the site's device cache and
+        only falls back to SSHDetect autodetect when neither has it.
 
-            diff_type = None
-            for k in diff_resp.keys():
-                if "added" in k:
-                    diff_type = "added"
-                    s = current_state
-                elif "removed" in k:
-                    diff_type = "removed"
-                    s = previous_state
-                elif "changed" in k:
-                    s = current_state
-                    diff_type = "changed"
-
-                for diff in diff_resp[k]:
-
-                    resp = re.search("root\['devices'\]\[(\d+)\]\[([^\]]*)\]", diff)
-                    device_elem = int(resp.group(1))
-                    category = resp.group(2).replace("'", "").replace('"', '')
-                    if s['devices'][device_elem]['inventory_ip'] not in device_diffs.keys():
-                        device_diffs[s['devices'][device_elem]['inventory_ip']] = {"added": [], "removed": [],
-                                                                                   "changed": []}
-
-
-                    if category == "dynamic_routing_neighbors":
-                        if 'eigrp' in diff:
-                            routing_protocol = "EIGRP"
-                        elif 'ospf' in diff:
-                            routing_protocol = "OSPF"
-                        elif 'bgp' in diff:
-                            routing_protocol = "BGP"
-
-                        if diff_type != "changed":
-                            device_diffs[s['devices'][device_elem]['inventory_ip']][diff_type].append(
-                                f"{routing_protocol} Neighbor {diff_resp[k][diff]}")
-                        else:
-                            device_diffs[s['devices'][device_elem]['inventory_ip']]["removed"].append(
-                                f"{routing_protocol} Neighbor {diff_resp[k][diff]['old_value']}")
-                            device_diffs[s['devices'][device_elem]['inventory_ip']]["added"].append(
-                                f"{routing_protocol} Neighbor {diff_resp[k][diff]['new_value']}")
-
-                    elif category == "layer2":
-                        if diff_type != "changed":
-                            device_diffs[s['devices'][device_elem]['inventory_ip']][diff_type].append(
-                                f"LLDP Neighbor {diff_resp[k][diff]['hostname']} (Chassis ID: {diff_resp[k][diff]['chassis_id']})")
-
-                        else:
-                            resp = re.search("\['neighbors'\]\[(\d+)\]\['(.*)'\]", diff)
-                            neigh_elem = int(resp.group(1))
-                            neigh_property = resp.group(2)
-                            device_diffs[s['devices'][device_elem]['inventory_ip']][diff_type].append(
-                                f"LLDP Neighbor {s['devices'][device_elem][category]['neighbors'][neigh_elem]['hostname']}: {neigh_property}: "
-                                f"NEW VALUE: {diff_resp[k][diff]['new_value']}, OLD VALUE: {diff_resp[k][diff]['old_value']}")
-                    elif category == "routes":
-
-                        if diff_type != "changed":
-
-                            try:
-                                device_diffs[s['devices'][device_elem]['inventory_ip']][diff_type].append(
-
-                                    f"Route {diff_resp[k][diff]['network']}/{diff_resp[k][diff]['mask']} {diff_resp[k][diff]['next_hop']}")
-                            except KeyError:
-                                # different return for next hop for XR
-                                device_diffs[s['devices'][device_elem]['inventory_ip']][diff_type].append(
-
-                                    f"Route {diff_resp[k][diff]['network']}/{diff_resp[k][diff]['mask']} {diff_resp[k][diff]['nexthop_ip']}")
-                        else:
-
-                            resp = re.search("\['routes'\]\[(\d+)\]\['(.*)'\]", diff)
-
-                            route_elem = int(resp.group(1))
-
-                            if route_elem not in elem_changed['routes']:
-                                elem_changed['routes'].append(route_elem)
-
-                                try:
-
-                                    device_diffs[s['devices'][device_elem]['inventory_ip']]["removed"].append(
-                                        f"Route {s['devices'][device_elem][category][route_elem]['network']}/"
-            
-                                        f"{previous_state['devices'][device_elem][category][route_elem]['mask']} "
-            
-                                        f"{previous_state['devices'][device_elem][category][route_elem]['next_hop']}")
-
-                                    device_diffs[s['devices'][device_elem]['inventory_ip']]["added"].append(
-
-                                        f"Route {s['devices'][device_elem][category][route_elem]['network']}/"
-            
-                                        f"{current_state['devices'][device_elem][category][route_elem]['mask']} "
-            
-                                        f"{current_state['devices'][device_elem][category][route_elem]['next_hop']}")
-                                except KeyError:
-                                    # different return for next hop for XR
-                                    device_diffs[s['devices'][device_elem]['inventory_ip']]["removed"].append(
-                                        f"Route {s['devices'][device_elem][category][route_elem]['network']}/"
-    
-                                        f"{previous_state['devices'][device_elem][category][route_elem]['mask']} "
-    
-                                        f"{previous_state['devices'][device_elem][category][route_elem]['nexthop_ip']}")
-
-                                    device_diffs[s['devices'][device_elem]['inventory_ip']]["added"].append(
-
-                                        f"Route {s['devices'][device_elem][category][route_elem]['network']}/"
-    
-                                        f"{current_state['devices'][device_elem][category][route_elem]['mask']} "
-    
-                                        f"{current_state['devices'][device_elem][category][route_elem]['nexthop_ip']}")
+        :param device:
+        :return:
+        """
 
-            log.info(f"END OF GET_STATE_DIFF")
-            return device_diffs
-        except Exception as e:
+        if device in self.inventory_device_types:
+            return self.inventory_device_types[device]
 
-            raise e
+        cached = self.device_cache.get(device, 'device_type', ttl=self.DEVICE_TYPE_TTL)
+        if cached:
+            self.log.info(f"DEVICE: {device} CACHED DEVICE TYPE {cached}")
+            return cached
 
-    def get_device_type(self, device):
+        best_match = self._autodetect_device_type(device)
+        if best_match:
+            self.device_cache.set(device, 'device_type', best_match)
+        return best_match
 
-        try:
+    def _autodetect_device_type(self, device):
 
-            autodetect_netmiko_args = {"device_type": "autodetect",
-                                       "host": device,
-                                       "username": self.username,
-                                       "password": self.password
-                                       }
-            autodetect_tries = 0
-            autodetect_returned_none = False
-            while autodetect_tries < 5:
-                try:
-                    guesser = SSHDetect(**autodetect_netmiko_args)
-                    best_match = guesser.autodetect()
-                    self.log.info(f"DEVICE: {device} BEST MATCH {best_match}")
-
-
-                    if best_match == None:
-                        autodetect_returned_none = True
-                        raise Exception("Unable to autodetect OS. Trying again..")
-                    return best_match
-
-
-                except NetmikoAuthenticationException:
-                    # print(f"AUTHENTICATION ERROR FOR DEVICE: {device}")
-                    return None
-
-                except:
-                    if autodetect_tries > 5 and autodetect_returned_none:
-                        raise Exception("Unable to autodetect OS. Tries exhausted.")
-                    elif autodetect_tries > 5:
-                        tb = self.get_traceback()
-                        self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN GET_DEVICE_TYPE: {tb}")
-                        raise Exception("Unable to access device")
-                    autodetect_tries += 1
-                    if autodetect_tries == 5:
-                        self.devices_unable_to_connect.append(device)
-                        self.log.info(f"DEVICE: {device} Unable to connect. Please, resolve and re-run Dyagram Discover.") #  CREATE FUNCTION THAT STOPS PROGRAM AND PRINTS SCREEN
-
-                    time.sleep(5)
-        except:
-            tb = self.get_traceback()
-            self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN get_device_type: {tb}")
+        """
+        :return: netmiko device type
+        :raises DeviceUnreachable: when the retry policy gives up on the device
+        :raises NetmikoAuthenticationException: when the credentials are rejected, logging in would fail the same way
+        """
+
+        autodetect_netmiko_args = {"device_type": "autodetect",
+                                   "host": device,
+                                   "username": self.username,
+                                   "password": self.password
+                                   }
+
+        def autodetect():
+            guesser = SSHDetect(**autodetect_netmiko_args)
+            best_match = guesser.autodetect()
+            self.log.info(f"DEVICE: {device} BEST MATCH {best_match}")
+            if best_match is None:
+                raise Exception("Unable to autodetect OS. Trying again..")
+            return best_match
+
+        def on_retry(attempt, error):
+            self.log.info(f"DEVICE: {device} AUTODETECT ATTEMPT {attempt + 1} FAILED: {error}")
+
+        return self.retry_policy.call(autodetect, deadline=self.sessions.get(device).deadline,
+                                      cancelled=lambda: self.sessions.get(device).unreachable,
+                                      give_up_on=(NetmikoAuthenticationException,), on_retry=on_retry)
 
 
 
@@ -563,75 +610,52 @@ class Dyagram:
 
     def discover_eigrp_neighbors(self, device):
 
+        if self._try_restconf(device, 'eigrp', self.discover_eigrp_neighbors_restconf,
+                              model="Cisco-IOS-XE-eigrp-oper") is not None:
+            return
+
         try:
-            self.log.info(f"DEVICE: {device} - RESTCONF : Discovering EIGRP Neighbors - START")
-            #time.sleep(5)  # FIXME: IF I DON'T PUT THIS HERE THERE IS AN EXCEPTION THROWN THAT I CAN'T CATCH
-            discovered = self.discover_eigrp_neighbors_restconf()
-
-            if not discovered:
-                self.log.info(f"DEVICE: {device} - RESTCONF : Discovering EIGRP Neighbors - FAIL")
-                try:
-                    self.log.info(f"DEVICE: {device} - SSH : Discovering EIGRP Neighbors - START")
-                    self.discover_eigrp_neighbors_ssh(device)
-                    self.log.info(f"DEVICE: {device} - SSH : Discovering EIGRP Neighbors - SUCCESS")
-                except:
-                    tb = self.get_traceback()
-                    self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN DISCOVERING EIGRP NEIGHBORS: {tb}")
-            else:
-                self.log.info(f"DEVICE: {device} - RESTCONF : Discovering EIGRP Neighbors - SUCCESS")
+            self.log.info(f"DEVICE: {device} - SSH : Discovering EIGRP Neighbors - START")
+            self.discover_eigrp_neighbors_ssh(device)
+            self.log.info(f"DEVICE: {device} - SSH : Discovering EIGRP Neighbors - SUCCESS")
         except:
             tb = self.get_traceback()
-            self.log.info(f"DEVICE: {device} - SSH : ERROR discover_eigrp_neighbors - {tb}")
+            self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN DISCOVERING EIGRP NEIGHBORS: {tb}")
 
+    def discover_eigrp_neighbors_restconf(self, device):
 
-    def discover_eigrp_neighbors_restconf(self):
-        return None
-
-    def discover_eigrp_neighbors_ssh(self, device):
+        """
+        Gets EIGRP neighbor ips from Cisco-IOS-XE-eigrp-oper
 
-        try:
-            self.log.info("GETTING DEVICE TYPE IN EIGRP NEIGHBORS SSH")
-            os = self.get_device_type(device)
-            self.log.info("GOT DEVICE TYPE  FROM get_device_type func IN EIGRP NEIGHBORS SSH_top")
-            if os:
-                self.log.info("GOT DEVICE TYPE  FROM get_device_type func IN EIGRP NEIGHBORS SSH")
-                nm_args = self.netmiko_args_template.copy()
-                nm_args['host'] = device
-                nm_args['device_type'] = os
+        :param device:
+        :return: list of neighbor ips or None if the model isn't supported
+        """
 
+        session = self.sessions.get(device).restconf()
+        resp = session.get("Cisco-IOS-XE-eigrp-oper:eigrp-oper-data")
+        if resp.status_code != 200:
+            return None
 
-            else:
-                os = "cisco_ios"
-                nm_args = self.netmiko_args_template.copy()
-                nm_args['host'] = device
-                nm_args['device_type'] = os
-                #raise Exception("Unable to determine OS.")
-                self.log.info("GOT DEVICE TYPE IN EIGRP NEIGHBORS SSH")
-
-            self.log.info("CREATING NETMIKO OBJ : discover_eigrp_neighbors_ssh")
-
-
-            tries = 0
-            while tries < 5:  # FIXME: THIS SHOULD TRY 10 TIMES THEN RETURN UNABLE TO RUN DYAGRAM
-                try:
-                    dev = ConnectHandler(**nm_args)
-                    dev.enable()
-                    tries = 5  # break
-                except:
-                    tb = self.get_traceback()
-                    self.log.info(
-                        f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ, TRY AGAIN: discover_routes_ssh")
-                    self.log.info(
-                        f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ, TRY AGAIN: discover_routes_ssh : TB = {tb}")
+        neighbor_ips = []
+        data = resp.json().get("Cisco-IOS-XE-eigrp-oper:eigrp-oper-data", {})
+        for instance in data.get("eigrp-instance", []):
+            for intf in instance.get("eigrp-interface", []):
+                for neighbor in intf.get("eigrp-nbr", []):
+                    if neighbor.get("nbr-address") and neighbor["nbr-address"] not in neighbor_ips:
+                        neighbor_ips.append(neighbor["nbr-address"])
 
-                    time.sleep(1)
-                    tries += 1
-                    if tries == 5:
-                        self.devices_unable_to_connect.append(device)
-                        self.log.info(f"DEVICE: {device} Unable to connect. Please, resolve and re-run Dyagram Discover.") #  CREATE FUNCTION THAT STOPS PROGRAM AND PRINTS SCREEN
+        self.log.info(f"{device}: EIGRP NEIGHBOR IPs - {neighbor_ips}")
+        self.topology.set_routing_neighbors(device, 'eigrp', neighbor_ips)
+        return neighbor_ips
 
-            self.log.info(f"DEVICE: {device} CREATED NETMIKO OBJ : discover_eigrp_neighbors_ssh")
+    def discover_eigrp_neighbors_ssh(self, device):
 
+        try:
+            dev = self.sessions.get(device).ssh()
+            if not dev:
+                raise Exception("Unable to connect via SSH")
+            os = dev.device_type
+            self.log.info(f"DEVICE: {device} GOT SHARED SSH SESSION : discover_eigrp_neighbors_ssh")
 
             if os in ['cisco_ios', 'cisco_nxos']:
                 eigrp_output = dev.send_command("show ip eigrp neighbors vrf all") #textfsm not currently supported for this command
@@ -639,19 +663,13 @@ class Dyagram:
                 eigrp_output = dev.send_command(
                     "show eigrp neighbors")  # textfsm not currently supported for this command
             else:
-
-                dev.disconnect()
                 raise Exception(f"OS {os} Not supported")
 
             self.log.info(f"{device} - EIGRP_OUTPUT: {eigrp_output}")
             if isinstance(eigrp_output, str):
                 neighbor_ips = re.findall('\d+\.\d+\.\d+\.\d+', eigrp_output)
                 self.log.info(f"{device}: EIGRP NEIGHBOR IPs - {neighbor_ips}")
-            for i in self.topology['devices']:
-                if i['inventory_ip'] == device:
-                    i['dynamic_routing_neighbors']['eigrp'] = neighbor_ips
-                    break
-            dev.disconnect()
+            self.topology.set_routing_neighbors(device, 'eigrp', neighbor_ips)
         except:
             self.log.info("HIT EXCEPT discover_eigrp_neighbors_ssh")
             tb = self.get_traceback()
@@ -689,93 +707,145 @@ class Dyagram:
                 print(f"YAML ERROR: {e}")
 
     def _load_inventory(self):
-        self.pbar_update_int = 100 / len(self.inventory_object[self.site]) / 4 # CAN"T BE ODD SO GO UP ONE IF SO, 3 is the number of jobs each device hits CURRENTLY
-        for ip in self.inventory_object[self.site]:
+
+        """
+        Site entries in inventory.yml are either a plain ip or a mapping that pins the netmiko device type:
+
+        site1:
+          - 10.10.20.174
+          - host: 10.10.20.177
+            device_type: cisco_nxos
+            interval: 60  # optional, seconds between polls in watch mode
+
+        A site can also be given as seeds only, which turns on crawl mode for that site:
+
+        site2:
+          seeds:
+            - 10.10.20.174
+          crawl:
+            depth: 3
+            scope:
+              - 10.10.20.0/24
+        """
+
+        entries = self.inventory_object[self.site]
+        if isinstance(entries, dict):
+            crawl = entries.get('crawl') or {}
+            self.crawl = True
+            if self.crawl_depth is None:
+                self.crawl_depth = crawl.get('depth')
+            if not self.crawl_scope:
+                self.crawl_scope = [ipaddress.ip_network(n, strict=False) for n in crawl.get('scope', [])]
+            entries = entries['seeds']
+
+        self.pbar_update_int = 100 / len(entries) / 4 # CAN"T BE ODD SO GO UP ONE IF SO, 3 is the number of jobs each device hits CURRENTLY
+        for entry in entries:
+            if isinstance(entry, dict):
+                ip = entry['host']
+                if entry.get('device_type'):
+                    self.inventory_device_types[ip] = entry['device_type']
+                if entry.get('interval'):
+                    self.inventory_intervals[ip] = entry['interval']
+            else:
+                ip = entry
+            self._device_depth[ip] = 0
             self._devices_to_query.put(ip)
 
+    def _in_crawl_scope(self, ip):
+        if not self.crawl_scope:
+            return True
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.crawl_scope)
 
-    def _discover_lldp_neighbors_by_restconf(self, device):
+    def _resolve_neighbor(self, hostname, mgmt_address=None):
+
+        """
+        Finds an address to reach an lldp neighbor on, preferring the management address it advertised.
+
+        :return: ip or None
+        """
+
+        if mgmt_address:
+            return mgmt_address
+        if not hostname:
+            return None
         try:
-            lldp_neighbors = self._get_lldp_neighbors_restconf(device)
+            return socket.gethostbyname(hostname)
+        except (socket.gaierror, UnicodeError):
+            self.log.info(f"CRAWL : UNABLE TO RESOLVE LLDP NEIGHBOR {hostname}")
+            return None
 
-            for i in self.topology['devices']:
-                if i['inventory_ip'] == device:
-                    i['hostname'] = lldp_neighbors['hostname']
-                    lldp_neighbors.pop('hostname')
-                    i['layer2'] = lldp_neighbors
-                    break
+    def _enqueue_neighbors(self, device, neighbors, mgmt_addresses):
 
-            self._devices_queried.append(device)
-        except:
-            return False
+        """
+        Crawl mode: puts lldp neighbors of a device on the queue while the run is going. Neighbors already queried or
+        enqueued, deeper than crawl_depth or outside crawl_scope are skipped.
 
-        return True
+        :param device: device the neighbors were discovered on
+        :param neighbors: layer2 neighbor dicts
+        :param mgmt_addresses: neighbor hostname -> advertised management address
+        :return:
+        """
 
-    def _discover_lldp_neighbors_by_ssh(self, device):
+        if self.incremental:
+            self.device_cache.set(device, 'mgmt_addresses', mgmt_addresses)  # crawl again from a reused record
+
+        depth = self._device_depth.get(device, 0) + 1
+        if self.crawl_depth is not None and depth > self.crawl_depth:
+            return
+
+        for neighbor in neighbors:
+            if self.topology.get_by_chassis_id(neighbor['chassis_id']) or \
+                    self.topology.get_by_hostname(neighbor['hostname']):
+                continue  # already discovered under another address
+            ip = self._resolve_neighbor(neighbor['hostname'], mgmt_addresses.get(neighbor['hostname']))
+            if not ip or not self._in_crawl_scope(ip):
+                continue
+            with self._crawl_lock:
+                if ip in self._devices_queried or ip in self._device_depth:
+                    continue
+                self._device_depth[ip] = depth
+                self._devices_to_query.put(ip)
+            if self.pbar is not None:
+                self.pbar.total += self.pbar_update_int * 4
+                self.pbar.refresh()
+            self.log.info(f"DEVICE: {device} - CRAWL : ENQUEUED LLDP NEIGHBOR {neighbor['hostname']} ({ip}) AT DEPTH {depth}")
 
-        try:
-            self.log.info(f"DEVICE: {device} - SSH : GETTING DEVICE TYPE : _discover_lldp_neighbors_by_ssh")
-            os = self.get_device_type(device)
-            self.log.info(f"DEVICE: {device} - SSH : GOT DEVICE TYPE : _discover_lldp_neighbors_by_ssh")
-            netmiko_args = {"device_type": os,
-                            "host": device,
-                            "username": self.username,
-                            "password": self.password,
-                            "secret": self.password,
-                            }
-
-            self.log.info(f"DEVICE: {device} - SSH : CREATING NETMIKO OBJ : _discover_lldp_neighbors_by_ssh")
-
-            tries = 0
-            while tries < 5: # FIXME: THIS SHOULD TRY 10 TIMES THEN RETURN UNABLE TO RUN DYAGRAM
-                try:
-                    dev = ConnectHandler(**netmiko_args)
-                    tries = 5 # break
-                except:
-                    self.log.info(
-                        f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ, TRY AGAIN: _discover_lldp_neighbors_by_ssh")
-                    tb = self.get_traceback()
-                    self.log.info(
-                        f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ, TRY AGAIN: discover_routes_ssh : TB = {tb}")
 
-                    time.sleep(1)
-                    tries += 1
-                    if tries == 5:
-                        self.devices_unable_to_connect.append(device)
-                        self.log.info(f"DEVICE: {device} Unable to connect. Please, resolve and re-run Dyagram Discover.") #  CREATE FUNCTION THAT STOPS PROGRAM AND PRINTS SCREEN
+    def _discover_lldp_neighbors_by_restconf(self, device):
+        lldp_neighbors = self._get_lldp_neighbors_restconf(device)
+        mgmt_addresses = lldp_neighbors.pop('mgmt_addresses', {})
 
+        hostname = lldp_neighbors.pop('hostname')
+        self.topology.update(device, hostname=hostname, layer2=lldp_neighbors)
 
+        self._devices_queried.add(device)
+        if self.crawl:
+            self._enqueue_neighbors(device, lldp_neighbors['neighbors'], mgmt_addresses)
 
-            self.log.info(f"DEVICE: {device} - SSH : CREATED NETMIKO OBJ : _discover_lldp_neighbors_by_ssh")
-            self.log.info(f"DEVICE: {device} - SSH : SETTING ENABLE")
+        return True
 
-            dev.enable()
-            self.log.info(f"DEVICE: {device} - SSH : ENABLE SET")
+    def _discover_lldp_neighbors_by_ssh(self, device):
 
-            try:
-                lldp_nei_json = self._get_lldp_neighbors_ssh_textfsm(dev)
-                self.log.info(f"{device} - lldp_nei_json: {lldp_nei_json}")
-                if type(lldp_nei_json) == str:
-                    raise ValueError("LLDP NEIGHBORS ARE STRs. Try without textfsm")
-            except ValueError as e:
-                try:
-                    lldp_nei_json = self._get_lldp_neighbors_ssh_regex(dev)
-                except:
-                    tb = self.get_traceback()
-                    self.log.info(f"DEVICE: {device} EXCEPTION22 IN _discover_lldp_neighbors_by_ssh: {tb}")
-            except:
-                tb = self.get_traceback()
-                self.log.info(f"DEVICE: {device} - SSH : ERROR DISCOVER LLDP NEIGHBORS - {tb}")
+        try:
+            dev = self.sessions.get(device).ssh()
+            if not dev:
+                raise Exception("Unable to connect via SSH")
+            self.log.info(f"DEVICE: {device} - SSH : GOT SHARED SSH SESSION : _discover_lldp_neighbors_by_ssh")
+
+            lldp_nei_json = self._get_lldp_neighbors_ssh(dev)
+            self.log.info(f"{device} - lldp_nei_json: {lldp_nei_json}")
 
-            for i in self.topology["devices"]:
-                if i['inventory_ip'] == device:
-                    i['hostname'] = lldp_nei_json['hostname']
-                    lldp_nei_json.pop("hostname")
-                    i['layer2'] = lldp_nei_json
-                    break
+            mgmt_addresses = lldp_nei_json.pop('mgmt_addresses', {})
+            hostname = lldp_nei_json.pop("hostname")
+            self.topology.update(device, hostname=hostname, layer2=lldp_nei_json)
 
-            dev.disconnect()
-            self._devices_queried.append(device)
+            self._devices_queried.add(device)
+            if self.crawl:
+                self._enqueue_neighbors(device, lldp_nei_json['neighbors'], mgmt_addresses)
         except:
             tb = self.get_traceback()
             self.log.info(f"EXCEPTION01 THROWN IN _discover_lldp_neighbors_by_ssh : {tb}")
@@ -785,6 +855,62 @@ class Dyagram:
 
         return ConnectHandler(**netmiko_kargs)
 
+    def _connect_restconf(self, device):
+        return RestconfClient(device, self.username, self.password, pool_size=self.restconf_pool_size,
+                              timeout=self.restconf_timeout)
+
+    def _connect_ssh(self, device):
+
+        """
+        Detects the device type, logs in and enters enable mode. Called once per device per run by the SessionBroker.
+
+        :param device:
+        :return: netmiko connection or None if unable to connect
+        """
+
+        session = self.sessions.get(device)
+        netmiko_args = self.netmiko_args_template.copy()
+        netmiko_args['host'] = device
+
+        def login():
+            dev = self._create_netmiko_session(netmiko_args)
+            dev.enable()
+            return dev
+
+        def on_retry(attempt, error):
+            tb = self.get_traceback()
+            self.log.info(f"DEVICE: {device} - SSH : FAILED TO CREATE NETMIKO OBJ, TRY AGAIN: _connect_ssh : TB = {tb}")
+            if attempt == 0 and device not in self.inventory_device_types and \
+                    self.device_cache.get(device, 'device_type'):
+                # cached device type may be stale (box replaced/upgraded), detect it again
+                self.log.info(f"DEVICE: {device} - SSH : INVALIDATING CACHED DEVICE TYPE")
+                self.device_cache.invalidate(device, 'device_type')
+                netmiko_args['device_type'] = self.get_device_type(device) or "cisco_ios"
+
+        try:
+            self.log.info(f"DEVICE: {device} - SSH : GETTING DEVICE TYPE : _connect_ssh")
+            os = self.get_device_type(device)
+            if not os:
+                os = "cisco_ios"
+            self.log.info(f"DEVICE: {device} - SSH : GOT DEVICE TYPE {os} : _connect_ssh")
+            netmiko_args['device_type'] = os
+
+            self.log.info(f"DEVICE: {device} - SSH : CREATING NETMIKO OBJ : _connect_ssh")
+            dev = self.retry_policy.call(login, deadline=session.deadline, on_retry=on_retry,
+                                         give_up_on=(NetmikoAuthenticationException,))
+            self.log.info(f"DEVICE: {device} - SSH : CREATED NETMIKO OBJ : _connect_ssh")
+            return dev
+        except NetmikoAuthenticationException:
+            # raised by autodetect or login, retrying bad credentials only risks locking the account
+            self.log.info(f"DEVICE: {device} - SSH : AUTHENTICATION FAILED, NOT RETRYING")
+        except DeviceUnreachable as e:
+            self.log.info(f"DEVICE: {device} - SSH : GIVING UP - {e}")
+
+        self.device_cache.invalidate(device, 'device_type')
+        self.devices_unable_to_connect.append(device)
+        self.log.info(f"DEVICE: {device} Unable to connect. Please, resolve and re-run Dyagram Discover.")
+        return None
+
 
     def _get_chassis_ids(self, netmiko_session=None, os=None, restconf_session=None):
 
@@ -792,7 +918,7 @@ class Dyagram:
         if not netmiko_session and restconf_session:
 
             try:
-                resp = restconf_session.get(f"{restconf_session.base_url}/openconfig-interfaces:interfaces")
+                resp = restconf_session.get("openconfig-interfaces:interfaces")
             except:
                 tb = self.get_traceback()
                 self.log.info(f"DEVICE: {restconf_session.base_url} EXCEPTION01 THROWN IN _get_chassis_ids : {tb}")
@@ -836,7 +962,6 @@ class Dyagram:
 
     def _get_lldp_neighbors_restconf(self, device):
 
-        headers = {"Accept": "application/yang.data+json"}
         """
         Attempts to get lldp neighbor info via various YANG Data models starting with OpenConfig then moving to device
         specific (native)
@@ -844,15 +969,11 @@ class Dyagram:
         returns lldp neighbor info in
         :return:
         """
-        session = requests.session()
-        session.auth = (os.environ['DYAGRAM_USERNAME'], os.environ['DYAGRAM_PASSWORD'])
-        session.headers = headers
-        session.verify = False
-        session.base_url = f"https://{device}/restconf/data"
+        session = self.sessions.get(device).restconf()
 
         #first try OpenConfig YANG
         self.log.info(f"DEVICE: {device} - RESTCONF-OPENCONFIG : Querying lldp for device - START")
-        oc_yang_resp = session.get(f"{session.base_url}/openconfig-lldp:lldp/interfaces/")
+        oc_yang_resp = session.get("openconfig-lldp:lldp/interfaces/")
         if oc_yang_resp.status_code != 200:
             self.log.info(f"DEVICE: {device} - RESTCONF-OPENCONFIG : Querying lldp for device - FAILURE")
             oc_yang_resp.raise_for_status()
@@ -862,7 +983,8 @@ class Dyagram:
 
         lldp_info_json = {"hostname": self._get_hostname(restconf_session=session),
                           "chassis_ids": self._get_chassis_ids(restconf_session=session),
-                          "neighbors": []}
+                          "neighbors": [],
+                          "mgmt_addresses": {}}
 
         try:
             for intf in oc_yang_resp.json()['interfaces']['interface']:
@@ -874,6 +996,9 @@ class Dyagram:
                     neighbor_info['neighbor_port'] = intf['neighbors']['neighbor'][0]['state']['port-id']
                     neighbor_info['chassis_id'] = intf['neighbors']['neighbor'][0]['state']['chassis-id']
                     lldp_info_json['neighbors'].append(neighbor_info)
+                    mgmt_address = intf['neighbors']['neighbor'][0]['state'].get('management-address')
+                    if mgmt_address:
+                        lldp_info_json['mgmt_addresses'][neighbor_info['hostname']] = mgmt_address
 
         except:
             tb = self.get_traceback()
@@ -886,158 +1011,89 @@ class Dyagram:
         raise Exception("UNABLE TO USE RESTCONF")
 
 
-    def _get_lldp_neighbors_ssh_textfsm(self, netmiko_session):
-        #os = self._get_os_version(netmiko_session)
-        os = netmiko_session.device_type
-
-        lldp_neighbors_output = netmiko_session.send_command("show lldp neighbors det", use_textfsm=True)
-        if type(lldp_neighbors_output) == str:
-            return lldp_neighbors_output
+    def _get_lldp_neighbors_ssh(self, netmiko_session):
 
-        lldp_info_json = {"hostname": self._get_hostname(netmiko_session),
-                         "chassis_ids": self._get_chassis_ids(netmiko_session, os),
-                         "neighbors": []}
+        """
+        Parses "show lldp neighbors detail" with the parsers registered for the platform (dyagram.cli.parsers),
+        fastest first.
+        """
 
+        os = netmiko_session.device_type
+        lldp_neighbors_output = netmiko_session.send_command(LLDP_NEIGHBORS_DETAIL)
+        parser, neighbors = PARSERS.parse(os, LLDP_NEIGHBORS_DETAIL, lldp_neighbors_output)
+        if neighbors is None:
+            raise ValueError(f"UNABLE TO PARSE LLDP NEIGHBORS FOR {os}")
+        self.log.info(f"DEVICE: {netmiko_session.host} - SSH : LLDP NEIGHBORS PARSED WITH {parser}")
 
+        lldp_info_json = {"hostname": self._get_hostname(netmiko_session),
+                          "chassis_ids": self._get_chassis_ids(netmiko_session, os),
+                          "neighbors": [],
+                          "mgmt_addresses": {}}
 
-        for neighbor in lldp_neighbors_output:
+        for neighbor in neighbors:
             neighbor_info = self.lldp_neighbor_template.copy()
-            neighbor_info['hostname'] = neighbor['neighbor']
-            neighbor_info['local_port'] = neighbor['local_interface']
-            neighbor_info['neighbor_port'] = neighbor['neighbor_interface']
-            neighbor_info['chassis_id'] = neighbor['chassis_id']
+            for field in neighbor_info:
+                neighbor_info[field] = neighbor[field]
             lldp_info_json['neighbors'].append(neighbor_info)
+            if neighbor.get('mgmt_address'):
+                lldp_info_json['mgmt_addresses'][neighbor_info['hostname']] = neighbor['mgmt_address']
 
         return lldp_info_json
 
-    def _get_lldp_neighbors_ssh_regex(self, netmiko_session):
-
-        # os = self._get_os_version(netmiko_session)
-        os = netmiko_session.device_type
-
-        lldp_neighbors_output = netmiko_session.send_command("show lldp neighbors det")
-        cdp_info_json = {"hostname": self._get_hostname(netmiko_session),
-                         "chassis_ids": self._get_chassis_ids(netmiko_session),
-                         "neighbors": []}
-
-        regex_strs = self._get_lldp_neighbor_regex_strings(os)
-
-
-        system_names = re.findall(regex_strs['system_name'], lldp_neighbors_output, re.MULTILINE)
-
-
-
-        system_names = [x.strip(' ') for x in system_names]
-
-        # ip_addresses = re.findall(regex_strs['ip_address'], lldp_neighbors_output)
-        # ip_addresses = [x.strip(' ') for x in ip_addresses]
-
-        local_interfaces = re.findall(regex_strs['local_interface'], lldp_neighbors_output)
-        local_interfaces = [x.strip(' ') for x in local_interfaces]
-
-        neighbor_interfaces = re.findall(regex_strs['neighbor_interface'], lldp_neighbors_output, re.MULTILINE)
-        neighbor_interfaces = [x.strip(' ') for x in neighbor_interfaces]
-
-        chassis_ids = re.findall(regex_strs['chassis_id'], lldp_neighbors_output, re.MULTILINE)
-        chassis_ids = [x.strip(' ') for x in chassis_ids]
-
-        # mgmt_ip_addresses = re.findall(regex_strs['mgmt_ip_address'], lldp_neighbors_output)
-        # if len(mgmt_ip_addresses) > 0:
-        #     mgmt_ip_addresses = [x.strip(' ') for x in mgmt_ip_addresses]
-
-        neighbor_info_template = {
-			"hostname": "",
-			"local_port": "",
-			"neighbor_port": "",
-            "chassis_id": ""
-		}
-
-        counter = 0
-        for i in system_names:
-            neighbor_info = neighbor_info_template.copy()
-            cdp_info_json['neighbors'].append(neighbor_info)
-            cdp_info_json['neighbors'][counter]['hostname'] = i
-            counter += 1
-
-        counter = 0
-        for i in local_interfaces:
-            cdp_info_json['neighbors'][counter]["local_port"] = i
-            counter += 1
-
-        counter = 0
-
-        for i in neighbor_interfaces:
-            cdp_info_json['neighbors'][counter]["neighbor_port"] = i
-            counter += 1
-
-        counter = 0
-        for i in chassis_ids:
-            cdp_info_json['neighbors'][counter]['chassis_id'] = i
-            counter += 1
-
-        # counter = 0
-        # for i in mgmt_ip_addresses:
-        #     cdp_info_json['neighbors'][counter]["mgmt_ip_address"] = i
-        #     counter += 1
-
-        return cdp_info_json
-
     def _get_hostname(self, netmiko_session=None, restconf_session=None):
-        got_hostname = False
-        tries = 0
-        while not got_hostname and tries < 5:
-            try:
-                if not netmiko_session and restconf_session:
-                    try:
-                        device = re.search('\d+\.\d+\.\d+\.\d+', restconf_session.base_url).group(1)
-                    except:
-                        device = restconf_session.base_url
-
-                    try:
-                        self.log.info(f"DEVICE: {device} - RESTCONF_OPENCONFIG : Querying for hostname - START")
-                        resp = restconf_session.get(f"{device}/openconfig-system:system/config/name")
-                        if resp.status_code == 200:
-                            self.log.info(f"DEVICE: {device} - RESTCONF_OPENCONFIG : Querying hostname - SUCCESSFUL")
-                            return resp.json()['hostname']
-                        if resp.status_code != 200:
-                            self.log.info(
-                                f"DEVICE: {device} - RESTCONF_OPENCONFIG : Querying hostname - FAILURE")
-                            # try nexus TEMPORARY
-                            self.log.info(
-                                f"DEVICE: {device} - RESTCONF_NXOS_OS_DEVICE_YANG : Querying hostname - START")
-                            resp = restconf_session.get(f"{device}/Cisco-NX-OS-device:System/name")
-
-                            if resp.status_code == 200:
-                                self.log.info(
-                                    f"DEVICE: {device} - RESTCONF_NXOS_OS_DEVICE_YANG : Querying hostname - SUCCESSFUL")
-                                return resp.json()['name']
-                            self.log.info(
-                                f"DEVICE: {device} - RESTCONF_NXOS_OS_DEVICE_YANG : Querying hostname - FAILURE")
+        if not netmiko_session and restconf_session:
+            device = restconf_session.device
 
-                    except:
+            try:
+                self.log.info(f"DEVICE: {device} - RESTCONF_OPENCONFIG : Querying for hostname - START")
+                resp = restconf_session.get("openconfig-system:system/config/name")
+                if resp.status_code == 200:
+                    self.log.info(f"DEVICE: {device} - RESTCONF_OPENCONFIG : Querying hostname - SUCCESSFUL")
+                    return resp.json()['hostname']
+                if resp.status_code != 200:
+                    self.log.info(
+                        f"DEVICE: {device} - RESTCONF_OPENCONFIG : Querying hostname - FAILURE")
+                    # try nexus TEMPORARY
+                    self.log.info(
+                        f"DEVICE: {device} - RESTCONF_NXOS_OS_DEVICE_YANG : Querying hostname - START")
+                    resp = restconf_session.get("Cisco-NX-OS-device:System/name")
 
-                        tb = self.get_traceback()
+                    if resp.status_code == 200:
                         self.log.info(
-                            f"DEVICE: {device} - RESTCONF_OPENCONFIG_AND_NXOS_OS_DEVICE_YANG_CATCHALL : Querying hostname - FAILURE - TB: {tb}")
-
-                else:
-                    self.log.info(f"DEVICE: {netmiko_session.host} - SSH : Querying for hostname - START")
-                    sh_run_output = netmiko_session.send_command("sh run | inc hostname")
-                    hostname = re.search("hostname\s+(.*)", sh_run_output).group(1)
-                    self.log.info(f"DEVICE: {netmiko_session.host} - SSH : Querying for hostname - SUCCESSFUL")
-                    return hostname
-                return None
+                            f"DEVICE: {device} - RESTCONF_NXOS_OS_DEVICE_YANG : Querying hostname - SUCCESSFUL")
+                        return resp.json()['name']
+                    self.log.info(
+                        f"DEVICE: {device} - RESTCONF_NXOS_OS_DEVICE_YANG : Querying hostname - FAILURE")
 
             except:
-                tries += 1
+
                 tb = self.get_traceback()
-                self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN _get_hostname, TRY AGAIN : {tb}")
-                if tries == 5:
-                    self.devices_unable_to_connect.append(device)
-                    self.log.info(
-                        f"DEVICE: {device} Unable to connect. Please, resolve and re-run Dyagram Discover.")  # CREATE FUNCTION THAT STOPS PROGRAM AND PRINTS SCREEN
+                self.log.info(
+                    f"DEVICE: {device} - RESTCONF_OPENCONFIG_AND_NXOS_OS_DEVICE_YANG_CATCHALL : Querying hostname - FAILURE - TB: {tb}")
+            return None
+
+        device = netmiko_session.host
+        session = self.sessions.get(device)
+
+        def get_hostname():
+            self.log.info(f"DEVICE: {device} - SSH : Querying for hostname - START")
+            sh_run_output = netmiko_session.send_command("sh run | inc hostname")
+            hostname = re.search("hostname\s+(.*)", sh_run_output).group(1)
+            self.log.info(f"DEVICE: {device} - SSH : Querying for hostname - SUCCESSFUL")
+            return hostname
+
+        def on_retry(attempt, error):
+            tb = self.get_traceback()
+            self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN _get_hostname, TRY AGAIN : {tb}")
 
-                time.sleep(1)
+        try:
+            return self.retry_policy.call(get_hostname, deadline=session.deadline,
+                                          cancelled=lambda: session.unreachable, on_retry=on_retry)
+        except DeviceUnreachable as e:
+            session.mark_unreachable()
+            self.devices_unable_to_connect.append(device)
+            self.log.info(
+                f"DEVICE: {device} Unable to connect ({e}). Please, resolve and re-run Dyagram Discover.")  # CREATE FUNCTION THAT STOPS PROGRAM AND PRINTS SCREEN
 
 
     def _get_os_version(self, netmiko_session):
@@ -1053,32 +1109,6 @@ class Dyagram:
         return None
 
 
-    def _get_lldp_neighbor_regex_strings(self, os):
-
-        regex = {"cisco_xe":
-                     {"system_name": r"(?<=System Name:\s).*",
-                      "local_interface": r"(?<=Local Intf:\s).*",
-                      "neighbor_interface": r"(?<=Port id:\s).*",
-                      "chassis_id": r"(?<=^Chassis id:\s).*"},
-
-                 "cisco_nxos":
-                     {"system_name": r"(?<=System Name:\s).*",
-                      "local_interface": r"(?<=Local Port id:\s).*",
-                      "neighbor_interface": r"(?<=^Port id:\s).*",
-                      "chassis_id": r"(?<=^Chassis id:\s).*"
-
-                      },
-                 "cisco_xr":
-                     {"system_name": r"(?<=System Name:\s).*",
-                      "local_interface": r"(?<=Local Interface:\s).*",
-                      "neighbor_interface": r"(?<=^Port id:\s).*",
-                      "chassis_id": r"(?<=^Chassis id:\s).*"
-                      }
-                 }
-
-        return regex[os]
-
-
 
 def main():
 
@@ -1088,6 +1118,46 @@ def main():
 
         parser.add_argument('dyagram_args', nargs='*')
         parser.add_argument("-v", action='store_true', dest='verbose')
+        parser.add_argument("--workers", type=int, default=30,
+                            help="worker threads, devices polled at once")
+        parser.add_argument("--all-sites", action='store_true', dest='all_sites',
+                            help="discover (or export) every site in one run")
+        parser.add_argument("--stream-routes", action='store_true', dest='stream_routes',
+                            help="parse route tables per vrf as they are read (lower memory on large tables)")
+        parser.add_argument("--restconf-pool-size", type=int, default=4, dest='restconf_pool_size',
+                            help="RESTCONF connections kept open per device")
+        parser.add_argument("--restconf-timeout", type=float, nargs=2, default=(5, 30), dest='restconf_timeout',
+                            metavar=('CONNECT', 'READ'), help="RESTCONF connect and read timeouts in seconds")
+        parser.add_argument("--device-budget", type=float, default=120, dest='device_budget',
+                            help="seconds a device may spend on connection retries before it's given up on")
+        parser.add_argument("--deadline", type=float, default=None,
+                            help="seconds the whole run may take, devices not reached by then are reported")
+        parser.add_argument("--incremental", action='store_true',
+                            help="only fully re-poll devices whose route/lldp summary changed or are due")
+        parser.add_argument("--refresh-interval", type=float, default=None, dest='refresh_interval',
+                            help="incremental mode: seconds before a device is fully re-polled anyway")
+        parser.add_argument("--interval", type=float, default=300,
+                            help="watch mode: default seconds between polls of a device")
+        parser.add_argument("--jitter", type=float, default=0.1,
+                            help="watch mode: fraction poll intervals are randomly spread by")
+        parser.add_argument("--state-format", choices=STATE_FORMATS, default="ndjson", dest='state_format',
+                            help="format a new state on record is saved in, ndjson can be read per device")
+        parser.add_argument("--codec", choices=list(CODECS), default=None,
+                            help="serializer for the state on record, defaults to the fastest installed")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="png", dest='export_format',
+                            help="export format, everything but png is written without Graphviz")
+        parser.add_argument("--cluster", choices=CLUSTER_METHODS, default=None, dest='cluster_by',
+                            help="export: group devices by hostname prefix, connected component or community")
+        parser.add_argument("--force", action='store_true',
+                            help="export even if the topology didn't change since the last export")
+        parser.add_argument("--pin-layout", action='store_true', dest='pin_layout',
+                            help="export: lay out png, dot and html in dyagram and keep devices where they were")
+        parser.add_argument("--crawl", action='store_true',
+                            help="also discover lldp neighbors that aren't in the inventory")
+        parser.add_argument("--depth", type=int, default=None, dest='crawl_depth',
+                            help="max lldp hops from an inventory device when crawling")
+        parser.add_argument("--scope", action='append', default=None, dest='crawl_scope',
+                            help="only crawl into this subnet (repeatable), e.g. --scope 10.10.20.0/24")
 
         args = parser.parse_args()
 
@@ -1096,13 +1166,66 @@ def main():
             dyinit = dyagramInitialize()
             dyinit.dy_init()
 
-        if args.dyagram_args[0].lower() == "discover":
-            dy = Dyagram(verbose=args.verbose)
-            dy.discover()
+        if args.dyagram_args[0].lower() == "discover" and args.all_sites:
+            from dyagram.cli.multisite import MultiSiteDiscovery
+            multi = MultiSiteDiscovery(engine=ThreadedEngine(max_workers=args.workers), verbose=args.verbose,
+                                       crawl=args.crawl, crawl_depth=args.crawl_depth, crawl_scope=args.crawl_scope,
+                                       stream_routes=args.stream_routes, restconf_pool_size=args.restconf_pool_size,
+                                       restconf_timeout=tuple(args.restconf_timeout),
+                                       device_budget=args.device_budget, deadline=args.deadline,
+                                       incremental=args.incremental, refresh_interval=args.refresh_interval,
+                                       state_format=args.state_format, codec=args.codec)
+            multi.discover()
+
+        elif args.dyagram_args[0].lower() == "discover":
+            dy = Dyagram(verbose=args.verbose, crawl=args.crawl, crawl_depth=args.crawl_depth,
+                         crawl_scope=args.crawl_scope, stream_routes=args.stream_routes,
+                         restconf_pool_size=args.restconf_pool_size, restconf_timeout=tuple(args.restconf_timeout),
+                         device_budget=args.device_budget, deadline=args.deadline,
+                         incremental=args.incremental, refresh_interval=args.refresh_interval,
+                         state_format=args.state_format, codec=args.codec)
+            dy.discover(engine=ThreadedEngine(max_workers=args.workers, log=dy.log))
+
+        if args.dyagram_args[0].lower() == "watch":
+            from dyagram.cli.watch import Watcher
+            watcher = Watcher(interval=args.interval, jitter=args.jitter, workers=args.workers,
+                              verbose=args.verbose, crawl=args.crawl, crawl_depth=args.crawl_depth,
+                              crawl_scope=args.crawl_scope, stream_routes=args.stream_routes,
+                              restconf_pool_size=args.restconf_pool_size,
+                              restconf_timeout=tuple(args.restconf_timeout), device_budget=args.device_budget,
+                              incremental=args.incremental, refresh_interval=args.refresh_interval,
+                              state_format=args.state_format, codec=args.codec)
+            watcher.run()
+
+        if args.dyagram_args[0].lower() == "state" and len(args.dyagram_args) > 1 and \
+                args.dyagram_args[1].lower() == "migrate":
+            site = args.dyagram_args[2] if len(args.dyagram_args) > 2 else sites.get_current_site()
+            previous_format = migrate_state(site, state_format=args.state_format, codec=args.codec)
+            if previous_format is None:
+                print(f'Site "{site}" has no state to migrate')
+            else:
+                print(f'Site "{site}": state migrated from {previous_format} to {args.state_format}')
+
+        if args.dyagram_args[0].lower() == "history":
+            from dyagram.cli.history import StateHistory
+            history = StateHistory(sites.get_current_site())
+            if len(args.dyagram_args) == 1:
+                history.list_runs_in_cli()
+            elif args.dyagram_args[1].lower() == "diff":
+                history.diff_in_cli(*args.dyagram_args[2:4])
+            elif args.dyagram_args[1].lower() == "at":
+                history.state_at_in_cli(args.dyagram_args[2])
 
         if args.dyagram_args[0].lower() == "export":
-            dy = DiagramExport()
-            dy.export()
+            export_sites = [site for site in sites().get_sites() if state_exists(site)] if args.all_sites \
+                else [sites.get_current_site()]
+            for site in export_sites:
+                dy = DiagramExport(site=site, cluster_by=args.cluster_by, pin_layout=args.pin_layout)
+                export_file = dy.export(export_format=args.export_format, force=args.force)
+                if export_file is None:
+                    print(f'Site "{site}": topology unchanged, {dy.export_file(args.export_format)} is up to date')
+                else:
+                    print(f'Site "{site}": exported {export_file}')
 
 
         if args.dyagram_args[0].lower() == "site":
@@ -0,0 +1,56 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class ThreadedEngine:
+
+    """
+    Discovery engine. Every device pulled off the Dyagram queue gets a worker thread from a fixed size pool.
+
+    The queue is checked again each time a device finishes, so devices enqueued while the run is going (crawl mode)
+    are picked up. The run ends once the queue is empty and no device is still being polled.
+    """
+
+    def __init__(self, max_workers=30, log=None):
+        self.max_workers = max_workers
+        self.log = log or logging.getLogger("")
+
+    def run(self, dyagram):
+        self.run_many([dyagram])
+
+    def run_many(self, dyagrams, on_done=None):
+
+        """
+        Polls the devices of several Dyagram instances (one per site) on one shared pool, so max_workers is the
+        budget for the whole run rather than per site.
+
+        :param dyagrams:
+        :param on_done: called with a Dyagram once all of its devices have been polled
+        :return:
+        """
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = {}  # future -> dyagram
+        outstanding = {id(dy): 0 for dy in dyagrams}
+        finished = set()
+        try:
+            while True:
+                for dy in dyagrams:
+                    device = dy.next_device()
+                    while device:
+                        pending[executor.submit(dy.discover_device, device)] = dy
+                        outstanding[id(dy)] += 1
+                        self.log.info(f"DEVICE: {device} - Submitted for discover_device")
+                        device = dy.next_device()
+                    if not outstanding[id(dy)] and id(dy) not in finished:
+                        finished.add(id(dy))
+                        if on_done:
+                            on_done(dy)
+                if not pending:
+                    break
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outstanding[id(pending.pop(future))] -= 1
+        finally:
+            executor.shutdown(wait=True)
+
@@ -1,48 +1,168 @@
-from diagrams import Diagram, Cluster
-from diagrams.aws.network import ELB
-import os
+import hashlib
 import json
+import os
+import re
+from pathlib import Path
 from dyagram.cli.sites import sites
+from dyagram.cli.state import StateReader
+from dyagram.cli.graph import TopologyGraph
+from dyagram.cli.formats import EXPORTERS
+from dyagram.cli.layout import layout
 
+# diagrams is only imported (and Graphviz only has to be installed) for png
 os.environ["PATH"] += os.pathsep + r'C:\Program Files\Graphviz\bin'
-# FIXME: MUST HAVE GRAPHVIZ INSTALLED TO RUN
+# FIXME: MUST HAVE GRAPHVIZ INSTALLED TO RUN PNG EXPORTS
+
+EXPORT_FORMATS = ("png",) + tuple(EXPORTERS)
+PINNED_FORMATS = ("png", "dot", "html")  # can be drawn at positions from dyagram.cli.layout, see DiagramExport
+PNG_SCALE = 2.5 / 80  # inches per layout point, the diagrams icons need more room than a dot box
 
 
 class DiagramExport:
 
-    def __init__(self):
+    def __init__(self, site=None, cluster_by=None, pin_layout=False):
+
+        self.current_site = site or sites.get_current_site()
+        self.cluster_by = cluster_by
+        self.pin_layout = pin_layout  # lay devices out here and keep them where the last pinned export put them
+        self.fingerprint_file = f'{self.current_site}/{self.current_site}_diagram.fingerprint.json'
+        self.graph = None  # loaded when something has to be exported
+        # {cluster name: [inventory ips]}, None exports the site as one cluster
+        self.clusters = None
+
+    def load_graph(self):
+        # devices are streamed, only their lldp info is kept
+        with StateReader(self.current_site) as reader:
+            return TopologyGraph.from_devices(reader.devices())
+
+    def topology_fingerprint(self):
+
+        """
+        Hash of every device's hostname and lldp section. It comes from the section hashes in state.idx, so telling
+        whether the topology changed doesn't read the state itself.
+        """
+
+        with StateReader(self.current_site) as reader:
+            topology = sorted((ip, hostname, hashes.get('layer2')) for ip, (hostname, hashes)
+                              in reader.fingerprint().items())
+        return hashlib.sha256(json.dumps([topology, self.cluster_by, self.pin_layout]).encode('utf-8')).hexdigest()
+
+    def load_fingerprints(self):
+
+        """
+        :return: {"exports": {format: topology fingerprint it was exported at}, "positions": {inventory ip: [x, y]}}
+        """
+
+        try:
+            with open(self.fingerprint_file, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"exports": {}, "positions": {}}
+
+    def save_fingerprints(self, fingerprints):
+        with open(self.fingerprint_file, 'w') as file:
+            json.dump(fingerprints, file)
+
+    def export_file(self, export_format):
+        return f'{self.current_site}/{self.current_site}_diagram.{export_format}'
+
+    def export(self, export_format="png", force=False):
+
+        """
+        cli command: dyagram export [--format png|graphml|dot|json|html] [--cluster prefix|component|community]
+                                    [--pin-layout]
 
-        self.current_site = sites.get_current_site()
-        self.state = self.load_state()
+        Nothing is exported when the topology is the same as at the last export in that format.
 
+        By default Graphviz (png, dot) or the browser (html) lays the devices out. With pin_layout, png, dot and html
+        are drawn at positions from dyagram.cli.layout that are saved with the export, devices keep their position on
+        the next pinned export and only new devices are placed. Clustered png and dot are still laid out by Graphviz,
+        which draws the cluster boxes. html always embeds the saved positions it has, the browser lays out the rest.
 
-    def load_state(self):
-        file = open(rf"{self.current_site}/state.json", 'r')
-        state = json.load(file)
-        file.close()
-        return state
+        :param export_format: png renders through diagrams/Graphviz, every other format is written in pure python
+        :param force: export even if the topology didn't change
+        :return: path of the exported file, None if it was already up to date
+        """
 
-    def export(self):
-        with Diagram(self.current_site, show=False, filename=f'{self.current_site}/{self.current_site}_diagram.png'):
+        fingerprint = self.topology_fingerprint()
+        fingerprints = self.load_fingerprints()
+        if not force and fingerprints['exports'].get(export_format) == fingerprint and \
+                Path(self.export_file(export_format)).is_file():
+            return None
+
+        self.graph = self.load_graph()
+        self.clusters = self.graph.partition(self.cluster_by) if self.cluster_by else None
+        positions = None
+        if self.pin_layout and export_format in PINNED_FORMATS and (export_format == "html" or not self.clusters):
+            positions = layout(self.graph, previous=fingerprints['positions'])
+            fingerprints['positions'] = positions
+        elif export_format == "html":
+            positions = {ip: p for ip, p in fingerprints['positions'].items() if ip in self.graph.nodes} or None
+
+        if export_format == "png" and self.clusters:
+            self.export_png_clustered()
+        elif export_format == "png":
+            self.export_png(positions)
+        else:
+            with open(self.export_file(export_format), 'w', encoding='utf-8') as file:
+                file.write(EXPORTERS[export_format](self.graph, self.current_site, clusters=self.clusters,
+                                                    positions=positions))
+
+        fingerprints['exports'][export_format] = fingerprint
+        self.save_fingerprints(fingerprints)
+        return self.export_file(export_format)
+
+    def cluster_file(self, cluster):
+        return f'{self.current_site}/{self.current_site}_diagram_{re.sub(r"[^A-Za-z0-9_.-]", "_", cluster)}'
+
+    def export_png(self, positions=None):
+
+        """
+        :param positions: {inventory ip: [x, y]}, rendered with neato with every device pinned there, so the picture
+                          only moves where the topology changed. None lets Graphviz (dot) lay it out.
+        """
+
+        from diagrams import Diagram, Cluster
+        from diagrams.aws.network import ELB
+
+        graph_attr = {"layout": "neato"} if positions else {}
+        with Diagram(self.current_site, show=False, filename=f'{self.current_site}/{self.current_site}_diagram',
+                     graph_attr=graph_attr):
             with Cluster(" "):  #  makes a pretty background lol
 
-                graph_info = []  # object, hostname, neighbor_obj
-
-                for n, val in enumerate(self.state['devices']):
-                    locals()[f"var{n}"] = ELB(val['hostname'])
-                    graph_info.append({"object": locals()[f"var{n}"], "inventory_ip": val['inventory_ip'],
-                                       "chassis_ids": val['layer2']["chassis_ids"], "neighbor_objects": []})
-
-                for device in self.state['devices']:
-                    for neighbor in device['layer2']['neighbors']:
-                        for dev in self.state['devices']:
-                            if neighbor['chassis_id'] in dev['layer2']['chassis_ids']:
-                                for i in graph_info:
-                                    if i['inventory_ip'] == device['inventory_ip']:
-                                        for x in graph_info:
-                                            if neighbor['chassis_id'] in x['chassis_ids']:
-                                                i['neighbor_objects'].append(x['object'])
-
-                for device in graph_info:
-                    for neighbor in device['neighbor_objects']:
-                        device['object'] - neighbor
+                def pinned(ip):
+                    if not positions:
+                        return {}
+                    x, y = positions[ip]
+                    return {"pos": f"{x * PNG_SCALE:.2f},{-y * PNG_SCALE:.2f}!"}  # Graphviz y points up
+
+                nodes = {ip: ELB(hostname, **pinned(ip)) for ip, hostname in self.graph.nodes.items()}
+
+                # one edge per pair of devices, a link seen from both ends is only drawn once
+                for a, b in self.graph.edge_pairs():
+                    nodes[a] - nodes[b]
+
+    def export_png_clustered(self):
+
+        """
+        Large sites: <site>_diagram.png is an overview with one node per cluster and the number of links between them,
+        and every cluster is rendered on its own to <site>_diagram_<cluster>.png. Graphviz never lays out more than one
+        cluster at a time.
+        """
+
+        from diagrams import Diagram, Cluster, Edge
+        from diagrams.aws.network import ELB, VPC
+
+        with Diagram(self.current_site, show=False, filename=f'{self.current_site}/{self.current_site}_diagram'):
+            with Cluster(" "):
+                nodes = {cluster: VPC(f"{cluster}\n{len(ips)} devices") for cluster, ips in self.clusters.items()}
+                for (a, b), links in sorted(self.graph.cluster_links(self.clusters).items()):
+                    nodes[a] - Edge(label=str(links)) - nodes[b]
+
+        for cluster, ips in self.clusters.items():
+            subgraph = self.graph.subgraph(ips)
+            with Diagram(f"{self.current_site} {cluster}", show=False, filename=self.cluster_file(cluster)):
+                with Cluster(cluster):
+                    nodes = {ip: ELB(hostname) for ip, hostname in subgraph.nodes.items()}
+                    for a, b in subgraph.edge_pairs():
+                        nodes[a] - nodes[b]
@@ -0,0 +1,239 @@
+"""
+Topology exporters that write straight from the state on record, no Graphviz or diagrams needed. Each takes a
+TopologyGraph (see dyagram.cli.graph) and returns the file's text.
+"""
+
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+
+def _ports_label(ports):
+    return ", ".join(f"{a} - {b}" for a, b in ports)
+
+
+def _cluster_of(clusters):
+    return {ip: cluster for cluster, ips in (clusters or {}).items() for ip in ips}
+
+
+def _node_link(graph, name, clusters=None, positions=None):
+    cluster_of = _cluster_of(clusters)
+    nodes = [{"id": ip, "hostname": hostname} for ip, hostname in graph.nodes.items()]
+    for node in nodes:
+        if node["id"] in cluster_of:
+            node["cluster"] = cluster_of[node["id"]]
+        if positions and node["id"] in positions:
+            node["x"], node["y"] = positions[node["id"]]
+    return {"directed": False, "multigraph": False, "graph": {"name": name},
+            "nodes": nodes,
+            "links": [{"source": a, "target": b, "ports": [list(p) for p in graph.edge_ports(a, b)]}
+                      for a, b in graph.edge_pairs()]}
+
+
+def to_node_link(graph, name="", clusters=None, positions=None):
+
+    """
+    :param clusters: {cluster name: [inventory ips]} (see TopologyGraph.partition), added to the nodes as "cluster"
+    :param positions: {inventory ip: [x, y]} (see dyagram.cli.layout), added to the nodes as "x" and "y"
+    :return: json node-link graph, the layout networkx.node_link_graph() and d3 read
+    """
+
+    return json.dumps(_node_link(graph, name, clusters, positions), indent=2)
+
+
+def to_graphml(graph, name="", clusters=None, positions=None):
+
+    """
+    :return: GraphML document (yEd, Gephi, networkx)
+    """
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">',
+             '  <key id="hostname" for="node" attr.name="hostname" attr.type="string"/>',
+             '  <key id="cluster" for="node" attr.name="cluster" attr.type="string"/>',
+             '  <key id="x" for="node" attr.name="x" attr.type="double"/>',
+             '  <key id="y" for="node" attr.name="y" attr.type="double"/>',
+             '  <key id="ports" for="edge" attr.name="ports" attr.type="string"/>',
+             f'  <graph id={quoteattr(name)} edgedefault="undirected">']
+    cluster_of = _cluster_of(clusters)
+    for ip, hostname in graph.nodes.items():
+        data = f'<data key="hostname">{escape(hostname)}</data>'
+        if ip in cluster_of:
+            data += f'<data key="cluster">{escape(cluster_of[ip])}</data>'
+        if positions and ip in positions:
+            data += f'<data key="x">{positions[ip][0]}</data><data key="y">{positions[ip][1]}</data>'
+        lines.append(f'    <node id={quoteattr(ip)}>{data}</node>')
+    for a, b in graph.edge_pairs():
+        ports = escape(_ports_label(graph.edge_ports(a, b)))
+        lines.append(f'    <edge source={quoteattr(a)} target={quoteattr(b)}><data key="ports">{ports}</data></edge>')
+    lines += ['  </graph>', '</graphml>', '']
+    return "\n".join(lines)
+
+
+def _dot_id(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def to_dot(graph, name="", clusters=None, positions=None):
+
+    """
+    :param clusters: {cluster name: [inventory ips]}, each is written as a subgraph cluster so Graphviz lays it out
+                     as a box of its own
+    :param positions: {inventory ip: [x, y]} in points (see dyagram.cli.layout), the file is set to render with neato
+                      and every device is pinned there. Not used with clusters: neato doesn't draw cluster boxes and
+                      the layout doesn't know about them, so clustered files are left to dot.
+    :return: Graphviz DOT text, render it later with any Graphviz (e.g. sfdp for large sites) or open it in a viewer
+    """
+
+    if clusters:
+        positions = None
+
+    def node(ip):
+        # neato reads pos in inches and its y axis points up
+        pos = f", pos=\"{positions[ip][0] / 72:.2f},{-positions[ip][1] / 72:.2f}!\"" if positions else ""
+        return f"{_dot_id(ip)} [label={_dot_id(graph.nodes[ip])}{pos}];"
+
+    lines = [f"graph {_dot_id(name)} {{", '  node [shape=box];']
+    if positions:
+        lines.append('  layout=neato;')
+    clustered = set()
+    for n, (cluster, ips) in enumerate((clusters or {}).items()):
+        lines += [f"  subgraph {_dot_id(f'cluster_{n}')} {{", f"    label={_dot_id(cluster)};"]
+        lines += [f"    {node(ip)}" for ip in ips]
+        lines.append("  }")
+        clustered.update(ips)
+    for ip in graph.nodes:
+        if ip not in clustered:
+            lines.append(f"  {node(ip)}")
+    for a, b in graph.edge_pairs():
+        lines.append(f"  {_dot_id(a)} -- {_dot_id(b)} [label={_dot_id(_ports_label(graph.edge_ports(a, b)))}];")
+    lines += ["}", ""]
+    return "\n".join(lines)
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<style>
+  html, body { margin: 0; height: 100%%; font-family: sans-serif; background: #f7f8fa; }
+  svg { width: 100%%; height: 100%%; cursor: grab; }
+  line { stroke: #8a94a6; stroke-width: 1.5; }
+  circle { fill: #3b82f6; stroke: #1e3a8a; stroke-width: 1.5; cursor: pointer; }
+  text { font-size: 11px; fill: #111827; pointer-events: none; }
+  #title { position: fixed; top: 8px; left: 12px; font-weight: bold; }
+</style>
+</head>
+<body>
+<div id="title">%(title)s</div>
+<svg id="view" xmlns="http://www.w3.org/2000/svg"></svg>
+<script>
+const graph = %(graph)s;
+const svg = document.getElementById("view"), NS = "http://www.w3.org/2000/svg";
+const nodes = graph.nodes, byId = {};
+nodes.forEach((n, i) => { byId[n.id] = n; });
+const hue = {};
+[...new Set(nodes.map(n => n.cluster))].forEach((c, i) => { hue[c] = i * 137 %% 360; });
+const links = graph.links.map(l => ({source: byId[l.source], target: byId[l.target], ports: l.ports}));
+
+// force directed layout (Fruchterman-Reingold), run once before drawing. Devices that come with x and y (positions
+// saved by a pinned export) stay where they are, only the others are laid out.
+const size = Math.max(600, Math.sqrt(nodes.length) * 120), k = size / Math.sqrt(nodes.length || 1);
+nodes.forEach((n, i) => {
+  n.fixed = n.x !== undefined;
+  if (!n.fixed) {
+    const a = 2 * Math.PI * i / nodes.length;
+    n.x = size / 2 + size / 3 * Math.cos(a); n.y = size / 2 + size / 3 * Math.sin(a);
+  }
+});
+const iterations = nodes.every(n => n.fixed) ? 0
+  : Math.max(30, Math.min(300, Math.floor(3e7 / (nodes.length * nodes.length || 1))));
+let t = size / 10;
+for (let it = 0; it < iterations; it++, t *= 0.97) {
+  nodes.forEach(n => { n.dx = 0; n.dy = 0; });
+  for (let i = 0; i < nodes.length; i++) for (let j = i + 1; j < nodes.length; j++) {
+    const a = nodes[i], b = nodes[j];
+    let dx = a.x - b.x, dy = a.y - b.y, d = Math.hypot(dx, dy) || 0.01, f = k * k / d;
+    a.dx += dx / d * f; a.dy += dy / d * f; b.dx -= dx / d * f; b.dy -= dy / d * f;
+  }
+  links.forEach(l => {
+    const a = l.source, b = l.target;
+    let dx = a.x - b.x, dy = a.y - b.y, d = Math.hypot(dx, dy) || 0.01, f = d * d / k;
+    a.dx -= dx / d * f; a.dy -= dy / d * f; b.dx += dx / d * f; b.dy += dy / d * f;
+  });
+  nodes.forEach(n => {
+    if (n.fixed) return;
+    const d = Math.hypot(n.dx, n.dy) || 0.01, m = Math.min(d, t);
+    n.x += n.dx / d * m; n.y += n.dy / d * m;
+  });
+}
+
+function el(name, attrs, parent) {
+  const e = document.createElementNS(NS, name);
+  for (const a in attrs) e.setAttribute(a, attrs[a]);
+  parent.appendChild(e); return e;
+}
+const root = el("g", {}, svg);
+links.forEach(l => {
+  l.el = el("line", {}, root);
+  el("title", {}, l.el).textContent = l.ports.map(p => p.join(" - ")).join("\\n");
+});
+nodes.forEach(n => {
+  n.el = el("g", {}, root);
+  n.circle = el("circle", {r: 8}, n.el);
+  if (n.cluster !== undefined) n.circle.setAttribute("style", `fill: hsl(${hue[n.cluster]}, 65%%, 55%%)`);
+  el("title", {}, n.circle).textContent = n.hostname + " (" + n.id + ")" + (n.cluster ? "\\n" + n.cluster : "");
+  el("text", {x: 11, y: 4}, n.el).textContent = n.hostname;
+});
+function draw() {
+  links.forEach(l => { l.el.setAttribute("x1", l.source.x); l.el.setAttribute("y1", l.source.y);
+                       l.el.setAttribute("x2", l.target.x); l.el.setAttribute("y2", l.target.y); });
+  nodes.forEach(n => n.el.setAttribute("transform", `translate(${n.x},${n.y})`));
+}
+draw();
+
+// pan, zoom and drag
+const xs = nodes.map(n => n.x), ys = nodes.map(n => n.y);
+let box = nodes.length ? [Math.min(...xs) - 50, Math.min(...ys) - 50, Math.max(...xs) - Math.min(...xs) + 150,
+                          Math.max(...ys) - Math.min(...ys) + 100] : [0, 0, size, size];
+const setBox = () => svg.setAttribute("viewBox", box.join(" "));
+setBox();
+const toGraph = e => { const p = svg.createSVGPoint(); p.x = e.clientX; p.y = e.clientY;
+                       return p.matrixTransform(root.getScreenCTM().inverse()); };
+let dragging = null, panning = null;
+nodes.forEach(n => n.circle.addEventListener("mousedown", e => { dragging = n; e.stopPropagation(); }));
+svg.addEventListener("mousedown", e => { panning = toGraph(e); });
+window.addEventListener("mouseup", () => { dragging = panning = null; });
+svg.addEventListener("mousemove", e => {
+  const p = toGraph(e);
+  if (dragging) { dragging.x = p.x; dragging.y = p.y; draw(); }
+  else if (panning) { box[0] -= p.x - panning.x; box[1] -= p.y - panning.y; setBox(); }
+});
+svg.addEventListener("wheel", e => {
+  e.preventDefault();
+  const p = toGraph(e), s = e.deltaY > 0 ? 1.1 : 1 / 1.1;
+  box = [p.x - (p.x - box[0]) * s, p.y - (p.y - box[1]) * s, box[2] * s, box[3] * s]; setBox();
+}, {passive: false});
+</script>
+</body>
+</html>
+"""
+
+
+def to_html(graph, name="", clusters=None, positions=None):
+
+    """
+    :param clusters: {cluster name: [inventory ips]}, devices are colored by cluster
+    :param positions: {inventory ip: [x, y]} saved by a pinned export, those devices are drawn there and the browser
+                      only lays out the rest
+    :return: self-contained html page: the graph is embedded as json and laid out and drawn as svg in the browser
+    """
+
+    data = _node_link(graph, name, clusters, positions)
+    # </script> inside a hostname must not end the script block
+    embedded = json.dumps(data, separators=(',', ':')).replace("</", "<\\/")
+    return HTML_TEMPLATE % {"title": escape(name), "graph": embedded}
+
+
+# export format -> exporter, the format is also the file extension
+EXPORTERS = {"graphml": to_graphml, "dot": to_dot, "json": to_node_link, "html": to_html}
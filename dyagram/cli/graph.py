@@ -0,0 +1,257 @@
+import re
+from collections import Counter
+
+
+CLUSTER_METHODS = ("prefix", "component", "community")
+HOSTNAME_NUMBER = re.compile(r'[-_]?\d+$')  # dc1-leaf-03 -> dc1-leaf, core01 -> core
+
+# interface name abbreviations -> full name, platforms spell a port differently locally and in lldp
+INTERFACE_ABBREVIATIONS = {"et": "ethernet", "eth": "ethernet", "fa": "fastethernet", "gi": "gigabitethernet",
+                           "gig": "gigabitethernet", "tw": "twogigabitethernet", "te": "tengigabitethernet",
+                           "twe": "twentyfivegige", "fo": "fortygigabitethernet", "hu": "hundredgige",
+                           "po": "port-channel", "lo": "loopback"}
+INTERFACE_NAME = re.compile(r'^\s*([A-Za-z][A-Za-z-]*?)\s*(\d[\d/.:]*)\s*$')
+
+
+def canonical_port(port):
+
+    """
+    :return: the port name spelled out and lowercased (Eth1/1 and Ethernet1/1 -> ethernet1/1), anything that isn't an
+             interface name (e.g. a port description) is only lowercased
+    """
+
+    match = INTERFACE_NAME.match(port or "")
+    if not match:
+        return (port or "").strip().lower()
+    name = match.group(1).lower()
+    return INTERFACE_ABBREVIATIONS.get(name, name) + match.group(2)
+
+
+class TopologyGraph:
+
+    """
+    LLDP graph of a site: one node per device, one edge per pair of devices that see each other, however many links
+    (and from however many sides) LLDP reports between them.
+
+    Built in two passes over the devices: the first indexes every chassis id to its device, the second resolves
+    each neighbor's chassis id through that index. Only hostnames, chassis ids and ports are kept, so devices can be
+    streamed from StateReader.devices() without holding route tables in memory.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # inventory ip -> hostname, in state order
+        self.edges = {}  # frozenset({ip_a, ip_b}) -> [(ip_a, local_port, ip_b, neighbor_port), ...]
+
+    @classmethod
+    def from_devices(cls, devices):
+
+        """
+        :param devices: iterable of device records in state.json shape
+        :return: TopologyGraph
+        """
+
+        graph = cls()
+        by_chassis_id = {}
+        links = []  # (ip, local_port, neighbor chassis id, neighbor_port), resolved once every chassis id is known
+        for device in devices:
+            ip = device['inventory_ip']
+            graph.nodes[ip] = device['hostname']
+            layer2 = device.get('layer2') or {}
+            for chassis_id in layer2.get('chassis_ids') or []:
+                by_chassis_id[chassis_id] = ip
+            for neighbor in layer2.get('neighbors') or []:
+                links.append((ip, neighbor.get('local_port', ""), neighbor.get('chassis_id'),
+                              neighbor.get('neighbor_port', "")))
+
+        for ip, local_port, chassis_id, neighbor_port in links:
+            neighbor_ip = by_chassis_id.get(chassis_id)
+            if neighbor_ip is None or neighbor_ip == ip:
+                continue  # neighbor isn't part of the site (or is the device itself)
+            graph.edges.setdefault(frozenset((ip, neighbor_ip)), []).append((ip, local_port, neighbor_ip,
+                                                                             neighbor_port))
+        return graph
+
+    def edge_pairs(self):
+
+        """
+        :return: [(ip_a, ip_b), ...] one per edge, in a stable order
+        """
+
+        return sorted(tuple(sorted(edge)) for edge in self.edges)
+
+    def edge_ports(self, a, b):
+
+        """
+        :return: [(port on a, port on b), ...] one per physical link between a and b, however many sides reported it
+        """
+
+        from_a, from_b = set(), set()  # (local port, port lldp reported for the other end)
+        for ip, local_port, _, neighbor_port in self.edges.get(frozenset((a, b)), []):
+            (from_a if ip == a else from_b).add((local_port, neighbor_port))
+
+        # a link reported from both ends is matched up on either end's port, spelled out the same way. The neighbor
+        # port can be a port description (IOS), so both ends' own port names are kept for a matched link.
+        unmatched = {canonical_port(local): (local, remote) for local, remote in from_b}
+        ports = set()
+        for local, remote in sorted(from_a):
+            key = canonical_port(remote)
+            if key not in unmatched:
+                key = next((k for k, (_, b_remote) in unmatched.items()
+                            if canonical_port(b_remote) == canonical_port(local)), None)
+            if key is None:
+                ports.add((local, remote))
+            else:
+                ports.add((local, unmatched.pop(key)[0]))
+        ports.update((remote, local) for local, remote in unmatched.values())
+        return sorted(ports)
+
+    def adjacency(self):
+
+        """
+        :return: {inventory ip: set of neighbor ips}, every node included
+        """
+
+        adjacency = {ip: set() for ip in self.nodes}
+        for a, b in self.edge_pairs():
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+        return adjacency
+
+    def subgraph(self, inventory_ips):
+
+        """
+        :return: TopologyGraph of the given devices and the edges between them
+        """
+
+        inventory_ips = set(inventory_ips)
+        graph = TopologyGraph()
+        graph.nodes = {ip: hostname for ip, hostname in self.nodes.items() if ip in inventory_ips}
+        graph.edges = {edge: links for edge, links in self.edges.items() if edge <= inventory_ips}
+        return graph
+
+    def partition(self, method):
+
+        """
+        Splits the site into clusters that can be laid out on their own.
+
+        prefix: hostnames with the trailing number stripped (dc1-leaf-03 -> dc1-leaf)
+        component: connected components
+        community: modularity (Louvain local moving), densely linked devices end up together even when the whole site
+                   is one component
+
+        :param method: one of CLUSTER_METHODS
+        :return: {cluster name: [inventory ips]}, largest cluster first, devices in state order
+        """
+
+        if method == "prefix":
+            labels = {ip: HOSTNAME_NUMBER.sub("", hostname.split(".")[0]) or hostname
+                      for ip, hostname in self.nodes.items()}
+        elif method == "component":
+            labels = self._components()
+        elif method == "community":
+            labels = self._communities()
+        else:
+            raise ValueError(f"Unknown cluster method {method}, expected one of {', '.join(CLUSTER_METHODS)}")
+
+        members = {}
+        for ip in self.nodes:
+            members.setdefault(labels[ip], []).append(ip)
+        ordered = sorted(members.items(), key=lambda item: (-len(item[1]), str(item[0])))
+        if method == "prefix":
+            return dict(ordered)
+        return {f"{method}-{n}": ips for n, (_, ips) in enumerate(ordered, 1)}
+
+    def _components(self):
+        adjacency = self.adjacency()
+        labels = {}
+        for ip in self.nodes:
+            if ip in labels:
+                continue
+            labels[ip] = ip
+            stack = [ip]
+            while stack:
+                for neighbor in adjacency[stack.pop()]:
+                    if neighbor not in labels:
+                        labels[neighbor] = ip
+                        stack.append(neighbor)
+        return labels
+
+    def _communities(self):
+        # Louvain: move devices between communities while modularity improves, then treat every community as one
+        # node and repeat, so leaf/spine pods end up as one cluster rather than one per spine
+        weights = {ip: {} for ip in self.nodes}
+        for a, b in self.edge_pairs():
+            weights[a][b] = weights[b][a] = 1
+        labels = {ip: ip for ip in self.nodes}
+        while True:
+            moved = _local_moving(weights)
+            if len(set(moved.values())) == len(weights):
+                return labels
+            labels = {ip: moved[label] for ip, label in labels.items()}
+            weights = _aggregate(weights, moved)
+
+    def cluster_links(self, clusters):
+
+        """
+        :param clusters: {cluster name: [inventory ips]} as returned by partition()
+        :return: {(cluster a, cluster b): number of edges between them}
+        """
+
+        cluster_of = {ip: name for name, ips in clusters.items() for ip in ips}
+        links = Counter()
+        for a, b in self.edge_pairs():
+            if cluster_of[a] != cluster_of[b]:
+                links[tuple(sorted((cluster_of[a], cluster_of[b])))] += 1
+        return dict(links)
+
+
+def _local_moving(weights):
+
+    """
+    Louvain local moving on a weighted graph: each node joins the neighboring community that raises modularity the
+    most, until no node moves. Nodes are visited in insertion order and ties keep a node where it is, so the same
+    graph always gives the same communities.
+
+    :param weights: {node: {neighbor: weight}}, a self loop holds twice the weight inside an aggregated node
+    :return: {node: community}, communities are named after one of their nodes
+    """
+
+    degree = {node: sum(neighbors.values()) for node, neighbors in weights.items()}
+    two_m = sum(degree.values())
+    labels = {node: node for node in weights}
+    if not two_m:
+        return labels
+    total = dict(degree)  # sum of degrees per community
+    for _ in range(100):
+        moved = False
+        for node, neighbors in weights.items():
+            if not neighbors:
+                continue
+            current = labels[node]
+            total[current] -= degree[node]
+            links = Counter()
+            for neighbor, weight in neighbors.items():
+                if neighbor != node:
+                    links[labels[neighbor]] += weight
+            best, best_gain = current, links.get(current, 0) - total[current] * degree[node] / two_m
+            for label, weight in links.items():
+                gain = weight - total[label] * degree[node] / two_m
+                if gain > best_gain + 1e-9:
+                    best, best_gain = label, gain
+            labels[node] = best
+            total[best] += degree[node]
+            moved = moved or best != current
+        if not moved:
+            break
+    return labels
+
+
+def _aggregate(weights, labels):
+    aggregated = {}
+    for node in weights:
+        aggregated.setdefault(labels[node], {})
+    for node, neighbors in weights.items():
+        for neighbor, weight in neighbors.items():
+            a, b = labels[node], labels[neighbor]
+            aggregated[a][b] = aggregated[a].get(b, 0) + weight
+    return aggregated
@@ -0,0 +1,62 @@
+import hashlib
+import json
+
+from dyagram.cli.routes import VOLATILE_ROUTE_FIELDS
+
+
+SECTIONS = ('layer2', 'routes', 'dynamic_routing_neighbors')
+
+
+def canonical(value):
+
+    """
+    Puts a section into a form that doesn't depend on list order (routes with the same network can come back from
+    the device in any order), so the same content always hashes the same.
+    """
+
+    if isinstance(value, dict):
+        return {k: canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [canonical(i) for i in value]
+        return sorted(items, key=lambda i: json.dumps(i, sort_keys=True))
+    return value
+
+
+def section_hash(value):
+    data = json.dumps(canonical(value), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def section_content(device, section):
+    value = device.get(section)
+    if section == 'routes' and value:
+        # routes in a state saved before volatile fields were dropped at collection still carry them
+        value = [{k: v for k, v in route.items() if k not in VOLATILE_ROUTE_FIELDS} for route in value]
+    return value
+
+
+def device_hashes(device):
+
+    """
+    :param device: device record in state.json shape
+    :return: {"layer2": <sha256>, "routes": <sha256>, "dynamic_routing_neighbors": <sha256>}
+    """
+
+    if device.get('hashes'):
+        return device['hashes']
+    return {section: section_hash(section_content(device, section)) for section in SECTIONS}
+
+
+def add_hashes(state):
+    for device in state['devices']:
+        device['hashes'] = {section: section_hash(section_content(device, section)) for section in SECTIONS}
+    return state
+
+
+def state_fingerprint(state):
+
+    """
+    :return: {inventory_ip: (hostname, hashes)} which is all compare_states needs to tell whether anything changed
+    """
+
+    return {d['inventory_ip']: (d['hostname'], device_hashes(d)) for d in state['devices']}
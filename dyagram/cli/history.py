@@ -0,0 +1,204 @@
+import bisect
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from dyagram.cli import diff as state_diff
+from dyagram.cli.codec import codec_for_format, get_codec
+from dyagram.cli.hashing import SECTIONS, device_hashes
+
+
+class StateHistory:
+
+    """
+    Append-only history of every discovery run of a site, kept under <site>/history/:
+
+    objects/<ab>/<hash>   zlib compressed json of one device section (layer2, routes, ...), named by its content hash
+    runs/<run>.json       manifest of a run: {"run", "time", "devices": {ip: {"hostname", "hashes"}}}
+    runs.jsonl            one {"run", "time"} line per run, in run order
+
+    A section that didn't change between runs has the same hash, so it is stored once no matter how many runs
+    reference it. Manifests only hold hashes, which is all that's needed to tell which devices changed between two
+    runs; section objects are only read for devices that did.
+    """
+
+    def __init__(self, site):
+        self.path = Path(f"{site}/history")
+        self.objects = self.path / "objects"
+        self.runs_path = self.path / "runs"
+        self.index_path = self.path / "runs.jsonl"
+
+    def _object_path(self, section_hash):
+        return self.objects / section_hash[:2] / section_hash
+
+    def put_section(self, section_hash, value):
+        path = self._object_path(section_hash)
+        if path.is_file():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'wb') as file:
+            file.write(zlib.compress(get_codec().dumps(value)))
+        os.replace(tmp, path)  # a reader never sees half an object
+
+    def get_section(self, section_hash):
+        with open(self._object_path(section_hash), 'rb') as file:
+            return codec_for_format("json").loads(zlib.decompress(file.read()))
+
+    def runs(self):
+
+        """
+        :return: [(run, time), ...] oldest first
+        """
+
+        if not self.index_path.is_file():
+            return []
+        with open(self.index_path, 'r') as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        return [(entry['run'], entry['time']) for entry in entries]
+
+    def record(self, state, timestamp=None):
+
+        """
+        Stores a run. Sections already in the store aren't written again.
+
+        :param state: state.json shaped dict, with or without hashes
+        :param timestamp: run time, defaults to now
+        :return: run number
+        """
+
+        timestamp = time.time() if timestamp is None else timestamp
+        runs = self.runs()
+        run = runs[-1][0] + 1 if runs else 1
+
+        devices = {}
+        for device in state['devices']:
+            hashes = device_hashes(device)
+            for section in SECTIONS:
+                self.put_section(hashes[section], device.get(section))
+            devices[device['inventory_ip']] = {"hostname": device['hostname'], "hashes": hashes}
+
+        self.runs_path.mkdir(parents=True, exist_ok=True)
+        with open(self.runs_path / f"{run}.json", 'w') as file:
+            json.dump({"run": run, "time": timestamp, "devices": devices}, file)
+        with open(self.index_path, 'a') as file:
+            file.write(json.dumps({"run": run, "time": timestamp}) + "\n")
+        return run
+
+    def manifest(self, run):
+        with open(self.runs_path / f"{run}.json", 'r') as file:
+            return json.load(file)
+
+    def run_at(self, timestamp):
+
+        """
+        :return: the latest run at or before timestamp, None if there is none
+        """
+
+        runs = self.runs()
+        i = bisect.bisect_right([t for r, t in runs], timestamp)
+        return runs[i - 1][0] if i else None
+
+    def state(self, run, devices=None):
+
+        """
+        Rebuilds the state of a run.
+
+        :param run: run number
+        :param devices: inventory ips to load, None for all
+        :return: state.json shaped dict
+        """
+
+        manifest = self.manifest(run)
+        state = {"devices": []}
+        for ip, entry in manifest['devices'].items():
+            if devices is not None and ip not in devices:
+                continue
+            record = {"hostname": entry['hostname'], "inventory_ip": ip}
+            for section in SECTIONS:
+                record[section] = self.get_section(entry['hashes'][section])
+            record['hashes'] = entry['hashes']
+            state['devices'].append(record)
+        return state
+
+    def state_at(self, timestamp, devices=None):
+        run = self.run_at(timestamp)
+        return None if run is None else self.state(run, devices=devices)
+
+    def diff(self, run_a, run_b):
+
+        """
+        Diffs two runs. Devices whose hostname and section hashes match in both manifests are skipped without
+        reading any of their sections.
+
+        :return: {inventory_ip: {"added", "removed", "changed"}} or None if nothing changed
+        """
+
+        a = self.manifest(run_a)['devices']
+        b = self.manifest(run_b)['devices']
+        changed = {ip for ip in set(a) | set(b) if a.get(ip) != b.get(ip)}
+        if not changed:
+            return None
+        return state_diff.get_state_diff(self.state(run_a, devices=changed), self.state(run_b, devices=changed))
+
+    @staticmethod
+    def parse_time(value):
+
+        """
+        :param value: epoch seconds or an iso date/time, e.g. 2023-03-14T09:30
+        :return: epoch seconds
+        """
+
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+    def list_runs_in_cli(self):
+
+        """
+        cli command: dyagram history
+        :return:
+        """
+
+        runs = self.runs()
+        if not runs:
+            print("No runs recorded for this site yet.")
+        for run, timestamp in runs:
+            print(f"{run:>6}  {datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='seconds')}")
+
+    def diff_in_cli(self, run_a=None, run_b=None):
+
+        """
+        cli command: dyagram history diff [A B], defaults to the last two runs
+        :return:
+        """
+
+        if run_a is None or run_b is None:
+            runs = self.runs()
+            if len(runs) < 2:
+                print("Need at least two runs to diff.")
+                return
+            run_a, run_b = runs[-2][0], runs[-1][0]
+        diffs = self.diff(int(run_a), int(run_b))
+        print(f"Run {run_a} -> run {run_b}\n")
+        if not diffs:
+            print("No changes in state")
+            return
+        state_diff.print_diffs(diffs)
+
+    def state_at_in_cli(self, value):
+
+        """
+        cli command: dyagram history at <time>, prints the state of the last run at or before that time as json
+        :return:
+        """
+
+        run = self.run_at(self.parse_time(value))
+        if run is None:
+            print(f"No run recorded at or before {value}")
+            return
+        print(json.dumps(self.state(run)))
@@ -0,0 +1,93 @@
+import hashlib
+import re
+from pathlib import Path
+
+from dyagram.cli.codec import codec_for_format, get_codec
+
+
+LAST_RUN_FILE = ".last_run.json"  # every device record from the latest run, reused for devices that didn't change
+
+# short commands whose output moves when lldp neighbors come and go or the number of routes from a source changes,
+# per netmiko device type. The route summaries are counts: a next hop or prefix swapped for another one keeps them the
+# same, that change is only picked up by the full poll every refresh_interval.
+SIGNAL_COMMANDS = {
+    "cisco_nxos": ["show lldp neighbors", "show ip route summary vrf all"],
+    "cisco_ios": ["show lldp neighbors", "show ip route summary"],
+    "cisco_xe": ["show lldp neighbors", "show ip route summary"],
+    "cisco_xr": ["show lldp neighbors", "show route summary"],
+}
+DEFAULT_SIGNAL_COMMANDS = ["show lldp neighbors", "show ip route summary"]
+
+# same commands discover_eigrp_neighbors_ssh runs. Only the neighbor addresses go into the signal, every neighbor
+# line carries its uptime and timers.
+EIGRP_SIGNAL_COMMANDS = {
+    "cisco_nxos": "show ip eigrp neighbors vrf all",
+    "cisco_ios": "show ip eigrp neighbors vrf all",
+    "cisco_xr": "show eigrp neighbors",
+}
+IPV4_ADDRESS = re.compile(r'\d+\.\d+\.\d+\.\d+')
+
+# lines that change without the topology changing (clocks, timers)
+VOLATILE_SIGNAL_LINE = re.compile(r'\d+:\d+:\d+|uptime', re.IGNORECASE)
+
+# fields a device record is made of, copied over when a record is reused
+RECORD_FIELDS = ('hostname', 'layer2', 'routes', 'dynamic_routing_neighbors')
+
+
+def change_signal(netmiko_session):
+
+    """
+    Runs the platform's signal commands and hashes their output, minus volatile lines, together with the EIGRP
+    neighbor addresses. Costs a few short commands instead of a full collection. It moves when an lldp or EIGRP
+    neighbor comes or goes or a route count changes, not when a route is swapped for another (see SIGNAL_COMMANDS).
+
+    :param netmiko_session:
+    :return: sha256 hex digest
+    """
+
+    commands = SIGNAL_COMMANDS.get(netmiko_session.device_type, DEFAULT_SIGNAL_COMMANDS)
+    digest = hashlib.sha256()
+    for command in commands:
+        output = netmiko_session.send_command(command)
+        for line in str(output).splitlines():
+            line = line.strip()
+            if line and not VOLATILE_SIGNAL_LINE.search(line):
+                digest.update(line.encode('utf-8'))
+                digest.update(b'\n')
+
+    eigrp_command = EIGRP_SIGNAL_COMMANDS.get(netmiko_session.device_type)
+    if eigrp_command:
+        neighbors = sorted(set(IPV4_ADDRESS.findall(str(netmiko_session.send_command(eigrp_command)))))
+        digest.update(("eigrp " + " ".join(neighbors)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_last_run(site):
+
+    """
+    :return: ({inventory_ip: device record}, {inventory_ip: {"change_signal", "last_polled"}}) from the latest
+             run, both empty if there wasn't one
+    """
+
+    path = Path(f"{site}/{LAST_RUN_FILE}")
+    if not path.is_file():
+        return {}, {}
+    try:
+        with open(path, 'rb') as file:
+            last_run = codec_for_format("json").loads(file.read())
+        return {d['inventory_ip']: d for d in last_run['devices']}, last_run.get('polls', {})
+    except (ValueError, KeyError, OSError):
+        return {}, {}
+
+
+def save_last_run(site, state, polls, codec=None):
+
+    """
+    Records and the signals they were collected under are saved together, so a record is never reused against a
+    signal from a run that didn't finish. Only incremental runs save it.
+
+    :param codec: codec name (see dyagram.cli.codec), None for the fastest installed
+    """
+
+    with open(f"{site}/{LAST_RUN_FILE}", 'wb') as file:
+        file.write(get_codec(codec).dumps({"devices": state['devices'], "polls": polls}))
@@ -0,0 +1,107 @@
+import hashlib
+import math
+
+
+SPACING = 80  # ideal edge length, in svg/Graphviz points
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+
+def _jitter(ip):
+    # stable small offset so devices placed at the same spot can push each other apart
+    digest = hashlib.sha256(ip.encode('utf-8')).digest()
+    return (digest[0] / 255 - 0.5) * SPACING / 4, (digest[1] / 255 - 0.5) * SPACING / 4
+
+
+def _breadth_first(graph, adjacency):
+    order, seen = [], set()
+    for start in sorted(graph.nodes, key=lambda ip: -len(adjacency[ip])):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = [start]
+        for ip in queue:
+            order.append(ip)
+            for neighbor in sorted(adjacency[ip]):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+    return order
+
+
+def layout(graph, previous=None, iterations=40):
+
+    """
+    Force directed layout (Fruchterman-Reingold) of a TopologyGraph. Repulsion is only computed between devices in
+    neighboring grid cells, so an iteration is linear in the number of devices rather than quadratic.
+
+    With the positions of a previous export, devices that were already placed keep their position and only new
+    devices are moved, so re-rendering after a few links changed is quick and the picture stays the same apart from
+    the change.
+
+    :param graph: TopologyGraph
+    :param previous: {inventory ip: [x, y]} from a previous export, None to lay out from scratch
+    :return: {inventory ip: [x, y]}
+    """
+
+    previous = previous or {}
+    adjacency = graph.adjacency()
+    positions = {ip: list(previous[ip]) for ip in graph.nodes if ip in previous}
+
+    new = [ip for ip in graph.nodes if ip not in positions]
+    movable = set(new) if positions else set(graph.nodes)
+    if positions:
+        iterations = iterations // 3 if movable else 0
+
+    # new devices start next to the devices they're linked to. A layout from scratch starts from a sunflower spiral
+    # filled in breadth first order, so linked devices start close together and no grid cell starts crowded.
+    spiral = [] if positions else _breadth_first(graph, adjacency)
+    for n, ip in enumerate(spiral):
+        angle, distance = n * GOLDEN_ANGLE, SPACING * math.sqrt(n)
+        positions[ip] = [distance * math.cos(angle), distance * math.sin(angle)]
+    for ip in new:
+        if ip in positions:
+            continue
+        placed = [positions[neighbor] for neighbor in adjacency[ip] if neighbor in positions]
+        if not placed:  # not linked to anything placed, goes right of everything else
+            placed = [[max((p[0] for p in positions.values()), default=0.0) + SPACING, 0.0]]
+        dx, dy = _jitter(ip)
+        positions[ip] = [sum(p[0] for p in placed) / len(placed) + dx, sum(p[1] for p in placed) / len(placed) + dy]
+
+    k = SPACING
+    cell = 1.5 * k
+    temperature = k * 2
+    for _ in range(iterations):
+        grid = {}
+        for ip, (x, y) in positions.items():
+            grid.setdefault((int(x // cell), int(y // cell)), []).append(ip)
+
+        displacement = {ip: [0.0, 0.0] for ip in movable}
+        for ip in movable:
+            x, y = positions[ip]
+            cx, cy = int(x // cell), int(y // cell)
+            d = displacement[ip]
+            for gx in (cx - 1, cx, cx + 1):
+                for gy in (cy - 1, cy, cy + 1):
+                    for other in grid.get((gx, gy), ()):
+                        if other == ip:
+                            continue
+                        dx, dy = x - positions[other][0], y - positions[other][1]
+                        distance = math.hypot(dx, dy) or 0.01
+                        force = k * k / distance
+                        d[0] += dx / distance * force
+                        d[1] += dy / distance * force
+            for neighbor in adjacency[ip]:
+                dx, dy = x - positions[neighbor][0], y - positions[neighbor][1]
+                distance = math.hypot(dx, dy) or 0.01
+                force = 0.3 * distance * distance / k  # weaker than classic FR, repulsion is cut off at the grid
+                d[0] -= dx / distance * force
+                d[1] -= dy / distance * force
+
+        for ip, (dx, dy) in displacement.items():
+            length = math.hypot(dx, dy) or 0.01
+            step = min(length, temperature)
+            positions[ip][0] += dx / length * step
+            positions[ip][1] += dy / length * step
+        temperature *= 0.93
+
+    return {ip: [round(x, 1), round(y, 1)] for ip, (x, y) in positions.items()}
@@ -0,0 +1,64 @@
+import os
+
+import yaml
+from colorama import Fore
+from tqdm import tqdm
+
+from dyagram.cli.dyagram import Dyagram
+from dyagram.cli.engine import ThreadedEngine
+
+
+class MultiSiteDiscovery:
+
+    """
+    Discovers every site in inventory.yml in one run (cli command: dyagram discover --all-sites).
+
+    All sites share one engine so the worker limit is a budget for the whole run, not per site. Each site keeps its
+    own state (<site>/state.ndjson and its index <site>/state.idx, see dyagram.cli.state) and gets its own diff
+    output (<site>/diff.json).
+    """
+
+    def __init__(self, engine=None, inventory_file=None, verbose=False, **dyagram_kwargs):
+        self.verbose = verbose
+        self.dyagrams = []
+
+        self.inventory_file = inventory_file or "inventory.yml"
+        with open(self.inventory_file, 'r') as file:
+            inventory_object = yaml.safe_load(file)
+
+        for site in inventory_object:
+            if not os.path.isdir(site):
+                print(f'Skipping site "{site}": no site folder. Run "dyagram site new {site}" first.')
+                continue
+            dy = Dyagram(inventory_file=self.inventory_file, verbose=verbose, site=site, **dyagram_kwargs)
+            dy.diff_file = f"{site}/diff.json"
+            self.dyagrams.append(dy)
+
+        self.engine = engine or ThreadedEngine(log=self.dyagrams[0].log if self.dyagrams else None)
+        self.pbar = None
+        self.sites_done = 0
+
+    def _site_done(self, dyagram):
+        dyagram.finish_collection()
+        self.sites_done += 1
+        self.pbar.set_description(f"{self.sites_done}/{len(self.dyagrams)} sites")
+
+    def discover(self):
+        print(f"Discovering {len(self.dyagrams)} sites")
+        self.pbar = tqdm(total=100 * len(self.dyagrams),
+                         bar_format=Fore.LIGHTBLUE_EX + "{l_bar}{bar:20}|") if not self.verbose else tqdm(
+            total=100 * len(self.dyagrams), bar_format="{l_bar}{bar}|", disable=True)
+        for dy in self.dyagrams:
+            dy.pbar = self.pbar
+
+        self.engine.run_many(self.dyagrams, on_done=self._site_done)
+        self.pbar.close()
+
+        for dy in self.dyagrams:
+            print(Fore.LIGHTBLUE_EX + f'\nSite "{dy.site}"' + Fore.RESET)
+            if dy.devices_unable_to_connect:
+                # don't let one unreachable device stop the other sites, just leave this site's state alone
+                dy.print_devices_unable_to_connect()
+                continue
+            dy.update_state()
+            dy.print_changes()
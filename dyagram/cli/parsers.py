@@ -0,0 +1,175 @@
+import io
+import re
+import threading
+
+from ntc_templates.parse import _get_template_dir
+from textfsm import TextFSM, clitable
+
+
+LLDP_NEIGHBORS_DETAIL = "show lldp neighbors detail"
+
+# "show lldp neighbors detail" field labels per platform, each is a "<label>: <value>" line in a neighbor's block.
+# neighbor_port is whatever the ntc-templates TextFSM template used to give: the port description on IOS, the port id
+# everywhere else. Changing it would show every lldp neighbor of the site as changed.
+LLDP_DETAIL_LABELS = {
+    "cisco_xe": {"local_port": "Local Intf", "chassis_id": "Chassis id", "neighbor_port": "Port Description",
+                 "hostname": "System Name", "mgmt_address": "IP"},
+    "cisco_nxos": {"local_port": "Local Port id", "chassis_id": "Chassis id", "neighbor_port": "Port id",
+                   "hostname": "System Name", "mgmt_address": "Management Address"},
+    "cisco_xr": {"local_port": "Local Interface", "chassis_id": "Chassis id", "neighbor_port": "Port id",
+                 "hostname": "System Name", "mgmt_address": "IPv4 address"},
+}
+LLDP_DETAIL_LABELS["cisco_ios"] = LLDP_DETAIL_LABELS["cisco_xe"]
+# platforms that don't print a separator line between neighbors, and the field every neighbor's block starts with
+LLDP_DETAIL_BLOCK_START = {"cisco_nxos": "chassis_id"}
+LLDP_NEIGHBOR_FIELDS = ("hostname", "local_port", "neighbor_port", "chassis_id", "mgmt_address")
+
+# netmiko device type -> ntc-templates platform, where they differ
+TEXTFSM_PLATFORMS = {"cisco_xe": "cisco_ios"}
+
+
+class LldpDetailParser:
+
+    """
+    Parses "show lldp neighbors detail" in one pass: a single regex with one alternative per field label walks the
+    output, and a neighbor's record ends at a separator line, at the field a block starts with (block_start, for
+    platforms without separators) or when a field it already has shows up again. Each neighbor is built from its own
+    block, so a field a neighbor doesn't advertise is left empty instead of shifting every later neighbor's values.
+    """
+
+    name = "lldp-blocks"
+    NOT_ADVERTISED = ("", "not advertised")
+    NO_NEIGHBORS = re.compile(r'^Total entries displayed:\s*0\b', re.MULTILINE)
+
+    def __init__(self, labels, block_start=None):
+        self.block_start = block_start
+        alternatives = [rf'^[ \t]*{re.escape(label)}:[ \t]*(?P<{field}>.*?)[ \t\r]*$'
+                        for field, label in labels.items()]
+        alternatives.append(r'^(?P<separator>-{10,})[ \t\r]*$')
+        self.pattern = re.compile("|".join(alternatives), re.MULTILINE)
+
+    def __call__(self, output):
+        neighbors = []
+        current = {}
+        for match in self.pattern.finditer(output):
+            field = match.lastgroup
+            if field in ("separator", self.block_start) or (field in current and field != "mgmt_address"):
+                if current:
+                    neighbors.append(self._neighbor(current))
+                current = {}
+                if field == "separator":
+                    continue
+            value = match.group(field)
+            if field == "mgmt_address" and ("mgmt_address" in current or value.lower() in self.NOT_ADVERTISED):
+                continue  # first advertised address only
+            current[field] = value
+        if current:
+            neighbors.append(self._neighbor(current))
+
+        neighbors = [n for n in neighbors if n['chassis_id'] or n['hostname']]
+        if not neighbors and not self.NO_NEIGHBORS.search(output):
+            return None  # not this platform's format, the next parser may know it
+        return neighbors
+
+    @staticmethod
+    def _neighbor(fields):
+        return {field: fields.get(field, "") for field in LLDP_NEIGHBOR_FIELDS}
+
+
+class TextFSMParser:
+
+    """
+    Parses with the ntc-templates TextFSM template for a platform and command.
+
+    netmiko's use_textfsm loads the template index, opens the template and compiles it on every send_command. Here
+    the template is looked up once, and each thread keeps its own compiled TextFSM (they hold parsing state) and only
+    resets it between outputs.
+    """
+
+    name = "textfsm"
+
+    def __init__(self, platform, command, normalize=None):
+        self.platform = TEXTFSM_PLATFORMS.get(platform, platform)
+        self.command = command
+        self.normalize = normalize
+        self._template = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def template(self):
+        with self._lock:
+            if self._template is None:
+                template_dir = _get_template_dir()
+                index = clitable.CliTable("index", template_dir).index
+                row = index.GetRowMatch({"Command": self.command, "Platform": self.platform})
+                if not row:
+                    raise ValueError(f"No TextFSM template for {self.command} on {self.platform}")
+                template_file = index.index[row]['Template'].split(":")[0]
+                with open(f"{template_dir}/{template_file}", 'r') as file:
+                    self._template = file.read()
+        return self._template
+
+    def __call__(self, output):
+        fsm = getattr(self._local, 'fsm', None)
+        if fsm is None:
+            fsm = self._local.fsm = TextFSM(io.StringIO(self.template()))
+        fsm.Reset()
+        header = [field.lower() for field in fsm.header]
+        rows = [dict(zip(header, row)) for row in fsm.ParseText(output)]
+        return self.normalize(rows) if self.normalize else rows
+
+
+def lldp_neighbors_from_textfsm(rows):
+    neighbors = []
+    for row in rows:
+        # neighbor_interface is the port description on IOS and the port id on NX-OS, same as LLDP_DETAIL_LABELS
+        neighbors.append({"hostname": row['neighbor'], "local_port": row['local_interface'],
+                          "neighbor_port": row['neighbor_interface'],
+                          "chassis_id": row['chassis_id'],
+                          "mgmt_address": row.get('management_ip') or row.get('mgmt_address') or ""})
+    return neighbors
+
+
+class ParserRegistry:
+
+    """
+    Parsers for command output, keyed by (netmiko device type, command) and tried in the order they were
+    registered: the fast ones first, TextFSM after. Parsers are built once and shared by every device.
+    """
+
+    def __init__(self):
+        self._parsers = {}
+
+    def register(self, platform, command, parser):
+        self._parsers.setdefault((platform, command), []).append(parser)
+
+    def parsers(self, platform, command):
+        return self._parsers.get((platform, command), [])
+
+    def parse(self, platform, command, output):
+
+        """
+        :return: (name of the parser that parsed it, parsed records), (None, None) if none could
+        """
+
+        for parser in self.parsers(platform, command):
+            try:
+                records = parser(output)
+            except Exception:  # a template that doesn't fit this output, the next parser may
+                continue
+            if records is not None:
+                return parser.name, records
+        return None, None
+
+
+def build_registry():
+    registry = ParserRegistry()
+    for platform, labels in LLDP_DETAIL_LABELS.items():
+        registry.register(platform, LLDP_NEIGHBORS_DETAIL, LldpDetailParser(labels, LLDP_DETAIL_BLOCK_START.get(platform)))
+    for platform in ("cisco_ios", "cisco_xe", "cisco_nxos"):
+        registry.register(platform, LLDP_NEIGHBORS_DETAIL,
+                          TextFSMParser(platform, LLDP_NEIGHBORS_DETAIL, normalize=lldp_neighbors_from_textfsm))
+    return registry
+
+
+PARSERS = build_registry()
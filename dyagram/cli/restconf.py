@@ -0,0 +1,44 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RestconfClient:
+
+    """
+    Keep-alive RESTCONF client for one device. Every collector for the device goes through the same pooled
+    connection, so the TLS handshake happens once per run instead of once per query.
+
+    get() takes a path relative to /restconf/data or a full url.
+    """
+
+    headers = {"Accept": "application/yang.data+json"}
+
+    def __init__(self, device, username, password, pool_size=4, timeout=(5, 30), verify=False):
+
+        """
+        :param device: ip or hostname
+        :param pool_size: max connections kept open to the device
+        :param timeout: (connect, read) seconds
+        """
+
+        self.device = device
+        self.timeout = timeout
+        self.base_url = f"https://{device}/restconf/data"
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.auth = (username, password)
+        self.session.headers.update(self.headers)
+        self.session.verify = verify
+
+    def url(self, path):
+        if path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(self.url(path), **kwargs)
+
+    def close(self):
+        self.session.close()
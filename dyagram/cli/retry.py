@@ -0,0 +1,99 @@
+import random
+import time
+
+
+class DeviceUnreachable(Exception):
+    pass
+
+
+class Deadline:
+
+    """
+    Point in time work has to be finished by. A deadline with a parent never runs past the parent's, so a device's
+    time budget is cut short by the run deadline.
+
+    :param seconds: from now, None for no deadline
+    :param parent: Deadline this one can't outlive
+    """
+
+    def __init__(self, seconds=None, parent=None):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        if parent is not None and parent.expires is not None:
+            self.expires = parent.expires if self.expires is None else min(self.expires, parent.expires)
+
+    def remaining(self):
+
+        """
+        :return: seconds left or None when there is no deadline
+        """
+
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+
+class RetryPolicy:
+
+    """
+    Retries a call with exponential backoff and jitter. Waits are base_delay, base_delay * factor, ... capped at
+    max_delay, each spread by +/- jitter so devices that failed together don't all retry together.
+
+    Gives up with DeviceUnreachable once attempts are used up, the deadline would pass before the next attempt or
+    cancelled() says another collector already gave up on the device.
+    """
+
+    def __init__(self, attempts=5, base_delay=1, factor=2, max_delay=16, jitter=0.5):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+
+        """
+        :param attempt: 0 for the wait after the first failure
+        :return: seconds to wait
+        """
+
+        delay = min(self.max_delay, self.base_delay * self.factor ** attempt)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def call(self, fn, deadline=None, cancelled=None, give_up_on=(), on_retry=None):
+
+        """
+        :param fn: callable taking no arguments, a raised exception counts as a failed attempt
+        :param deadline: Deadline to finish by
+        :param cancelled: callable, True stops retrying
+        :param give_up_on: exception types re-raised straight away instead of retried (e.g. bad credentials)
+        :param on_retry: callable(attempt, error) run after each failed attempt, for logging
+        :return: what fn returned
+        """
+
+        error = None
+        for attempt in range(self.attempts):
+            if cancelled and cancelled():
+                raise DeviceUnreachable("another collector gave up on the device") from error
+            if deadline and deadline.expired():
+                raise DeviceUnreachable("time budget used up") from error
+
+            try:
+                return fn()
+            except give_up_on:
+                raise
+            except Exception as e:
+                error = e
+                if on_retry:
+                    on_retry(attempt, e)
+
+            if attempt + 1 == self.attempts:
+                break
+            delay = self.delay(attempt)
+            if deadline and deadline.remaining() is not None and deadline.remaining() < delay:
+                raise DeviceUnreachable("time budget used up") from error
+            time.sleep(delay)
+
+        raise DeviceUnreachable(f"gave up after {self.attempts} attempts") from error
@@ -0,0 +1,344 @@
+import re
+import time
+
+from ntc_templates.parse import parse_output
+
+from dyagram.cli.parsers import TEXTFSM_PLATFORMS
+
+
+VOLATILE_ROUTE_FIELDS = ('uptime',)  # change on every poll without the route changing
+
+# commands run to collect the full route table, per netmiko device type
+ROUTE_COMMAND_PLANS = {
+    # "vrf all" includes the default vrf (as VRF "default") so the global table isn't pulled a second time
+    "cisco_nxos": ["show ip route vrf all"],
+    # IOS/IOS-XE spells it "vrf *" and leaves the global table out of it
+    "cisco_ios": ["show ip route", "show ip route vrf *"],
+    "cisco_xe": ["show ip route", "show ip route vrf *"],
+}
+DEFAULT_ROUTE_COMMAND_PLAN = ["show ip route vrf all", "show ip route"]
+
+# start of each vrf's section in the output, used to parse the output one vrf at a time when streaming
+ROUTE_SECTION_MARKERS = {
+    "cisco_nxos": re.compile(r'^IP Route Table for VRF "', re.MULTILINE),
+}
+
+# header of each vrf's table in "show ip route vrf *", the IOS TextFSM template parses the routes but not the vrf
+ROUTE_VRF_HEADERS = {
+    "cisco_ios": re.compile(r'^Routing Table: (?P<vrf>\S+)', re.MULTILINE),
+}
+ROUTE_VRF_HEADERS["cisco_xe"] = ROUTE_VRF_HEADERS["cisco_ios"]
+DEFAULT_VRF_NAMES = ("default", "global", "default-vrf")
+
+
+# RESTCONF route sources, tried in order. ietf-routing first, the openconfig AFT has no route type (IA, E2, L1...)
+RESTCONF_ROUTE_PATHS = [
+    ("ietf", "ietf-routing:routing-state/routing-instance"),
+    ("openconfig", "openconfig-network-instance:network-instances"),
+]
+
+# yang protocol names to the route codes "show ip route" prints, so RESTCONF routes compare equal to SSH routes
+ROUTE_PROTOCOL_CODES = {
+    "connected": "C", "directly_connected": "C", "direct": "C",
+    "local": "L", "local-aggregate": "L",
+    "static": "S",
+    "ospf": "O", "ospfv2": "O", "ospfv3": "O",
+    "eigrp": "D",
+    "bgp": "B",
+    "rip": "R",
+    "isis": "i",
+}
+
+# ietf-ospf and ietf-isis route types to the type "show ip route" prints after the route code
+ROUTE_TYPE_CODES = {
+    "intra-area": "", "inter-area": "IA",
+    "external-1": "E1", "external-2": "E2",
+    "nssa-1": "N1", "nssa-2": "N2",
+    "l1-intra-area": "L1", "l1-external": "L1",
+    "l2-intra-area": "L2", "l2-external": "L2",
+    "l1-inter-area": "ia", "l1-inter-area-external": "ia",
+}
+
+# routes "show ip route" prints without [distance/metric]
+ROUTE_PROTOCOLS_WITHOUT_METRIC = ("C", "L")
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(i) for i in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def route_identity(route):
+    identity = tuple(sorted(route.items()))
+    try:
+        hash(identity)
+    except TypeError:
+        # some templates return lists (e.g. multiple next hops)
+        identity = tuple(sorted((k, _hashable(v)) for k, v in route.items()))
+    return identity
+
+
+def normalize_routes(*route_tables):
+
+    """
+    Merges parsed route tables into one list. Volatile fields are dropped and duplicate routes (e.g. the global
+    table showing up in both "show ip route" and "show ip route vrf all") are removed in one hashed pass, keeping
+    the order routes were first seen in.
+
+    :param route_tables: lists (or iterables) of route dicts from textfsm. A str means textfsm couldn't parse the
+                         output and is skipped
+    :return: list of route dicts
+    """
+
+    seen = set()
+    routes = []
+    for table in route_tables:
+        if isinstance(table, str):
+            continue
+        for route in table:
+            route = {k: v for k, v in route.items() if k not in VOLATILE_ROUTE_FIELDS}
+            identity = route_identity(route)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            routes.append(route)
+    return routes
+
+
+def route_command_plan(device_type):
+    return ROUTE_COMMAND_PLANS.get(device_type, DEFAULT_ROUTE_COMMAND_PLAN)
+
+
+def with_vrf(route, vrf):
+    # vrf is only set outside the default table, the global table has none on IOS
+    if vrf and vrf.lower() not in DEFAULT_VRF_NAMES:
+        return {"vrf": vrf, **route}
+    return route
+
+
+def parse_vrf_routes(platform, command, output):
+
+    """
+    Parses IOS/IOS-XE route output one "Routing Table: <vrf>" section at a time and sets each route's vrf, which the
+    TextFSM template doesn't capture. Output before the first header (all of it for "show ip route") is the global
+    table.
+
+    :return: list of route dicts, same fields as send_command(command, use_textfsm=True) plus vrf
+    """
+
+    textfsm_platform = TEXTFSM_PLATFORMS.get(platform, platform)
+    headers = list(ROUTE_VRF_HEADERS[platform].finditer(output))
+    sections = [(None, 0)] + [(header.group('vrf'), header.start()) for header in headers]
+    routes = []
+    for (vrf, start), (_, end) in zip(sections, sections[1:] + [(None, len(output))]):
+        if not output[start:end].strip():
+            continue
+        for route in parse_output(platform=textfsm_platform, command=command, data=output[start:end]):
+            routes.append(with_vrf(route, vrf))
+    return routes
+
+
+def read_command_chunks(netmiko_session, command, read_timeout=120):
+
+    """
+    Sends a command and yields its output as it arrives, instead of waiting for the whole output as one string.
+
+    :return: generator of str chunks, the echoed command and trailing prompt included
+    """
+
+    prompt = re.compile(re.escape(netmiko_session.base_prompt) + r'[^\n]*[#>]\s*$')
+    netmiko_session.clear_buffer()
+    netmiko_session.write_channel(netmiko_session.normalize_cmd(command))
+
+    tail = ""
+    deadline = time.time() + read_timeout
+    while time.time() < deadline:
+        chunk = netmiko_session.read_channel()
+        if not chunk:
+            time.sleep(0.05)
+            continue
+        yield chunk
+        tail = (tail + chunk)[-256:]
+        if prompt.search(tail):
+            return
+    raise TimeoutError(f"Timed out reading output of {command}")
+
+
+def stream_parse_routes(netmiko_session, command, read_timeout=120):
+
+    """
+    Parses a route table one vrf section at a time as the output is read, so only one vrf's worth of text is held
+    at once. Only platforms in ROUTE_SECTION_MARKERS can be split this way, output without any marker is parsed
+    in one piece once it has all been read.
+
+    :return: generator of route dicts, same fields as send_command(command, use_textfsm=True)
+    """
+
+    platform = netmiko_session.device_type
+    marker = ROUTE_SECTION_MARKERS[platform]
+    buffer = ""
+    started = False
+    for chunk in read_command_chunks(netmiko_session, command, read_timeout=read_timeout):
+        buffer += chunk
+        if not started:
+            start = marker.search(buffer)
+            if not start:
+                continue
+            buffer = buffer[start.start():]  # drop the echoed command
+            started = True
+
+        # everything before the latest complete section marker belongs to finished sections
+        next_section = None
+        for next_section in marker.finditer(buffer, 1):
+            pass
+        if next_section:
+            yield from parse_output(platform=platform, command=command, data=buffer[:next_section.start()])
+            buffer = buffer[next_section.start():]
+
+    if not started:
+        # no section marker anywhere in the output: parse it whole, the way send_command(use_textfsm=True) would,
+        # rather than reporting a device with no routes
+        buffer = buffer.split(command, 1)[-1]  # drop the echoed command
+    lines = buffer.splitlines()
+    if lines and netmiko_session.base_prompt in lines[-1]:
+        lines = lines[:-1]  # trailing prompt
+    if any(line.strip() for line in lines):
+        yield from parse_output(platform=platform, command=command, data="\n".join(lines) + "\n")
+
+
+def collect_routes(netmiko_session, stream=False):
+
+    """
+    Runs the platform's route command plan and returns the normalized route table.
+
+    :param netmiko_session:
+    :param stream: parse the output per vrf while it's read where the platform supports it
+    :return: list of route dicts
+    """
+
+    tables = []
+    for command in route_command_plan(netmiko_session.device_type):
+        if stream and netmiko_session.device_type in ROUTE_SECTION_MARKERS:
+            tables.append(stream_parse_routes(netmiko_session, command))
+        elif netmiko_session.device_type in ROUTE_VRF_HEADERS:
+            output = netmiko_session.send_command(command)
+            tables.append(parse_vrf_routes(netmiko_session.device_type, command, output))
+        else:
+            tables.append(netmiko_session.send_command(command, use_textfsm=True))
+    return normalize_routes(*tables)
+
+
+def _yang_name(value):
+    # identityrefs come back module qualified, e.g. "openconfig-policy-types:STATIC" or "ietf-routing:static"
+    return str(value or "").split(":")[-1].lower()
+
+
+def restconf_route(protocol, prefix, next_hop="", interface="", distance="", metric="", vrf=None, route_type=""):
+
+    """
+    Builds a route dict with the fields textfsm returns for "show ip route", so routes collected over RESTCONF
+    and over SSH look the same in the state. route_type is the ietf-ospf/ietf-isis route-type, stored as the type
+    code IOS prints (IA, E2, L1...).
+    """
+
+    network, _, mask = prefix.partition("/")
+    protocol = ROUTE_PROTOCOL_CODES.get(_yang_name(protocol), _yang_name(protocol))
+    if protocol in ROUTE_PROTOCOLS_WITHOUT_METRIC:
+        distance = metric = ""
+    route = {"protocol": protocol,
+             "type": ROUTE_TYPE_CODES.get(_yang_name(route_type), ""),
+             "network": network,
+             "mask": mask,
+             "distance": "" if distance is None else str(distance),
+             "metric": "" if metric is None else str(metric),
+             "nexthop_ip": next_hop or "",
+             "nexthop_if": interface or ""}
+    return with_vrf(route, vrf)
+
+
+def routes_from_openconfig(data):
+
+    """
+    Reads the ipv4-unicast AFT of every network instance from openconfig-network-instance. Handles both AFT
+    layouts: next hops listed per entry and next hops referenced through a next-hop-group. The AFT doesn't say
+    which kind of OSPF/IS-IS route an entry is, so type is left empty.
+
+    :return: list of route dicts, empty if the device has no AFT data
+    """
+
+    routes = []
+    instances = data.get("openconfig-network-instance:network-instances", data.get("network-instances", {}))
+    for instance in instances.get("network-instance", []):
+        afts = instance.get("afts", {})
+        next_hops = {nh.get("index"): nh for nh in afts.get("next-hops", {}).get("next-hop", [])}
+        groups = {g.get("id"): [nh.get("index") for nh in g.get("next-hops", {}).get("next-hop", [])]
+                  for g in afts.get("next-hop-groups", {}).get("next-hop-group", [])}
+
+        for entry in afts.get("ipv4-unicast", {}).get("ipv4-entry", []):
+            state = entry.get("state", {})
+            entry_next_hops = entry.get("next-hops", {}).get("next-hop", [])
+            if not entry_next_hops:
+                entry_next_hops = [next_hops[i] for i in groups.get(state.get("next-hop-group"), [])
+                                   if i in next_hops]
+            for nh in entry_next_hops or [{}]:
+                interface = nh.get("interface-ref", {}).get("state", {}).get("interface")
+                routes.append(restconf_route(state.get("origin-protocol"), entry.get("prefix", state.get("prefix", "")),
+                                             next_hop=nh.get("state", {}).get("ip-address"),
+                                             interface=interface,
+                                             distance=state.get("distance", state.get("preference", "")),
+                                             metric=state.get("metric", ""),
+                                             vrf=instance.get("name")))
+    return routes
+
+
+def routes_from_ietf(data):
+
+    """
+    Reads the ipv4 ribs of ietf-routing routing-state (IOS-XE 16.x and later). The route type comes from the
+    route-type leaf ietf-ospf and ietf-isis add to their routes.
+
+    :return: list of route dicts
+    """
+
+    routes = []
+    instances = data.get("ietf-routing:routing-instance", data.get("routing-instance", []))
+    for instance in instances:
+        for rib in instance.get("ribs", {}).get("rib", []):
+            if "ipv6" in _yang_name(rib.get("address-family")):
+                continue
+            for route in rib.get("routes", {}).get("route", []):
+                next_hop = route.get("next-hop", {})
+                route_type = next((v for k, v in route.items() if k.split(":")[-1] == "route-type"), "")
+                routes.append(restconf_route(route.get("source-protocol"), route.get("destination-prefix", ""),
+                                             next_hop=next_hop.get("next-hop-address"),
+                                             interface=next_hop.get("outgoing-interface"),
+                                             distance=route.get("route-preference", ""),
+                                             metric=route.get("metric", ""),
+                                             vrf=instance.get("name"),
+                                             route_type=route_type))
+    return routes
+
+
+def collect_routes_restconf(restconf_client, model=None):
+
+    """
+    Pulls the route table with a single RESTCONF fetch, trying OpenConfig AFT first and then ietf-routing.
+
+    :param restconf_client: RestconfClient
+    :param model: model that answered last time for this device, tried first
+    :return: (model, list of route dicts normalized like collect_routes) or (None, None) if no model answered
+    """
+
+    parsers = {"openconfig": routes_from_openconfig, "ietf": routes_from_ietf}
+    paths = sorted(RESTCONF_ROUTE_PATHS, key=lambda p: p[0] != model)
+    for name, path in paths:
+        resp = restconf_client.get(path)
+        if resp.status_code != 200:
+            continue
+        routes = parsers[name](resp.json())
+        if routes:
+            return name, normalize_routes(routes)
+    return None, None
@@ -0,0 +1,154 @@
+import threading
+import traceback
+
+from netmiko import NetmikoAuthenticationException
+
+from dyagram.cli.retry import Deadline
+
+
+class DeviceSession:
+
+    """
+    Holds the connections to a single device for the length of one discovery run so every collector
+    (lldp, routes, dynamic routing neighbors) shares one SSH login and one RESTCONF connection pool instead of
+    opening its own.
+
+    Connections are created the first time a collector asks for them and torn down by close(). Once a collector
+    marks the device unreachable the others stop trying to connect to it.
+    """
+
+    def __init__(self, device, connect_ssh, connect_restconf=None, log=None, deadline=None):
+        self.device = device
+        self.device_type = None
+        self.unreachable = False
+        self.deadline = deadline or Deadline()  # time budget for this device, retries stop once it passes
+        self.lock = threading.RLock()
+        self.log = log
+        self._connect_ssh = connect_ssh
+        self._connect_restconf = connect_restconf
+        self._ssh = None
+        self._restconf = None
+
+    def ssh(self):
+
+        """
+        Returns the netmiko session for this device, logging in on first use.
+
+        :return: netmiko connection or None if the device can't be reached
+        """
+
+        with self.lock:
+            if self._ssh is not None and not self.ssh_alive():
+                # kept open between polls (watch mode) and closed by the device in the meantime
+                if self.log:
+                    self.log.info(f"DEVICE: {self.device} - SSH : SESSION DROPPED, LOGGING IN AGAIN")
+                self._disconnect_ssh()
+            if self._ssh is None and not self.unreachable:
+                try:
+                    self._ssh = self._connect_ssh(self.device)
+                except NetmikoAuthenticationException:
+                    if self.log:
+                        self.log.info(f"DEVICE: {self.device} - SSH : AUTHENTICATION FAILED")
+                    self._ssh = None
+                if self._ssh is None:
+                    self.unreachable = True
+                else:
+                    self.device_type = self._ssh.device_type
+            return self._ssh
+
+    def ssh_alive(self):
+
+        """
+        :return: False if the SSH session was opened and has since dropped, True otherwise
+        """
+
+        if self._ssh is None:
+            return True
+        try:
+            return self._ssh.is_alive()
+        except:
+            return False
+
+    def mark_unreachable(self):
+        self.unreachable = True
+
+    def restconf(self):
+
+        """
+        Returns the RESTCONF client for this device, created on first use.
+
+        :return: RestconfClient
+        """
+
+        with self.lock:
+            if self._restconf is None:
+                self._restconf = self._connect_restconf(self.device)
+            return self._restconf
+
+    def close(self):
+        with self.lock:
+            if self._restconf is not None:
+                self._restconf.close()
+                self._restconf = None
+            self._disconnect_ssh()
+
+    def _disconnect_ssh(self):
+        if self._ssh is not None:
+            try:
+                self._ssh.disconnect()
+            except:
+                tb = " ".join(line.strip() for line in traceback.format_exc().splitlines())
+                if self.log:
+                    self.log.info(f"DEVICE: {self.device} - SSH : ERROR DISCONNECTING - {tb}")
+            self._ssh = None
+
+
+class SessionBroker:
+
+    """
+    Hands out one DeviceSession per device. Collectors running for the same device get the same session.
+
+    :param budget: seconds each device gets from its first collector on, None for no limit
+    :param deadline: run Deadline no device budget can outlast
+    """
+
+    def __init__(self, connect_ssh, connect_restconf=None, log=None, budget=None, deadline=None):
+        self._connect_ssh = connect_ssh
+        self._connect_restconf = connect_restconf
+        self.log = log
+        self.budget = budget
+        self.deadline = deadline
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, device):
+        with self._lock:
+            if device not in self._sessions:
+                self._sessions[device] = DeviceSession(device, self._connect_ssh,
+                                                       connect_restconf=self._connect_restconf, log=self.log,
+                                                       deadline=Deadline(self.budget, parent=self.deadline))
+            return self._sessions[device]
+
+    def renew(self, device):
+
+        """
+        Starts a new time budget for a device whose session is kept open between polls (watch mode).
+        """
+
+        with self._lock:
+            session = self._sessions.get(device)
+        if session:
+            session.deadline = Deadline(self.budget, parent=self.deadline)
+
+    def release(self, device):
+        with self._lock:
+            session = self._sessions.pop(device, None)
+        if session:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
@@ -0,0 +1,196 @@
+import mmap
+import os
+from pathlib import Path
+
+from dyagram.cli.codec import codec_for_format, get_codec
+from dyagram.cli.hashing import device_hashes
+
+
+STATE_JSON = "state.json"  # legacy: the whole topology as one json document
+STATE_NDJSON = "state.ndjson"  # one device record per line
+STATE_INDEX = "state.idx"  # inventory ip -> byte offset/length of its line in state.ndjson, hostname and hashes
+
+STATE_FORMATS = ("ndjson", "json")
+
+
+def state_exists(site):
+    return Path(f"{site}/{STATE_NDJSON}").is_file() or Path(f"{site}/{STATE_JSON}").is_file()
+
+
+def write_state(site, state, state_format="ndjson", codec=None):
+
+    """
+    Saves a site's state.
+
+    ndjson writes state.ndjson (a device record per line) and state.idx, which holds every device's byte offset and
+    length plus its hostname and section hashes, so comparing states never has to read state.ndjson and a diff only
+    reads the lines of the devices that changed.
+
+    :param site:
+    :param state: state.json shaped dict
+    :param state_format: "ndjson" or "json" (legacy state.json)
+    :param codec: name of the codec records are serialized with (see dyagram.cli.codec), None for the fastest
+    :return:
+    """
+
+    codec = get_codec(codec)
+    if state_format == "json":
+        with open(f"{site}/{STATE_JSON}", 'wb') as file:
+            file.write(codec.dumps(state))
+        return
+
+    index = {}
+    data_path = Path(f"{site}/{STATE_NDJSON}")
+    index_path = Path(f"{site}/{STATE_INDEX}")
+    data_tmp, index_tmp = Path(f"{data_path}.tmp"), Path(f"{index_path}.tmp")
+    with open(data_tmp, 'wb') as file:
+        for device in state['devices']:
+            line = codec.dumps(device) + b"\n"
+            index[device['inventory_ip']] = {"offset": file.tell(), "length": len(line) - 1,
+                                             "hostname": device['hostname'], "hashes": device_hashes(device)}
+            file.write(line)
+    with open(index_tmp, 'wb') as file:
+        file.write(codec.dumps({"format": codec.format, "codec": codec.name, "devices": index}))
+
+    os.replace(data_tmp, data_path)
+    os.replace(index_tmp, index_path)
+    if Path(f"{site}/{STATE_JSON}").is_file():
+        os.remove(f"{site}/{STATE_JSON}")  # only one state on record per site
+
+
+class StateReader:
+
+    """
+    Reads a site's state on record in whichever format it was saved: state.ndjson + state.idx, or the legacy
+    state.json.
+
+    With ndjson, fingerprint() only reads the index, and device()/devices() read single lines through mmap, so memory
+    stays flat however big the site's route tables get. The legacy file has to be loaded whole; it's loaded once and
+    served from memory after that.
+    """
+
+    def __init__(self, site):
+        self.site = site
+        self.format = "ndjson" if Path(f"{site}/{STATE_NDJSON}").is_file() else "json"
+        self._index = None
+        self._legacy = None
+        self._file = None
+        self._mmap = None
+        self.codec = codec_for_format("json")  # replaced by the format recorded in state.idx once it's read
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _load_legacy(self):
+        if self._legacy is None:
+            with open(f"{self.site}/{STATE_JSON}", 'rb') as file:
+                state = self.codec.loads(file.read())
+            self._legacy = {d['inventory_ip']: d for d in state['devices']}
+        return self._legacy
+
+    def index(self):
+
+        """
+        :return: {inventory_ip: {"offset", "length", "hostname", "hashes"}}, offsets are None for legacy state.json
+        """
+
+        if self._index is None:
+            if self.format == "ndjson":
+                with open(f"{self.site}/{STATE_INDEX}", 'rb') as file:
+                    index = self.codec.loads(file.read())
+                self.codec = codec_for_format(index.get('format', "json"))
+                self._index = index['devices']
+            else:
+                self._index = {ip: {"offset": None, "length": None, "hostname": d['hostname'],
+                                    "hashes": device_hashes(d)} for ip, d in self._load_legacy().items()}
+        return self._index
+
+    def fingerprint(self):
+
+        """
+        :return: {inventory_ip: (hostname, hashes)}, same as hashing.state_fingerprint
+        """
+
+        return {ip: (entry['hostname'], entry['hashes']) for ip, entry in self.index().items()}
+
+    def _read_line(self, offset, length):
+        if self._mmap is None:
+            self._file = open(f"{self.site}/{STATE_NDJSON}", 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.codec.loads(self._mmap[offset:offset + length])
+
+    def device(self, inventory_ip):
+
+        """
+        :return: one device record or None if the device isn't in the state
+        """
+
+        if self.format == "json":
+            return self._load_legacy().get(inventory_ip)
+        entry = self.index().get(inventory_ip)
+        return self._read_line(entry['offset'], entry['length']) if entry else None
+
+    def devices(self, inventory_ips=None):
+
+        """
+        :param inventory_ips: devices to read, None for all of them
+        :return: generator of device records, in file order
+        """
+
+        if self.format == "json":
+            for ip, device in self._load_legacy().items():
+                if inventory_ips is None or ip in inventory_ips:
+                    yield device
+            return
+
+        if inventory_ips is None:
+            self.index()  # picks the codec
+            with open(f"{self.site}/{STATE_NDJSON}", 'rb') as file:
+                for line in file:
+                    if line.strip():
+                        yield self.codec.loads(line)
+            return
+
+        entries = sorted((e for ip, e in self.index().items() if ip in inventory_ips), key=lambda e: e['offset'])
+        for entry in entries:
+            yield self._read_line(entry['offset'], entry['length'])
+
+    def load(self):
+
+        """
+        :return: the whole state as a state.json shaped dict
+        """
+
+        return {"devices": list(self.devices())}
+
+
+def migrate_state(site, state_format="ndjson", codec=None):
+
+    """
+    Rewrites a site's state on record in another format/codec, e.g. a legacy state.json to state.ndjson.
+
+    :return: format the state was in before, None if the site has no state
+    """
+
+    if not state_exists(site):
+        return None
+    with StateReader(site) as reader:
+        previous_format = reader.format
+        state = reader.load()
+    write_state(site, state, state_format=state_format, codec=codec)
+    if state_format == "json":
+        for name in (STATE_NDJSON, STATE_INDEX):
+            if Path(f"{site}/{name}").is_file():
+                os.remove(f"{site}/{name}")
+    return previous_format
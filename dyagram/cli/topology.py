@@ -0,0 +1,107 @@
+import threading
+
+
+class Topology:
+
+    """
+    Devices discovered during a run, indexed by inventory ip, hostname and chassis id so collectors can write their
+    results back in constant time. All writes go through a lock since collectors for many devices run at once.
+
+    Only converted to the state.json shape ({"devices": [...]}) by to_dict() when the run is saved or compared.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._devices = {}  # inventory ip -> device record, keeps discovery order
+        self._by_hostname = {}
+        self._by_chassis_id = {}
+
+    @staticmethod
+    def new_device_record(inventory_ip):
+        return {'hostname': "", 'inventory_ip': inventory_ip, 'layer2': {}, 'routes': [],
+                'dynamic_routing_neighbors': {}}
+
+    @classmethod
+    def from_dict(cls, state):
+        topology = cls()
+        for device in state['devices']:
+            topology.add_device(device['inventory_ip'], record=device)
+        return topology
+
+    def add_device(self, inventory_ip, record=None):
+        with self._lock:
+            if inventory_ip not in self._devices:
+                self._devices[inventory_ip] = record or self.new_device_record(inventory_ip)
+                self._index(self._devices[inventory_ip])
+            return self._devices[inventory_ip]
+
+    def reset(self, inventory_ip, record=None):
+
+        """
+        Swaps a device's record for an empty one (or the given record), so a re-poll starts from scratch.
+
+        :return: the record that was replaced, None if the device wasn't known
+        """
+
+        with self._lock:
+            previous = self._devices.get(inventory_ip)
+            if previous:
+                self._unindex(previous)
+            self._devices[inventory_ip] = record or self.new_device_record(inventory_ip)
+            self._index(self._devices[inventory_ip])
+            return previous
+
+    def update(self, inventory_ip, **fields):
+
+        """
+        Sets top level fields (hostname, layer2, routes, ...) on a device record.
+
+        :param inventory_ip:
+        :param fields:
+        :return:
+        """
+
+        with self._lock:
+            record = self.add_device(inventory_ip)
+            self._unindex(record)
+            record.update(fields)
+            self._index(record)
+
+    def set_routing_neighbors(self, inventory_ip, protocol, neighbors):
+        with self._lock:
+            self.add_device(inventory_ip)['dynamic_routing_neighbors'][protocol] = neighbors
+
+    def get(self, inventory_ip):
+        return self._devices.get(inventory_ip)
+
+    def get_by_hostname(self, hostname):
+        return self._by_hostname.get(hostname.lower()) if hostname else None
+
+    def get_by_chassis_id(self, chassis_id):
+        return self._by_chassis_id.get(chassis_id)
+
+    def to_dict(self):
+        with self._lock:
+            return {"devices": list(self._devices.values())}
+
+    def _index(self, record):
+        if record['hostname']:
+            self._by_hostname[record['hostname'].lower()] = record
+        for chassis_id in record['layer2'].get('chassis_ids') or []:
+            self._by_chassis_id[chassis_id] = record
+
+    def _unindex(self, record):
+        if record['hostname']:
+            self._by_hostname.pop(record['hostname'].lower(), None)
+        for chassis_id in record['layer2'].get('chassis_ids') or []:
+            self._by_chassis_id.pop(chassis_id, None)
+
+    def __contains__(self, inventory_ip):
+        return inventory_ip in self._devices
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._devices.values()))
@@ -0,0 +1,71 @@
+COLLECTORS = ("lldp", "routes", "eigrp")
+
+
+class TransportCache:
+
+    """
+    Remembers, per device, which transport each collector got its data over so the next run goes straight to the
+    one that works instead of waiting for RESTCONF to fail on SSH only devices. Backed by the site's DeviceCache:
+
+    "restconf"          - False once the device refused/timed out a RESTCONF connection
+    "restconf_<name>"   - YANG model that answered for the collector, False if none did
+
+    The ssh platform is the "device_type" entry get_device_type already caches.
+
+    Negative entries expire after reprobe_interval seconds so RESTCONF gets tried again once it may have been
+    enabled. Positive entries never expire, a failure on them is recorded like any other.
+    """
+
+    REPROBE_INTERVAL = 60 * 60 * 24  # seconds before a device that didn't answer RESTCONF is tried again
+
+    def __init__(self, device_cache, reprobe_interval=None):
+        self.device_cache = device_cache
+        self.reprobe_interval = self.REPROBE_INTERVAL if reprobe_interval is None else reprobe_interval
+
+    def _get(self, device, key):
+        value = self.device_cache.get(device, key)
+        if value is False and self.device_cache.get(device, key, ttl=self.reprobe_interval) is None:
+            return None  # negative entry is due for a re-probe
+        return value
+
+    def use_restconf(self, device, collector):
+
+        """
+        :param device: inventory ip
+        :param collector: "lldp", "routes", "eigrp"
+        :return: False if RESTCONF is known not to work for this device/collector, True otherwise
+        """
+
+        if self._get(device, "restconf") is False:
+            return False
+        return self._get(device, f"restconf_{collector}") is not False
+
+    def uses_ssh(self, device):
+
+        """
+        :return: True if at least one collector is known to go over SSH for this device, False while RESTCONF may
+                 still serve all of them (including devices nothing is cached for yet)
+        """
+
+        return not all(self.use_restconf(device, collector) for collector in COLLECTORS)
+
+    def restconf_model(self, device, collector):
+
+        """
+        :return: the YANG model that answered last time or None
+        """
+
+        return self._get(device, f"restconf_{collector}") or None
+
+    def restconf_answered(self, device, collector, model=True):
+        if self.device_cache.get(device, "restconf") is not True:
+            self.device_cache.set(device, "restconf", True)
+        if self.device_cache.get(device, f"restconf_{collector}") != model:
+            self.device_cache.set(device, f"restconf_{collector}", model)
+
+    def restconf_unsupported(self, device, collector):
+        # the device talks RESTCONF but no model we know of answered for this collector
+        self.device_cache.set(device, f"restconf_{collector}", False)
+
+    def restconf_unreachable(self, device):
+        self.device_cache.set(device, "restconf", False)
@@ -0,0 +1,157 @@
+import heapq
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from colorama import Fore
+from tqdm import tqdm
+
+from dyagram.cli import diff as state_diff
+from dyagram.cli.dyagram import Dyagram
+from dyagram.cli.state import StateReader
+from dyagram.cli.topology import Topology
+
+
+class Watcher:
+
+    """
+    Long running discovery for one site (cli command: dyagram watch).
+
+    One Dyagram instance lives for the whole process, so inventory, device type/transport caches and device sessions
+    stay warm between polls. Every device is polled on its own interval (inventory.yml "interval" or the default),
+    spread out with jitter so devices don't all come due together. Each time a device's record changes, the diff
+    (same as discover prints) is printed and appended as one json line to <site>/events.jsonl.
+
+    The first poll of each device is compared against the site's state on record when there is one.
+    """
+
+    def __init__(self, interval=300, jitter=0.1, workers=30, inventory_file=None, verbose=False, **dyagram_kwargs):
+
+        """
+        :param interval: default seconds between polls of a device
+        :param jitter: fraction each interval is randomly stretched or shrunk by
+        :param workers: devices polled at once
+        """
+
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = workers
+        self.dyagram = Dyagram(inventory_file=inventory_file, verbose=verbose, **dyagram_kwargs)
+        self.dyagram.keep_sessions = True
+        self.dyagram.pbar = tqdm(total=100, disable=True)  # collectors report progress, nothing to show here
+        self.log = self.dyagram.log
+        self.events_file = f"{self.dyagram.site}/events.jsonl"
+        self._schedule = []  # heap of (due time, device)
+
+        if self.dyagram.state_exists:
+            with StateReader(self.dyagram.site) as reader:
+                self.dyagram.topology = Topology.from_dict(reader.load())
+
+    def device_interval(self, device):
+        return self.dyagram.inventory_intervals.get(device, self.interval)
+
+    def schedule(self, device, delay):
+        spread = delay * self.jitter
+        heapq.heappush(self._schedule, (time.monotonic() + delay + random.uniform(-spread, spread), device))
+
+    def _schedule_new_devices(self):
+        # inventory devices on start up, crawled neighbors as they are found
+        device = self.dyagram.next_device()
+        while device:
+            self.schedule(device, random.uniform(0, self.device_interval(device) * self.jitter))
+            device = self.dyagram.next_device()
+
+    def poll(self, device):
+
+        """
+        Re-discovers one device on its warm session and returns the diff against its previous record.
+
+        :return: {"added": [...], "removed": [...], "changed": [...]}, empty if nothing changed, None if unreachable
+        """
+
+        dy = self.dyagram
+        dy.sessions.renew(device)
+        session = dy.sessions.get(device)
+        previous = dy.topology.reset(device)
+        dy.discover_device(device)
+
+        # collectors log and swallow their errors, so a session that dropped mid poll shows up as a record without
+        # a hostname or a dead session rather than as an unreachable device
+        record = dy.topology.get(device) or {}
+        if device in dy.devices_unable_to_connect or not record.get('hostname') or not session.ssh_alive():
+            self.log.info(f"DEVICE: {device} - WATCH : POLL FAILED, KEEPING PREVIOUS RECORD")
+            dy.devices_unable_to_connect = [d for d in dy.devices_unable_to_connect if d != device]
+            dy.sessions.release(device)  # log in from scratch next time
+            dy.topology.reset(device, record=previous)
+            return None
+
+        previous_state = {"devices": [previous]} if previous and previous['hostname'] else {"devices": []}
+        current_state = {"devices": [dy.topology.get(device)]}
+        diffs = dy.get_state_diff(previous_state, current_state, log=self.log) or {}
+        return diffs.get(device, {})
+
+    def emit(self, device, diff):
+        record = self.dyagram.topology.get(device) or {}
+        event = {"time": time.time(), "site": self.dyagram.site, "device": device,
+                 "hostname": record.get('hostname', ""),
+                 "event": "unreachable" if diff is None else "changed"}
+        if diff:
+            event.update(diff)
+
+        with open(self.events_file, 'a') as file:
+            file.write(json.dumps(event) + "\n")
+
+        if diff is None:
+            print(Fore.RED + f"{device} unreachable" + Fore.RESET)
+            return
+        state_diff.print_diffs({device: diff}, hostnames={device: event['hostname']}, compact=True)
+
+    def run(self, max_polls=None):
+
+        """
+        Polls devices as they come due until interrupted.
+
+        :param max_polls: stop after this many polls, None to run forever
+        :return:
+        """
+
+        print(f'Watching site "{self.dyagram.site}" (events: {self.events_file})')
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = {}  # future -> device
+        polls = 0
+        try:
+            self._schedule_new_devices()
+            while max_polls is None or polls < max_polls or pending:
+                now = time.monotonic()
+                while self._schedule and self._schedule[0][0] <= now and len(pending) < self.workers and \
+                        (max_polls is None or polls < max_polls):
+                    due, device = heapq.heappop(self._schedule)
+                    pending[executor.submit(self.poll, device)] = device
+                    polls += 1
+
+                timeout = max(0.0, self._schedule[0][0] - now) if self._schedule else None
+                if not pending:
+                    if timeout is None:
+                        break  # nothing scheduled and nothing running
+                    time.sleep(timeout)
+                    continue
+
+                done, not_done = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    device = pending.pop(future)
+                    try:
+                        diff = future.result()
+                        if diff is None or diff.get('added') or diff.get('removed') or diff.get('changed'):
+                            self.emit(device, diff)
+                    except:
+                        tb = self.dyagram.get_traceback()
+                        self.log.info(f"DEVICE: {device} EXCEPTION THROWN IN Watcher.poll : {tb}")
+                    self.schedule(device, self.device_interval(device))
+                    self.dyagram.device_cache.save()
+                self._schedule_new_devices()
+        except KeyboardInterrupt:
+            print("\nStopping watch")
+        finally:
+            executor.shutdown(wait=True)
+            self.dyagram.finish_collection()
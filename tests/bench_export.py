@@ -0,0 +1,112 @@
+import os
+import time
+
+from dyagram.cli.formats import EXPORTERS
+from dyagram.cli.graph import CLUSTER_METHODS, TopologyGraph
+
+
+def make_site(devices=500, neighbors_per_device=8):
+
+    """
+    Builds a synthetic site of lldp records only: device n links to the next neighbors_per_device devices, so every
+    link is reported from both ends like on a real network.
+    """
+
+    state = {"devices": []}
+    for n in range(devices):
+        neighbors = []
+        for i in range(1, neighbors_per_device // 2 + 1):
+            # Ethernet1/<2i-1> faces device n+i, Ethernet1/<2i> faces device n-i
+            for peer, local_port, neighbor_port in (((n + i) % devices, 2 * i - 1, 2 * i),
+                                                    ((n - i) % devices, 2 * i, 2 * i - 1)):
+                neighbors.append({"hostname": f"sw{peer}", "local_port": f"Ethernet1/{local_port}",
+                                  "neighbor_port": f"Ethernet1/{neighbor_port}", "chassis_id": f"5254.{peer:08x}"})
+        state["devices"].append({"hostname": f"sw{n}", "inventory_ip": f"10.0.{n >> 8}.{n & 255}",
+                                 "layer2": {"chassis_ids": [f"5254.{n:08x}"], "neighbors": neighbors}})
+    return state
+
+
+def make_fabric(pods=20, spines=4, leaves=32, super_spines=4):
+
+    """
+    Builds a multi-pod leaf/spine site: every leaf links to its pod's spines, every spine to all super spines.
+    """
+
+    hostnames, links = [], []
+    for s in range(super_spines):
+        hostnames.append(f"super-spine-{s + 1:02}")
+    for p in range(pods):
+        pod_spines = []
+        for s in range(spines):
+            hostnames.append(f"pod{p + 1}-spine-{s + 1:02}")
+            pod_spines.append(len(hostnames) - 1)
+            links += [(len(hostnames) - 1, x) for x in range(super_spines)]
+        for l in range(leaves):
+            hostnames.append(f"pod{p + 1}-leaf-{l + 1:02}")
+            links += [(len(hostnames) - 1, spine) for spine in pod_spines]
+
+    ports = [0] * len(hostnames)
+    neighbors = [[] for _ in hostnames]
+    for a, b in links:
+        ports[a] += 1
+        ports[b] += 1
+        neighbors[a].append({"hostname": hostnames[b], "local_port": f"Ethernet1/{ports[a]}",
+                             "neighbor_port": f"Ethernet1/{ports[b]}", "chassis_id": f"5254.{b:08x}"})
+        neighbors[b].append({"hostname": hostnames[a], "local_port": f"Ethernet1/{ports[b]}",
+                             "neighbor_port": f"Ethernet1/{ports[a]}", "chassis_id": f"5254.{a:08x}"})
+    return {"devices": [{"hostname": hostname, "inventory_ip": f"10.0.{n >> 8}.{n & 255}",
+                         "layer2": {"chassis_ids": [f"5254.{n:08x}"], "neighbors": neighbors[n]}}
+                        for n, hostname in enumerate(hostnames)]}
+
+
+def nested_loop_links(state):
+
+    """
+    How DiagramExport.export() used to find links, kept here to compare against.
+    """
+
+    graph_info = [{"inventory_ip": d['inventory_ip'], "chassis_ids": d['layer2']["chassis_ids"], "neighbors": []}
+                  for d in state['devices']]
+    for device in state['devices']:
+        for neighbor in device['layer2']['neighbors']:
+            for dev in state['devices']:
+                if neighbor['chassis_id'] in dev['layer2']['chassis_ids']:
+                    for i in graph_info:
+                        if i['inventory_ip'] == device['inventory_ip']:
+                            for x in graph_info:
+                                if neighbor['chassis_id'] in x['chassis_ids']:
+                                    i['neighbors'].append(x['inventory_ip'])
+    return sum(len(i['neighbors']) for i in graph_info)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+
+    print(f"{'devices':>8}{'nested':>10}{'edges':>8}{'graph':>10}{'edges':>8}")
+    for devices in (50, 100, 200, int(os.environ.get("BENCH_DEVICES", 5000))):
+        state = make_site(devices)
+        graph_time, graph = timed(lambda: TopologyGraph.from_devices(state['devices']))
+        if devices <= 200:
+            nested_time, nested_edges = timed(lambda: nested_loop_links(state))
+            nested = f"{nested_time:>9.3f}s{nested_edges:>8}"
+        else:
+            nested = f"{'-':>10}{'-':>8}"
+        print(f"{devices:>8}{nested}{graph_time:>9.3f}s{len(graph.edges):>8}")
+
+    print(f"\n{'format':<8}{'write':>10}{'size':>10}")
+    for export_format, exporter in EXPORTERS.items():
+        write_time, text = timed(lambda: exporter(graph, "bench"))
+        print(f"{export_format:<8}{write_time:>9.3f}s{len(text) / 1e6:>8.1f}MB")
+
+    fabric = TopologyGraph.from_devices(make_fabric(pods=int(os.environ.get("BENCH_PODS", 100)))['devices'])
+    print(f"\n{'cluster':<10}{'time':>10}{'clusters':>10}{'largest':>10}{'links':>8}  ({len(fabric.nodes)} devices)")
+    for method in CLUSTER_METHODS:
+        partition_time, clusters = timed(lambda: fabric.partition(method))
+        largest = max(len(ips) for ips in clusters.values())
+        print(f"{method:<10}{partition_time:>9.3f}s{len(clusters):>10}{largest:>10}"
+              f"{len(fabric.cluster_links(clusters)):>8}")
@@ -0,0 +1,143 @@
+import os
+import re
+import time
+
+from ntc_templates.parse import parse_output
+
+from dyagram.cli.parsers import LLDP_NEIGHBORS_DETAIL, PARSERS, TEXTFSM_PLATFORMS
+
+
+# the lookbehind regexes the lldp fallback used to run, one findall pass per field
+FINDALL_REGEXES = {
+    "cisco_xe": {"system_name": r"(?<=System Name:\s).*", "local_interface": r"(?<=Local Intf:\s).*",
+                 "neighbor_interface": r"(?<=Port id:\s).*", "chassis_id": r"(?<=^Chassis id:\s).*"},
+    "cisco_nxos": {"system_name": r"(?<=System Name:\s).*", "local_interface": r"(?<=Local Port id:\s).*",
+                   "neighbor_interface": r"(?<=^Port id:\s).*", "chassis_id": r"(?<=^Chassis id:\s).*"},
+    "cisco_xr": {"system_name": r"(?<=System Name:\s).*", "local_interface": r"(?<=Local Interface:\s).*",
+                 "neighbor_interface": r"(?<=^Port id:\s).*", "chassis_id": r"(?<=^Chassis id:\s).*"},
+}
+
+
+# "show lldp neighbors detail" as captured from each platform, one neighbor block; {n} is filled in per neighbor
+LLDP_DETAIL_BLOCKS = {
+    "cisco_xe": """------------------------------------------------
+Local Intf: Gi1/0/{n}
+Chassis id: 5254.0012.{n:04x}
+Port id: Gi0/{n}
+Port Description: GigabitEthernet0/{n}
+System Name: dist-sw{n:02}.example.com
+
+System Description: 
+Cisco IOS Software [Amsterdam], Catalyst L3 Switch Software (CAT9K_IOSXE), Version 17.3.4, RELEASE SOFTWARE (fc3)
+Technical Support: http://www.cisco.com/techsupport
+Copyright (c) 1986-2021 by Cisco Systems, Inc.
+Compiled Wed 30-Jun-21 16:08 by mcpre
+
+Time remaining: 103 seconds
+System Capabilities: B,R
+Enabled Capabilities: B,R
+Management Addresses:
+    IP: 10.10.{n}.11
+Auto Negotiation - not supported
+Physical media capabilities - not advertised
+Media Attachment Unit type - not advertised
+Vlan ID: - not advertised
+
+""",
+    "cisco_nxos": """Chassis id: 5254.0012.{n:04x}
+Port id: Ethernet1/{n}
+Local Port id: Eth1/{n}
+Port Description: Ethernet1/{n}
+System Name: leaf-{n:02}
+System Description: Cisco Nexus Operating System (NX-OS) Software 9.3(8)
+TAC support: http://www.cisco.com/tac
+Copyright (c) 2002-2021, Cisco Systems, Inc. All rights reserved.
+Time remaining: 112 seconds
+System Capabilities: B, R
+Enabled Capabilities: B, R
+Management Address: 10.10.{n}.21
+Management Address IPV6: not advertised
+Vlan ID: not advertised
+
+""",
+    "cisco_xr": """------------------------------------------------
+Local Interface: GigabitEthernet0/0/0/{n}
+Chassis id: 5254.0012.{n:04x}
+Port id: Gi0/0/0/{n}
+Port Description: GigabitEthernet0/0/0/{n}
+System Name: pe-{n:02}
+
+System Description: 
+Cisco IOS XR Software, Version 7.3.2[Default]
+Copyright (c) 2021 by Cisco Systems, Inc., IOSv XRv 9000
+
+Time remaining: 101 seconds
+Hold Time: 120 seconds
+System Capabilities: R
+Enabled Capabilities: R
+Management Addresses:
+  IPv4 address: 10.10.{n}.31
+
+Peer MAC Address: 52:54:00:12:34:03
+
+""",
+}
+
+LLDP_DETAIL_HEADERS = {
+    "cisco_xe": "",
+    "cisco_nxos": """Capability codes:
+  (R) Router, (B) Bridge, (T) Telephone, (C) DOCSIS Cable Device
+  (W) WLAN Access Point, (P) Repeater, (S) Station, (O) Other
+Device ID            Local Intf      Hold-time  Capability  Port ID  
+
+""",
+    "cisco_xr": """Capability codes:
+        (R) Router, (B) Bridge, (T) Telephone, (C) DOCSIS Cable Device
+        (W) WLAN Access Point, (P) Repeater, (S) Station, (O) Other
+
+""",
+}
+
+
+def lldp_detail_output(platform, neighbors):
+    blocks = "".join(LLDP_DETAIL_BLOCKS[platform].format(n=n) for n in range(1, neighbors + 1))
+    return f"{LLDP_DETAIL_HEADERS[platform]}{blocks}\nTotal entries displayed: {neighbors}\n"
+
+
+def per_call_textfsm(platform, output):
+    # what send_command(use_textfsm=True) does: template index, template file and FSM built for every output
+    return parse_output(platform=TEXTFSM_PLATFORMS.get(platform, platform), command=LLDP_NEIGHBORS_DETAIL,
+                        data=output)
+
+
+def findall_passes(platform, output):
+    # the old fallback: a findall pass per field over the whole output, neighbors lined up by index afterwards
+    columns = [[x.strip(' ') for x in re.findall(pattern, output, re.MULTILINE)]
+               for pattern in FINDALL_REGEXES[platform].values()]
+    return [dict(zip(FINDALL_REGEXES[platform], values)) for values in zip(*columns)]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+
+    neighbors = int(os.environ.get("BENCH_NEIGHBORS", 48))
+    repeat = int(os.environ.get("BENCH_REPEAT", 50))
+    print(f"{neighbors} neighbors per output, mean of {repeat} parses")
+    print(f"{'platform':<12}{'parser':<13}{'textfsm':>12}{'findall':>12}{'registry':>12}")
+    for platform in LLDP_DETAIL_BLOCKS:
+        output = lldp_detail_output(platform, neighbors)
+        parser, _ = PARSERS.parse(platform, LLDP_NEIGHBORS_DETAIL, output)
+        try:
+            per_call_textfsm(platform, output)
+            textfsm_time = f"{timed(lambda: per_call_textfsm(platform, output), repeat) * 1e3:>10.3f}ms"
+        except Exception:  # no ntc template for the platform
+            textfsm_time = f"{'-':>12}"
+        findall_time = timed(lambda: findall_passes(platform, output), repeat)
+        registry_time = timed(lambda: PARSERS.parse(platform, LLDP_NEIGHBORS_DETAIL, output), repeat)
+        print(f"{platform:<12}{parser:<13}{textfsm_time}{findall_time * 1e3:>10.3f}ms{registry_time * 1e3:>10.3f}ms")
@@ -0,0 +1,71 @@
+import random
+import time
+
+from dyagram.cli.routes import normalize_routes
+
+
+def make_route_table(size, vrfs=20, seed=1):
+
+    """
+    Builds a synthetic textfsm-style route table (cisco_nxos "show ip route vrf all" fields)
+    """
+
+    rnd = random.Random(seed)
+    routes = []
+    for n in range(size):
+        routes.append({"vrf": f"VRF{n % vrfs}",
+                       "protocol": rnd.choice(["ospf-1", "eigrp-100", "bgp-65000", "direct"]),
+                       "type": "",
+                       "network": f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}",
+                       "mask": "32",
+                       "distance": "110",
+                       "metric": str(rnd.randint(1, 5000)),
+                       "nexthop_ip": f"192.168.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}",
+                       "nexthop_if": f"Ethernet1/{rnd.randint(1, 48)}",
+                       "uptime": f"{rnd.randint(1, 50)}w{rnd.randint(0, 6)}d",
+                       "nexthop_vrf": "", "tag": "", "segid": "", "tunnelid": "", "encap": ""})
+    return routes
+
+
+def quadratic_dedup(routes_wo_vrf, routes_w_vrf):
+    # what discover_routes_ssh did before normalize_routes
+    for route in routes_w_vrf + routes_wo_vrf:
+        route.pop('uptime', None)
+    combined_routes = routes_wo_vrf + routes_w_vrf
+    return [i for n, i in enumerate(combined_routes) if i not in combined_routes[n + 1:]]
+
+
+def bench_normalize_routes(size=100000, global_share=0.1):
+
+    """
+    "show ip route vrf all" already holds the global table, so roughly global_share of the routes come back twice.
+    """
+
+    routes_w_vrf = make_route_table(size)
+    routes_wo_vrf = [dict(r) for r in routes_w_vrf[:int(size * global_share)]]
+
+    start = time.perf_counter()
+    routes = normalize_routes(routes_wo_vrf, routes_w_vrf)
+    elapsed = time.perf_counter() - start
+    print(f"normalize_routes: {size} routes + {len(routes_wo_vrf)} duplicates -> {len(routes)} routes "
+          f"in {elapsed:.3f}s")
+    return elapsed
+
+
+def bench_quadratic_dedup(size=5000, global_share=0.1):
+    routes_w_vrf = make_route_table(size)
+    routes_wo_vrf = [dict(r) for r in routes_w_vrf[:int(size * global_share)]]
+
+    start = time.perf_counter()
+    routes = quadratic_dedup(routes_wo_vrf, routes_w_vrf)
+    elapsed = time.perf_counter() - start
+    print(f"old list dedup:   {size} routes + {len(routes_wo_vrf)} duplicates -> {len(routes)} routes "
+          f"in {elapsed:.3f}s")
+    return elapsed
+
+
+if __name__ == "__main__":
+
+    bench_quadratic_dedup(5000)
+    bench_normalize_routes(5000)
+    bench_normalize_routes(100000)
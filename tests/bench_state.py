@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+
+from tests.bench_routes import make_route_table
+from dyagram.cli.codec import CODECS
+from dyagram.cli.hashing import add_hashes
+from dyagram.cli.state import StateReader, write_state
+
+
+def make_state(devices=200, routes_per_device=2000, neighbors_per_device=24):
+
+    """
+    Builds a synthetic site: every device has an nxos-style route table and a full set of lldp neighbors.
+    """
+
+    state = {"devices": []}
+    for n in range(devices):
+        neighbors = [{"hostname": f"sw{(n + i) % devices}", "local_port": f"Ethernet1/{i + 1}",
+                      "neighbor_port": f"Ethernet1/{i + 1}", "chassis_id": f"5254.00{(n + i) % devices:02x}.{i:04x}"}
+                     for i in range(neighbors_per_device)]
+        state["devices"].append({"hostname": f"sw{n}", "inventory_ip": f"10.0.{n >> 8}.{n & 255}",
+                                 "layer2": {"chassis_ids": [f"5254.00{n:02x}.0000"], "neighbors": neighbors},
+                                 "routes": make_route_table(routes_per_device, seed=n),
+                                 "dynamic_routing_neighbors": {"eigrp": [f"192.168.{n & 255}.1"]}})
+    return add_hashes(state)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_codecs(state):
+    print(f"{'codec':<8}{'dump':>10}{'load':>10}{'size':>12}")
+    for name, codec in CODECS.items():
+        dump_time, data = timed(lambda: codec.dumps(state))
+        load_time, _ = timed(lambda: codec.loads(data))
+        print(f"{name:<8}{dump_time:>9.3f}s{load_time:>9.3f}s{len(data) / 1e6:>10.1f}MB")
+
+
+def bench_state_formats(state):
+
+    """
+    What compare_states pays: the fingerprint of every device plus the records of one changed device.
+    """
+
+    print(f"\n{'format':<8}{'codec':<8}{'write':>10}{'compare':>10}")
+    for state_format in ("json", "ndjson"):
+        for name in CODECS:
+            with tempfile.TemporaryDirectory() as site:
+                write_time, _ = timed(lambda: write_state(site, state, state_format=state_format, codec=name))
+
+                def compare():
+                    with StateReader(site) as reader:
+                        reader.fingerprint()
+                        return list(reader.devices({state['devices'][0]['inventory_ip']}))
+
+                compare_time, _ = timed(compare)
+                print(f"{state_format:<8}{name:<8}{write_time:>9.3f}s{compare_time:>9.3f}s")
+
+
+if __name__ == "__main__":
+
+    state = make_state(devices=int(os.environ.get("BENCH_DEVICES", 200)))
+    bench_codecs(state)
+    bench_state_formats(state)
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# the tests import dyagram from this checkout, no install or PYTHONPATH needed. The benchmarks are run as modules
+# from the checkout instead, e.g. python -m tests.bench_routes
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
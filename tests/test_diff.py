@@ -0,0 +1,67 @@
+from dyagram.cli.diff import diff_device, get_state_diff
+from dyagram.cli.hashing import add_hashes
+
+
+def make_device(ip, hostname, neighbors=(), routes=(), eigrp=()):
+    return {"inventory_ip": ip, "hostname": hostname,
+            "layer2": {"chassis_ids": [f"chassis-{ip}"],
+                       "neighbors": [{"hostname": n, "local_port": f"Eth1/{i}", "neighbor_port": "Eth1/1",
+                                      "chassis_id": f"chassis-{n}"} for i, n in enumerate(neighbors, 1)]},
+            "routes": [{"network": network, "mask": "24", "nexthop_ip": nexthop} for network, nexthop in routes],
+            "dynamic_routing_neighbors": {"eigrp": list(eigrp)}}
+
+
+def make_site():
+    return [make_device("10.0.0.1", "core-1", neighbors=["leaf-1", "leaf-2"], routes=[("10.1.0.0", "10.0.0.2")]),
+            make_device("10.0.0.2", "leaf-1", neighbors=["core-1"], eigrp=["10.0.0.1"]),
+            make_device("10.0.0.3", "leaf-2", neighbors=["core-1"], routes=[("10.2.0.0", "10.0.0.1")])]
+
+
+def test_unchanged_state_has_no_diff():
+    assert get_state_diff({"devices": make_site()}, {"devices": make_site()}) is None
+
+
+def test_device_list_shifting_is_not_a_change():
+    current = make_site()
+    current.insert(0, make_device("10.0.0.9", "leaf-9"))
+    diffs = get_state_diff({"devices": make_site()}, {"devices": current[:1] + current[1:][::-1]})
+    assert diffs == {"10.0.0.9": {"added": ["Device leaf-9"], "removed": [], "changed": []}}
+
+
+def test_changes_are_attributed_to_the_right_devices():
+    previous = make_site()
+    current = make_site()
+    current.pop(0)  # core-1 gone, leaf-1 and leaf-2 now first in the list
+    current[0]['layer2']['neighbors'].append({"hostname": "leaf-2", "local_port": "Eth1/9", "neighbor_port": "Eth1/9",
+                                              "chassis_id": "chassis-leaf-2"})
+    current[0]['dynamic_routing_neighbors']['eigrp'] = []
+    current[1]['routes'][0]['nexthop_ip'] = "10.0.0.2"
+
+    diffs = get_state_diff({"devices": previous}, {"devices": current})
+
+    assert diffs["10.0.0.1"] == {"added": [], "removed": ["Device core-1"], "changed": []}
+    assert diffs["10.0.0.2"] == {"added": ["LLDP Neighbor leaf-2 (Chassis ID: chassis-leaf-2)"],
+                                 "removed": ["EIGRP Neighbor 10.0.0.1"], "changed": []}
+    assert diffs["10.0.0.3"] == {"added": ["Route 10.2.0.0/24 10.0.0.2"], "removed": ["Route 10.2.0.0/24 10.0.0.1"],
+                                 "changed": []}
+
+
+def test_section_hashes_skip_unchanged_sections():
+    previous = add_hashes({"devices": make_site()})
+    current = add_hashes({"devices": make_site()})
+    current['devices'][2]['routes'] = []
+    add_hashes(current)
+    assert get_state_diff(previous, current) == {"10.0.0.3": {"added": [], "removed": ["Route 10.2.0.0/24 10.0.0.1"],
+                                                              "changed": []}}
+
+
+def test_route_uptime_is_not_a_change():
+    previous, current = make_site()[0], make_site()[0]
+    previous['routes'][0]['uptime'] = "1d02h"
+    assert diff_device(previous, current) == {"added": [], "removed": [], "changed": []}
+
+
+def test_hostname_change():
+    current = make_site()[1]
+    current['hostname'] = "leaf-1-new"
+    assert diff_device(make_site()[1], current)['changed'] == ["Hostname: NEW VALUE: leaf-1-new, OLD VALUE: leaf-1"]
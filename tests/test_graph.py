@@ -0,0 +1,46 @@
+from dyagram.cli.graph import TopologyGraph, canonical_port
+
+
+def make_device(ip, hostname, neighbors):
+    return {"inventory_ip": ip, "hostname": hostname,
+            "layer2": {"chassis_ids": [f"chassis-{hostname}"],
+                       "neighbors": [{"hostname": peer, "local_port": local, "neighbor_port": remote,
+                                      "chassis_id": f"chassis-{peer}"} for peer, local, remote in neighbors]}}
+
+
+def test_canonical_port():
+    assert canonical_port("Eth1/1") == canonical_port("Ethernet1/1") == "ethernet1/1"
+    assert canonical_port("Gi1/0/1") == canonical_port("GigabitEthernet1/0/1")
+    assert canonical_port("Te1/1/1") == canonical_port("TenGigabitEthernet1/1/1")
+    assert canonical_port("Po10") == canonical_port("port-channel10")
+    assert canonical_port("uplink to core") == "uplink to core"
+
+
+def test_link_reported_from_both_ends_with_mixed_spellings():
+    # nx-os names its own ports Eth1/x and its neighbors' ports Ethernet1/x
+    graph = TopologyGraph.from_devices([make_device("10.0.0.1", "leaf-1", [("leaf-2", "Eth1/1", "Ethernet1/2")]),
+                                        make_device("10.0.0.2", "leaf-2", [("leaf-1", "Eth1/2", "Ethernet1/1")])])
+    assert graph.edge_pairs() == [("10.0.0.1", "10.0.0.2")]
+    assert graph.edge_ports("10.0.0.1", "10.0.0.2") == [("Eth1/1", "Eth1/2")]
+    assert graph.edge_ports("10.0.0.2", "10.0.0.1") == [("Eth1/2", "Eth1/1")]
+
+
+def test_link_matched_when_one_end_reports_a_port_description():
+    # ios reports the neighbor's port description, nx-os the port id
+    graph = TopologyGraph.from_devices([make_device("10.0.0.1", "access-1", [("core-1", "Gi1/0/1", "to access-1")]),
+                                        make_device("10.0.0.2", "core-1",
+                                                    [("access-1", "Eth1/5", "GigabitEthernet1/0/1")])])
+    assert graph.edge_ports("10.0.0.1", "10.0.0.2") == [("Gi1/0/1", "Eth1/5")]
+
+
+def test_parallel_links_stay_apart():
+    graph = TopologyGraph.from_devices([
+        make_device("10.0.0.1", "leaf-1", [("leaf-2", "Eth1/1", "Ethernet1/1"), ("leaf-2", "Eth1/2", "Ethernet1/2")]),
+        make_device("10.0.0.2", "leaf-2", [("leaf-1", "Eth1/1", "Ethernet1/1"), ("leaf-1", "Eth1/2", "Ethernet1/2")])])
+    assert graph.edge_ports("10.0.0.1", "10.0.0.2") == [("Eth1/1", "Eth1/1"), ("Eth1/2", "Eth1/2")]
+
+
+def test_link_reported_from_one_end():
+    graph = TopologyGraph.from_devices([make_device("10.0.0.1", "leaf-1", [("leaf-2", "Eth1/1", "Ethernet1/2")]),
+                                        make_device("10.0.0.2", "leaf-2", [])])
+    assert graph.edge_ports("10.0.0.2", "10.0.0.1") == [("Ethernet1/2", "Eth1/1")]
@@ -0,0 +1,40 @@
+from dyagram.cli.hashing import SECTIONS, add_hashes, device_hashes, section_hash, state_fingerprint
+
+
+def make_device(routes):
+    return {"inventory_ip": "10.0.0.1", "hostname": "core-1", "layer2": {"chassis_ids": [], "neighbors": []},
+            "routes": routes, "dynamic_routing_neighbors": {"eigrp": ["10.0.0.2"]}}
+
+
+ROUTES = [{"network": "10.1.0.0", "mask": "24", "nexthop_ip": "10.0.0.2"},
+          {"network": "10.1.0.0", "mask": "24", "nexthop_ip": "10.0.0.3"}]
+
+
+def test_section_hash_ignores_list_and_key_order():
+    reordered = [{"nexthop_ip": r['nexthop_ip'], "mask": r['mask'], "network": r['network']} for r in ROUTES[::-1]]
+    assert section_hash(ROUTES) == section_hash(reordered)
+
+
+def test_section_hash_changes_with_content():
+    assert section_hash(ROUTES) != section_hash(ROUTES[:1])
+
+
+def test_device_hashes_cover_every_section():
+    assert set(device_hashes(make_device(ROUTES))) == set(SECTIONS)
+
+
+def test_volatile_route_fields_are_not_hashed():
+    with_uptime = [dict(route, uptime="3w2d") for route in ROUTES]
+    assert device_hashes(make_device(with_uptime)) == device_hashes(make_device(ROUTES))
+
+
+def test_saved_hashes_are_used():
+    state = add_hashes({"devices": [make_device(ROUTES)]})
+    device = state['devices'][0]
+    device['routes'] = []  # hashes saved with the record win over its content
+    assert device_hashes(device)['routes'] == section_hash(ROUTES)
+
+
+def test_state_fingerprint():
+    device = make_device(ROUTES)
+    assert state_fingerprint({"devices": [device]}) == {"10.0.0.1": ("core-1", device_hashes(device))}
@@ -0,0 +1,61 @@
+import re
+
+import pytest
+
+from bench_parsers import LLDP_DETAIL_BLOCKS, lldp_detail_output
+from dyagram.cli.parsers import LLDP_NEIGHBORS_DETAIL, PARSERS
+
+NEIGHBORS = 5
+
+
+def parse(platform, output):
+    return PARSERS.parse(platform, LLDP_NEIGHBORS_DETAIL, output)[1]
+
+
+def drop_first(label, output):
+    # removes the first neighbor's "<label>: ..." line
+    return re.sub(rf'^{re.escape(label)}: .*\n', '', output, count=1, flags=re.MULTILINE)
+
+
+@pytest.mark.parametrize("platform", LLDP_DETAIL_BLOCKS)
+def test_every_neighbor_is_parsed(platform):
+    records = parse(platform, lldp_detail_output(platform, NEIGHBORS))
+    assert len(records) == NEIGHBORS
+    assert records[-1]['hostname'].startswith(("dist-sw", "leaf-", "pe-"))
+    assert records[-1]['mgmt_address'].startswith(f"10.10.{NEIGHBORS}.")
+    assert len({r['chassis_id'] for r in records}) == NEIGHBORS
+
+
+def test_no_neighbors():
+    assert parse("cisco_nxos", "\nTotal entries displayed: 0\n") == []
+
+
+@pytest.mark.parametrize("platform", LLDP_DETAIL_BLOCKS)
+@pytest.mark.parametrize("label, field", [("System Name", "hostname"), ("Chassis id", "chassis_id"),
+                                          ("Port id", None)])
+def test_missing_field_does_not_shift_later_neighbors(platform, label, field):
+    output = lldp_detail_output(platform, NEIGHBORS)
+    records = parse(platform, output)
+    missing = parse(platform, drop_first(label, output))
+    assert missing[1:] == records[1:]
+    assert missing[0]['hostname'] == ("" if field == "hostname" else records[0]['hostname'])
+    assert missing[0]['chassis_id'] == ("" if field == "chassis_id" else records[0]['chassis_id'])
+
+
+def test_nxos_blocks_without_separators():
+    output = lldp_detail_output("cisco_nxos", NEIGHBORS)
+    assert "-" * 10 not in output
+    # the first neighbor's port id is also its first line once the chassis id is gone
+    records = parse("cisco_nxos", drop_first("Chassis id", output))
+    assert [r['hostname'] for r in records] == [f"leaf-{n:02}" for n in range(1, NEIGHBORS + 1)]
+    assert [r['chassis_id'] for r in records] == [""] + [f"5254.0012.{n:04x}" for n in range(2, NEIGHBORS + 1)]
+
+
+@pytest.mark.parametrize("platform", [p for p in LLDP_DETAIL_BLOCKS
+                                      if any(parser.name == "textfsm"
+                                             for parser in PARSERS.parsers(p, LLDP_NEIGHBORS_DETAIL))])
+def test_neighbor_port_matches_textfsm(platform):
+    # any other neighbor_port than the TextFSM template gives shows every neighbor on record as changed
+    output = lldp_detail_output(platform, NEIGHBORS)
+    textfsm = [parser for parser in PARSERS.parsers(platform, LLDP_NEIGHBORS_DETAIL) if parser.name == "textfsm"][0]
+    assert [r['neighbor_port'] for r in textfsm(output)] == [r['neighbor_port'] for r in parse(platform, output)]
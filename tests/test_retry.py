@@ -0,0 +1,68 @@
+import pytest
+
+from dyagram.cli.retry import Deadline, DeviceUnreachable, RetryPolicy
+
+
+class AuthError(Exception):
+    pass
+
+
+def failing(times, result="ok", error=OSError):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= times:
+            raise error("connection refused")
+        return result
+    return fn, calls
+
+
+def test_returns_after_failures():
+    fn, calls = failing(2)
+    retried = []
+    policy = RetryPolicy(attempts=5, base_delay=0, jitter=0)
+    assert policy.call(fn, on_retry=lambda attempt, error: retried.append(attempt)) == "ok"
+    assert len(calls) == 3 and retried == [0, 1]
+
+
+def test_gives_up_after_attempts():
+    fn, calls = failing(10)
+    with pytest.raises(DeviceUnreachable):
+        RetryPolicy(attempts=3, base_delay=0, jitter=0).call(fn)
+    assert len(calls) == 3
+
+
+def test_give_up_on_is_not_retried():
+    fn, calls = failing(10, error=AuthError)
+    with pytest.raises(AuthError):
+        RetryPolicy(attempts=5, base_delay=0).call(fn, give_up_on=(AuthError,))
+    assert len(calls) == 1
+
+
+def test_stops_when_cancelled():
+    fn, calls = failing(10)
+    with pytest.raises(DeviceUnreachable):
+        RetryPolicy(attempts=5, base_delay=0).call(fn, cancelled=lambda: len(calls) == 2)
+    assert len(calls) == 2
+
+
+def test_stops_before_backoff_outlasts_deadline():
+    fn, calls = failing(10)
+    with pytest.raises(DeviceUnreachable):
+        RetryPolicy(attempts=5, base_delay=60, jitter=0).call(fn, deadline=Deadline(1))
+    assert len(calls) == 1
+
+
+def test_delay_is_capped_and_jittered():
+    policy = RetryPolicy(base_delay=1, factor=2, max_delay=16, jitter=0.5)
+    assert [RetryPolicy(jitter=0).delay(attempt) for attempt in range(6)] == [1, 2, 4, 8, 16, 16]
+    assert all(8 <= policy.delay(10) <= 24 for _ in range(100))
+
+
+def test_deadline_is_cut_short_by_parent():
+    parent = Deadline(1)
+    assert Deadline(60, parent=parent).remaining() <= 1
+    assert Deadline(parent=parent).expires == parent.expires
+    assert Deadline().remaining() is None and not Deadline().expired()
+    assert Deadline(0).expired()
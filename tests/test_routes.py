@@ -0,0 +1,108 @@
+from dyagram.cli.routes import collect_routes, normalize_routes, routes_from_ietf, stream_parse_routes
+
+GLOBAL_TABLE = """Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP
+       D - EIGRP, EX - EIGRP external, O - OSPF, IA - OSPF inter area
+
+Gateway of last resort is 10.0.0.1 to network 0.0.0.0
+
+S*    0.0.0.0/0 [1/0] via 10.0.0.1
+      10.0.0.0/8 is variably subnetted, 2 subnets, 2 masks
+C        10.0.0.0/24 is directly connected, GigabitEthernet0/0
+O IA     10.20.0.0/16 [110/2] via 10.0.0.1, 00:01:02, GigabitEthernet0/0
+"""
+
+VRF_TABLES = """
+Routing Table: MGMT
+Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP
+
+Gateway of last resort is not set
+
+      10.0.0.0/8 is variably subnetted, 1 subnets, 1 masks
+C        10.0.0.0/24 is directly connected, GigabitEthernet0/1
+
+Routing Table: CUST
+Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP
+
+Gateway of last resort is not set
+
+O E2     172.16.0.0/16 [110/20] via 172.31.0.1, 1d02h, GigabitEthernet0/2
+"""
+
+
+NXOS_TABLES = """IP Route Table for VRF "default"
+'*' denotes best ucast next-hop
+
+10.1.0.0/24, ubest/mbest: 1/0
+    *via 10.0.0.2, Eth1/1, [110/41], 3w2d, ospf-1, intra
+IP Route Table for VRF "MGMT"
+'*' denotes best ucast next-hop
+
+10.9.0.0/24, ubest/mbest: 1/0, attached
+    *via 10.9.0.5, mgmt0, [0/0], 3w2d, direct
+"""
+
+
+class FakeSession:
+
+    device_type = "cisco_xe"
+
+    def send_command(self, command, **kwargs):
+        return VRF_TABLES if "vrf" in command else GLOBAL_TABLE
+
+
+def test_ios_vrf_routes_are_collected_and_tagged():
+    routes = collect_routes(FakeSession())
+    assert [(r.get('vrf'), r['network'], r['type']) for r in routes] == [
+        (None, "0.0.0.0", ""), (None, "10.0.0.0", ""), (None, "10.20.0.0", "IA"),
+        ("MGMT", "10.0.0.0", ""), ("CUST", "172.16.0.0", "E2")]
+
+
+def test_restconf_routes_match_ssh_routes():
+    data = {"ietf-routing:routing-instance": [
+        {"name": "default", "ribs": {"rib": [{"address-family": "ietf-routing:ipv4", "routes": {"route": [
+            {"destination-prefix": "10.20.0.0/16", "source-protocol": "ietf-ospf:ospfv2", "route-preference": 110,
+             "metric": 2, "ietf-ospf:route-type": "inter-area",
+             "next-hop": {"next-hop-address": "10.0.0.1", "outgoing-interface": "GigabitEthernet0/0"}}]}}]}},
+        {"name": "CUST", "ribs": {"rib": [{"address-family": "ietf-routing:ipv4", "routes": {"route": [
+            {"destination-prefix": "172.16.0.0/16", "source-protocol": "ietf-ospf:ospfv2", "route-preference": 110,
+             "metric": 20, "ietf-ospf:route-type": "external-2",
+             "next-hop": {"next-hop-address": "172.31.0.1", "outgoing-interface": "GigabitEthernet0/2"}}]}}]}}]}
+    ssh = [r for r in collect_routes(FakeSession()) if r['network'] in ("10.20.0.0", "172.16.0.0")]
+    assert normalize_routes(routes_from_ietf(data)) == ssh
+
+
+class FakeChannel:
+
+    device_type = "cisco_nxos"
+    base_prompt = "leaf-1"
+
+    def __init__(self, output, chunk_size=40):
+        self.output = output
+        self.chunk_size = chunk_size
+        self.chunks = []
+
+    def clear_buffer(self):
+        pass
+
+    def normalize_cmd(self, command):
+        return command + "\n"
+
+    def write_channel(self, command):
+        text = f"{command}{self.output}{self.base_prompt}# "
+        self.chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def read_channel(self):
+        return self.chunks.pop(0) if self.chunks else ""
+
+
+def test_stream_parse_routes_per_vrf():
+    routes = list(stream_parse_routes(FakeChannel(NXOS_TABLES), "show ip route vrf all"))
+    assert [(r['vrf'], r['network'], r['protocol']) for r in routes] == [("default", "10.1.0.0", "ospf-1"),
+                                                                          ("MGMT", "10.9.0.0", "direct")]
+
+
+def test_stream_parse_routes_without_section_markers():
+    output = NXOS_TABLES.replace('IP Route Table for VRF "MGMT"\n', '').replace('IP Route Table for VRF "default"', '')
+    routes = list(stream_parse_routes(FakeChannel(output), "show ip route vrf all"))
+    assert [r['network'] for r in routes] == ["10.1.0.0", "10.9.0.0"]
+    assert list(stream_parse_routes(FakeChannel(""), "show ip route vrf all")) == []
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from dyagram.cli.codec import CODECS
+from dyagram.cli.hashing import add_hashes, state_fingerprint
+from dyagram.cli.state import STATE_INDEX, STATE_JSON, STATE_NDJSON, StateReader, migrate_state, write_state
+
+
+def make_state(devices=5):
+    return add_hashes({"devices": [
+        {"inventory_ip": f"10.0.0.{n}", "hostname": f"sw-{n}",
+         "layer2": {"chassis_ids": [f"5254.0000.{n:04x}"], "neighbors": []},
+         "routes": [{"network": f"10.{n}.0.0", "mask": "16", "nexthop_ip": "10.0.0.1"}],
+         "dynamic_routing_neighbors": {"eigrp": []}} for n in range(1, devices + 1)]})
+
+
+def test_ndjson_round_trip(tmp_path):
+    state = make_state()
+    for codec in CODECS:
+        write_state(str(tmp_path), state, codec=codec)
+        with StateReader(str(tmp_path)) as reader:
+            assert reader.format == "ndjson"
+            assert reader.load() == state
+            assert reader.fingerprint() == state_fingerprint(state)
+            assert reader.device("10.0.0.3") == state['devices'][2]
+            assert reader.device("10.9.9.9") is None
+            assert list(reader.devices({"10.0.0.4", "10.0.0.2"})) == [state['devices'][1], state['devices'][3]]
+
+
+def test_legacy_round_trip(tmp_path):
+    state = make_state()
+    write_state(str(tmp_path), state, state_format="json")
+    with StateReader(str(tmp_path)) as reader:
+        assert reader.format == "json"
+        assert reader.load() == state
+        assert reader.fingerprint() == state_fingerprint(state)
+
+
+def test_migrate_legacy_to_ndjson(tmp_path):
+    state = make_state()
+    write_state(str(tmp_path), state, state_format="json")
+    assert migrate_state(str(tmp_path)) == "json"
+    assert not (tmp_path / STATE_JSON).exists()
+    assert (tmp_path / STATE_NDJSON).is_file() and (tmp_path / STATE_INDEX).is_file()
+    with StateReader(str(tmp_path)) as reader:
+        assert reader.load() == state
+
+
+def test_migrate_without_state(tmp_path):
+    assert migrate_state(str(tmp_path)) is None
+    assert not list(Path(tmp_path).iterdir())